@@ -67,6 +67,10 @@ def create_app(config_name=None):
         app.register_blueprint(settings_bp, url_prefix='/api/settings')
         app.register_blueprint(document_bp, url_prefix='/api/documents')
         logger.info("Blueprints registrados com sucesso.")
+        
+        # Encerramento de atividades/quizzes no prazo (thread iniciada na primeira requisição)
+        from app.services.expiry_scheduler import ensure_expiry_scheduler
+        app.before_request(ensure_expiry_scheduler)
     except Exception as e:
         logger.error(f"Erro ao registrar blueprints: {e}")
     
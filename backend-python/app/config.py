@@ -35,7 +35,7 @@ class ProductionConfig(Config):
 class TestConfig(Config):
     """Configuração de testes"""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///test.sqlite'
+    SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL') or 'sqlite:///test.sqlite'
 
 
 # Dicionário de configurações
@@ -14,6 +14,8 @@ from app.models.chat import ChatMessage
 from app.models.activity_submission import ActivitySubmission
 from app.models.transcription_session import (
     TranscriptionSession,
+    TranscriptSegment,
+    TranscriptSearchWindow,
     TranscriptionCheckpoint,
     LiveActivity,
     LiveActivityResponse
@@ -34,6 +36,8 @@ __all__ = [
     'ChatMessage',
     'ActivitySubmission',
     'TranscriptionSession',
+    'TranscriptSegment',
+    'TranscriptSearchWindow',
     'TranscriptionCheckpoint',
     'LiveActivity',
     'LiveActivityResponse',
@@ -0,0 +1,19 @@
+from app import db
+from datetime import datetime
+
+
+class AIJob(db.Model):
+    """Job assíncrono de IA (estado compartilhado entre processos, ver app.services.job_service)"""
+    __tablename__ = 'ai_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    kind = db.Column(db.String(50), nullable=False)
+    owner_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, error
+    result = db.Column(db.JSON, nullable=True)
+    status_code = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Incrementado a cada mudança
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
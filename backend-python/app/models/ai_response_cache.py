@@ -0,0 +1,24 @@
+from app import db
+from app.utils.compression import CompressedText
+from datetime import datetime
+
+
+class AIResponseCache(db.Model):
+    """Respostas da IA em cache, endereçadas pelo hash da requisição (ver app.services.ai_cache)"""
+    __tablename__ = 'ai_response_cache'
+
+    key = db.Column(db.String(64), primary_key=True)  # sha256 de (função, modelo, prompt, parâmetros)
+    function = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(50))
+    response = db.Column(CompressedText, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Despejo (LRU)
+
+    def to_dict(self):
+        return {
+            'key': self.key,
+            'function': self.function,
+            'model': self.model,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
+        }
@@ -1,4 +1,5 @@
 from app import db
+from sqlalchemy import func
 from datetime import datetime
 import secrets
 import string
@@ -11,6 +12,7 @@ class PresentationSession(db.Model):
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     status = db.Column(db.String(20), default='active')  # active/ended
     current_content = db.Column(db.JSON, nullable=True)  # Conteúdo atual exibido
+    version = db.Column(db.Integer, default=0)  # Incrementada a cada mudança de conteúdo/status (ETag do polling)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relacionamentos
@@ -35,7 +37,19 @@ class PresentationSession(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
         }
     
+    @staticmethod
+    def bump_version(session_id):
+        """
+        Marca que o conteúdo/status mudou (invalida a ETag de /<code>/status).
+        UPDATE atômico (vale entre processos); gravado no commit de quem chama.
+        """
+        PresentationSession.query.filter_by(id=session_id).update(
+            {PresentationSession.version: func.coalesce(PresentationSession.version, 0) + 1},
+            synchronize_session=False
+        )
+    
     def end_session(self):
         """Encerra a sessão (marca como ended)"""
         self.status = 'ended'
+        PresentationSession.bump_version(self.id)
         db.session.commit()
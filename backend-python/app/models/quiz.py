@@ -2,6 +2,8 @@
 Modelos para o sistema de Quiz ao Vivo
 """
 from app import db
+from sqlalchemy import func
+from app.services.answer_keys import get_quiz_answer_key
 from datetime import datetime, timedelta
 
 
@@ -22,6 +24,7 @@ class Quiz(db.Model):
     ends_at = db.Column(db.DateTime)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    response_version = db.Column(db.Integer, default=0)  # Incrementada a cada resposta (ETag do live-ranking)
     
     # Relationships
     questions = db.relationship('QuizQuestion', backref='quiz', lazy=True, cascade='all, delete-orphan')
@@ -36,6 +39,17 @@ class Quiz(db.Model):
         self.ends_at = self.starts_at + timedelta(seconds=self.time_limit)
         db.session.commit()
     
+    @staticmethod
+    def bump_response_version(quiz_id):
+        """
+        Marca que as respostas do quiz mudaram (invalida a ETag do live-ranking).
+        UPDATE atômico (vale entre processos); gravado no commit de quem chama.
+        """
+        Quiz.query.filter_by(id=quiz_id).update(
+            {Quiz.response_version: func.coalesce(Quiz.response_version, 0) + 1},
+            synchronize_session=False
+        )
+    
     def end_quiz(self):
         """Encerra o quiz"""
         self.status = 'ended'
@@ -43,13 +57,13 @@ class Quiz(db.Model):
     
     @property
     def is_active(self):
-        """Verifica se o quiz está ativo"""
+        """
+        Verifica se o quiz está ativo (leitura pura)
+        O encerramento no prazo é gravado pelo expiry_scheduler, não aqui.
+        """
         if self.status != 'active':
             return False
-        if self.ends_at and datetime.utcnow() > self.ends_at:
-            self.end_quiz()
-            return False
-        return True
+        return not (self.ends_at and datetime.utcnow() > self.ends_at)
     
     @property
     def time_remaining(self):
@@ -122,18 +136,20 @@ class QuizResponse(db.Model):
     student = db.relationship('User', backref='quiz_responses', lazy=True)
     
     def calculate_score(self):
-        """Calcula a pontuação baseada nas respostas + bônus de tempo"""
+        """
+        Calcula a pontuação baseada nas respostas + bônus de tempo
+        (usa o gabarito compilado do quiz; o commit fica a cargo de quem chama)
+        """
         quiz = Quiz.query.get(self.quiz_id)
         if not quiz:
             return
         
-        correct_count = 0
-        total_questions = len(quiz.questions)
-        
-        for question in quiz.questions:
-            student_answer = self.answers.get(str(question.id))
-            if student_answer is not None and student_answer == question.correct:
-                correct_count += 1
+        # Só id e resposta correta: o gabarito em cache é escolhido pelo hash deles
+        questions = db.session.query(QuizQuestion.id, QuizQuestion.correct)\
+            .filter(QuizQuestion.quiz_id == quiz.id).order_by(QuizQuestion.id).all()
+        answer_key = get_quiz_answer_key(quiz.id, questions)
+        correct_count = answer_key.score(self.answers)
+        total_questions = answer_key.total
         
         self.score = correct_count
         self.total = total_questions
@@ -157,7 +173,6 @@ class QuizResponse(db.Model):
                 time_bonus = int(speed_ratio * 50 * correct_count)  # Até 50 pontos por acerto
         
         self.points = base_points + time_bonus
-        db.session.commit()
     
     def to_dict(self):
         return {
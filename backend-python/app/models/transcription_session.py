@@ -2,7 +2,13 @@
 Modelos para o sistema de Transcrição ao Vivo com Atividades
 """
 from app import db
+from app.utils.compression import CompressedText
+from app.services.answer_keys import get_activity_answer_key
+from app.services import search_service
+from sqlalchemy import func
+from sqlalchemy.orm.attributes import flag_modified
 from datetime import datetime, timedelta
+import zlib
 
 
 class TranscriptionSession(db.Model):
@@ -13,7 +19,15 @@ class TranscriptionSession(db.Model):
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(200), default='Transcrição de Aula')
-    full_transcript = db.Column(db.Text, default='')  # Transcrição completa
+    # Texto materializado a partir dos segmentos (use a propriedade full_transcript)
+    # Comprimido no banco. Durante a aula o texto fica nos segmentos (texto puro) e a coluna só é
+    # gravada numa reescrita (edição manual); no end() ela recebe o texto inteiro e os segmentos são apagados
+    _full_transcript = db.Column('full_transcript', CompressedText, default='')
+    transcript_length = db.Column(db.Integer, default=0)  # Total de caracteres (próximo offset)
+    segment_count = db.Column(db.Integer, default=0)  # Último seq gravado
+    word_count = db.Column(db.Integer, default=0)  # Contador incremental de palavras
+    # crc32 acumulado do texto: o auto-save confere o prefixo enviado sem reler os segmentos
+    transcript_crc = db.Column(db.BigInteger, nullable=True, default=0)
     
     # Status: active, paused, ended
     status = db.Column(db.String(20), default='active')
@@ -28,6 +42,8 @@ class TranscriptionSession(db.Model):
     teacher = db.relationship('User', backref=db.backref('transcription_sessions', lazy=True))
     checkpoints = db.relationship('TranscriptionCheckpoint', backref='session', lazy=True, cascade='all, delete-orphan')
     activities = db.relationship('LiveActivity', backref='session', lazy=True, cascade='all, delete-orphan')
+    segments = db.relationship('TranscriptSegment', backref='session', lazy='dynamic', cascade='all, delete-orphan')
+    search_windows = db.relationship('TranscriptSearchWindow', lazy='dynamic', cascade='all, delete-orphan')
     
     def pause(self):
         """Pausa a sessão e cria um checkpoint"""
@@ -40,32 +56,233 @@ class TranscriptionSession(db.Model):
         db.session.commit()
     
     def end(self):
-        """Encerra a sessão"""
+        """Encerra a sessão (a transcrição e os snapshots passam a ser gravados comprimidos, sem os segmentos)"""
+        self.materialize()
+        self.compress_at_rest()
+        self.compact_segments()
         self.status = 'ended'
         self.ended_at = datetime.utcnow()
         db.session.commit()
     
     @property
-    def word_count(self):
-        """Conta palavras na transcrição"""
-        if not self.full_transcript:
-            return 0
-        return len(self.full_transcript.split())
+    def full_transcript(self):
+        """
+        Transcrição completa, materializada sob demanda a partir dos segmentos.
+        O texto já materializado é reaproveitado e só os segmentos posteriores são lidos.
+        """
+        materialized = self._full_transcript or ''
+        if not self.segment_count or len(materialized) >= (self.transcript_length or 0):
+            return materialized
+        
+        cached = getattr(self, '_transcript_cache', None)
+        if cached is not None and len(cached) == self.transcript_length:
+            return cached
+        
+        tail = TranscriptSegment.query.filter(
+            TranscriptSegment.session_id == self.id,
+            TranscriptSegment.start_offset >= len(materialized)
+        ).order_by(TranscriptSegment.seq).all()
+        
+        text = materialized + ''.join(segment.text for segment in tail)
+        self._transcript_cache = text
+        return text
     
-    def to_dict(self, include_checkpoints=False, include_activities=False):
-        data = {
+    def _seed_legacy_transcript(self):
+        """Converte o texto de sessões antigas (sem segmentos) no primeiro segmento"""
+        if self.segment_count or not self._full_transcript:
+            return
+        db.session.add(TranscriptSegment(
+            session_id=self.id,
+            seq=1,
+            start_offset=0,
+            text=self._full_transcript
+        ))
+        self.segment_count = 1
+        self.transcript_length = len(self._full_transcript)
+        self.word_count = len(self._full_transcript.split())
+    
+    def append_text(self, text):
+        """Anexa um trecho ao final da transcrição sem reescrever o texto anterior"""
+        if not text:
+            return None
+        
+        self._seed_legacy_transcript()
+        checksum = self._transcript_checksum()
+        
+        # Uma palavra partida entre dois trechos não deve ser contada duas vezes
+        joins_previous = not text[0].isspace() and self._ends_inside_word()
+        added_words = len(text.split())
+        if joins_previous and added_words:
+            added_words -= 1
+        
+        previous_length = self.transcript_length or 0
+        search_service.index_appended_text(self, previous_length, text)
+        segment = TranscriptSegment(
+            session_id=self.id,
+            seq=(self.segment_count or 0) + 1,
+            start_offset=previous_length,
+            text=text
+        )
+        db.session.add(segment)
+        
+        self.segment_count = segment.seq
+        self.transcript_length = previous_length + len(text)
+        self.word_count = (self.word_count or 0) + added_words
+        self.transcript_crc = zlib.crc32(text.encode('utf-8'), checksum)
+        self.updated_at = datetime.utcnow()
+        
+        cached = getattr(self, '_transcript_cache', None)
+        if cached is not None and len(cached) == previous_length:
+            self._transcript_cache = cached + text
+        return segment
+    
+    def _ends_inside_word(self):
+        """Indica se a transcrição atual termina sem espaço (palavra possivelmente incompleta)"""
+        if not self.transcript_length:
+            return False
+        cached = getattr(self, '_transcript_cache', None)
+        if cached is not None and len(cached) == self.transcript_length:
+            last_text = cached
+        else:
+            last_segment = TranscriptSegment.query.filter_by(
+                session_id=self.id,
+                seq=self.segment_count
+            ).first()
+            # Sem o segmento (compactado no end()): o fim está no texto materializado
+            last_text = last_segment.text if last_segment else (self._full_transcript or '')
+        return bool(last_text) and not last_text[-1].isspace()
+    
+    def replace_transcript(self, text):
+        """
+        Reescreve a transcrição inteira (edição manual do professor).
+        O seq continua crescendo; o novo segmento recomeça no offset 0. O segmento é gravado mesmo
+        com texto vazio: é ele que avisa os espectadores (evento reset) para descartar o texto.
+        """
+        text = text or ''
+        
+        # Checkpoints por offset deixariam de apontar para o texto original
+        previous = self.full_transcript
+        for checkpoint in self.checkpoints:
+            if checkpoint.freeze(previous):
+                search_service.index_checkpoint_snapshot(checkpoint)
+        
+        TranscriptSegment.query.filter_by(session_id=self.id).delete()
+        
+        seq = (self.segment_count or 0) + 1
+        db.session.add(TranscriptSegment(
+            session_id=self.id,
+            seq=seq,
+            start_offset=0,
+            text=text
+        ))
+        
+        self._full_transcript = text
+        self._transcript_cache = text
+        self.segment_count = seq
+        self.transcript_length = len(text)
+        self.word_count = len(text.split())
+        self.transcript_crc = zlib.crc32(text.encode('utf-8'))
+        self.updated_at = datetime.utcnow()
+        search_service.index_session_text(self.id, text)
+    
+    def _transcript_checksum(self):
+        """crc32 da transcrição atual (sessões antigas: calculado uma vez, depois é incremental)"""
+        if self.transcript_crc is None:
+            self.transcript_crc = zlib.crc32(self.full_transcript.encode('utf-8'))
+        return self.transcript_crc
+    
+    def save_transcript(self, text):
+        """
+        Grava a transcrição completa enviada pelo cliente (auto-save via PUT).
+        Se o texto novo apenas estende o atual, só o sufixo vira um segmento. O prefixo é
+        conferido pelo tamanho e pelo crc32 acumulado, sem materializar a transcrição.
+        """
+        text = text or ''
+        length = (self.transcript_length or 0) if self.segment_count else len(self._full_transcript or '')
+        if len(text) >= length and zlib.crc32(text[:length].encode('utf-8')) == self._transcript_checksum():
+            return self.append_text(text[length:])
+        self.replace_transcript(text)
+        return None
+    
+    def materialize(self):
+        """Persiste o texto completo na coluna full_transcript"""
+        if self.segment_count and len(self._full_transcript or '') != (self.transcript_length or 0):
+            self._full_transcript = self.full_transcript
+    
+    def compact_segments(self):
+        """Apaga os segmentos já materializados em full_transcript (o texto não fica gravado duas vezes)"""
+        if not self.segment_count or len(self._full_transcript or '') < (self.transcript_length or 0):
+            return
+        TranscriptSegment.query.filter_by(session_id=self.id).delete(synchronize_session=False)
+    
+    def compress_at_rest(self):
+        """Regrava o texto materializado e os snapshots antigos (a coluna comprime ao gravar)"""
+        if self._full_transcript:
+            flag_modified(self, '_full_transcript')
+        for checkpoint in self.checkpoints:
+            if checkpoint._transcript_snapshot:
+                flag_modified(checkpoint, '_transcript_snapshot')
+    
+    def transcript_range(self, start=0, end=None):
+        """Retorna o trecho [start, end) da transcrição lendo apenas os segmentos necessários"""
+        length = self.transcript_length or 0
+        if not self.segment_count:
+            length = len(self._full_transcript or '')
+        end = length if end is None else max(0, min(end, length))
+        start = max(0, min(start, end))
+        
+        materialized = self._full_transcript or ''
+        if not self.segment_count or len(materialized) >= end:
+            return materialized[start:end]
+        
+        cached = getattr(self, '_transcript_cache', None)
+        if cached is not None and len(cached) == length:
+            return cached[start:end]
+        
+        # Sessão retomada depois de compactada: o começo só existe no texto materializado
+        if start < len(materialized):
+            return materialized[start:] + self.transcript_range(len(materialized), end)
+        
+        # Segmento que contém o offset inicial
+        first_offset = db.session.query(db.func.max(TranscriptSegment.start_offset)).filter(
+            TranscriptSegment.session_id == self.id,
+            TranscriptSegment.start_offset <= start
+        ).scalar() or 0
+        
+        segments = TranscriptSegment.query.filter(
+            TranscriptSegment.session_id == self.id,
+            TranscriptSegment.start_offset >= first_offset,
+            TranscriptSegment.start_offset < end
+        ).order_by(TranscriptSegment.seq).all()
+        
+        text = ''.join(segment.text for segment in segments)
+        return text[start - first_offset:end - first_offset]
+    
+    @property
+    def transcript_etag(self):
+        """Versão da transcrição (muda a cada trecho anexado ou reescrita)"""
+        return f"transcript-{self.id}-{self.segment_count or 0}-{self.transcript_length or 0}"
+    
+    def to_summary_dict(self):
+        """Projeção leve da sessão, sem o texto da transcrição"""
+        return {
             'id': self.id,
             'subject_id': self.subject_id,
             'teacher_id': self.teacher_id,
             'title': self.title,
-            'full_transcript': self.full_transcript,
-            'word_count': self.word_count,
+            'word_count': self.word_count or 0,
+            'transcript_length': self.transcript_length or 0,
+            'segment_count': self.segment_count or 0,
             'status': self.status,
             'started_at': self.started_at.isoformat() if self.started_at else None,
             'ended_at': self.ended_at.isoformat() if self.ended_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
+    
+    def to_dict(self, include_checkpoints=False, include_activities=False):
+        data = self.to_summary_dict()
+        data['full_transcript'] = self.full_transcript
         if include_checkpoints:
             data['checkpoints'] = [cp.to_dict() for cp in self.checkpoints]
         if include_activities:
@@ -73,18 +290,102 @@ class TranscriptionSession(db.Model):
         return data
 
 
+class TranscriptSegment(db.Model):
+    """Trecho anexado à transcrição (log append-only com offsets crescentes)"""
+    __tablename__ = 'transcript_segments'
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'seq', name='uq_transcript_segments_session_seq'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('transcription_sessions.id'), nullable=False, index=True)
+    seq = db.Column(db.Integer, nullable=False)  # Número de sequência (1, 2, 3...)
+    start_offset = db.Column(db.Integer, nullable=False)  # Posição do primeiro caractere
+    text = db.Column(db.Text, nullable=False)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def end_offset(self):
+        return self.start_offset + len(self.text or '')
+    
+    def to_dict(self, include_text=True):
+        data = {
+            'id': self.id,
+            'session_id': self.session_id,
+            'seq': self.seq,
+            'start_offset': self.start_offset,
+            'end_offset': self.end_offset,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+        if include_text:
+            data['text'] = self.text
+        return data
+
+
+class TranscriptSearchWindow(db.Model):
+    """
+    Janela do índice de busca (app.services.search_service): trecho da transcrição inteira com
+    sobreposição entre janelas vizinhas, independente de como o texto foi dividido nos auto-saves.
+    Com checkpoint_id, a janela é de um snapshot congelado (offsets no texto do snapshot).
+    """
+    __tablename__ = 'transcript_search_windows'
+    __table_args__ = (
+        db.Index('ix_transcript_search_windows_owner', 'session_id', 'checkpoint_id', 'seq'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('transcription_sessions.id'), nullable=False)
+    checkpoint_id = db.Column(db.Integer, db.ForeignKey('transcription_checkpoints.id'), nullable=True)
+    seq = db.Column(db.Integer, nullable=False)  # Número da janela (início nominal = seq * passo)
+    start_offset = db.Column(db.Integer, nullable=False)
+    end_offset = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+
+
 class TranscriptionCheckpoint(db.Model):
     """Checkpoint/pausa na transcrição - snapshot do texto naquele momento"""
     __tablename__ = 'transcription_checkpoints'
     
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.Integer, db.ForeignKey('transcription_sessions.id'), nullable=False)
-    transcript_at_checkpoint = db.Column(db.Text, nullable=False)  # Snapshot da transcrição
+    # Snapshot completo (apenas checkpoints antigos); novos guardam só o offset
+    _transcript_snapshot = db.Column('transcript_at_checkpoint', CompressedText, nullable=False, default='')
+    transcript_offset = db.Column(db.Integer, nullable=True)  # Tamanho da transcrição no checkpoint
+    segment_seq = db.Column(db.Integer, nullable=True)  # Último segmento incluído no checkpoint
+    context_digest = db.Column(db.Text, nullable=True)  # Resumo compacto da aula até o checkpoint (cache)
     word_count = db.Column(db.Integer, default=0)
     reason = db.Column(db.String(100), nullable=True)  # quiz, summary, open_question
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @classmethod
+    def from_session(cls, session, reason=''):
+        """Cria um checkpoint apontando para a posição atual da transcrição"""
+        session._seed_legacy_transcript()
+        return cls(
+            session_id=session.id,
+            transcript_offset=session.transcript_length or 0,
+            segment_seq=session.segment_count or 0,
+            word_count=session.word_count,
+            reason=reason
+        )
+    
+    @property
+    def transcript_at_checkpoint(self):
+        """Texto da transcrição até o checkpoint, reconstruído a partir da sessão"""
+        if self.transcript_offset is None:
+            return self._transcript_snapshot or ''
+        return self.session.full_transcript[:self.transcript_offset]
+    
+    def freeze(self, transcript):
+        """Converte o checkpoint em snapshot (usado antes de reescrever a transcrição). Retorna se converteu."""
+        if self.transcript_offset is None:
+            return False
+        self._transcript_snapshot = transcript[:self.transcript_offset]
+        self.transcript_offset = None
+        return True
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -136,6 +437,9 @@ class LiveActivity(db.Model):
     is_support_content = db.Column(db.Boolean, default=False)  # Se é conteúdo de reforço
     parent_activity_id = db.Column(db.Integer, db.ForeignKey('live_activities.id'), nullable=True)
     
+    # Incrementado a cada mudança nas respostas/gabarito (chave do relatório em cache)
+    response_version = db.Column(db.Integer, default=0)
+    
     # Relationships
     checkpoint = db.relationship('TranscriptionCheckpoint', backref='activities')
     responses = db.relationship('LiveActivityResponse', backref='activity', lazy=True, cascade='all, delete-orphan')
@@ -158,13 +462,44 @@ class LiveActivity(db.Model):
     
     @property
     def is_active(self):
-        """Verifica se a atividade está ativa"""
+        """
+        Verifica se a atividade está ativa (leitura pura)
+        O encerramento no prazo é gravado pelo expiry_scheduler, não aqui.
+        """
         if self.status != 'active':
             return False
-        if self.ends_at and datetime.utcnow() > self.ends_at:
-            self.end_activity()
-            return False
-        return True
+        return not (self.ends_at and datetime.utcnow() > self.ends_at)
+    
+    @property
+    def answer_key(self):
+        """Gabarito compilado (em cache, pelo hash do gabarito do conteúdo atual)"""
+        return get_activity_answer_key(self.id, self.content)
+    
+    @staticmethod
+    def bump_response_version(activity_id):
+        """
+        Marca que as respostas da atividade mudaram (invalida o relatório em cache).
+        UPDATE atômico (vale entre processos); gravado no commit de quem chama.
+        """
+        LiveActivity.query.filter_by(id=activity_id).update(
+            {LiveActivity.response_version: func.coalesce(LiveActivity.response_version, 0) + 1},
+            synchronize_session=False
+        )
+    
+    def rescore_responses(self):
+        """Recalcula a nota de todas as respostas em uma única passada vetorizada (sem commit)"""
+        responses = LiveActivityResponse.query.filter_by(activity_id=self.id).all()
+        if self.activity_type != 'quiz' or not responses:
+            return responses
+        
+        answer_key = self.answer_key
+        scores = answer_key.score_many([
+            (response.response_data or {}).get('answers', {}) for response in responses
+        ])
+        for response, correct_count in zip(responses, scores):
+            response.apply_score(int(correct_count), answer_key.total)
+        LiveActivity.bump_response_version(self.id)
+        return responses
     
     @property
     def time_remaining(self):
@@ -203,6 +538,10 @@ class LiveActivity(db.Model):
 class LiveActivityResponse(db.Model):
     """Resposta do aluno a uma atividade"""
     __tablename__ = 'live_activity_responses'
+    __table_args__ = (
+        # Uma linha por aluno: o flush do progresso faz upsert sobre ela
+        db.UniqueConstraint('activity_id', 'student_id', name='uq_live_activity_responses_activity_student'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     activity_id = db.Column(db.Integer, db.ForeignKey('live_activities.id'), nullable=False)
@@ -224,50 +563,25 @@ class LiveActivityResponse(db.Model):
     # Relationships
     student = db.relationship('User', backref='live_activity_responses', lazy=True)
     
-    def calculate_quiz_score(self):
-        """Calcula pontuação básica para quiz"""
-        activity = LiveActivity.query.get(self.activity_id)
-        if not activity or activity.activity_type != 'quiz':
-            return
-        
-        questions = activity.content.get('questions', [])
-        answers = self.response_data.get('answers', {})
-        
-        print(f"🔍 DEBUG calculate_quiz_score:")
-        print(f"  Total questions: {len(questions)}")
-        print(f"  Answers received: {answers}")
-        print(f"  Answer keys: {list(answers.keys())}")
-        
-        correct_count = 0
-        total_questions = len(questions)
-        
-        for i, question in enumerate(questions):
-            # Tentar encontrar resposta pelo ID da questão ou pelo índice
-            q_id = str(question.get('id', i))
-            student_answer = answers.get(q_id)
-            
-            # Fallback: tentar pelo índice string se não achou pelo ID
-            if student_answer is None and q_id != str(i):
-                student_answer = answers.get(str(i))
-                
-            if student_answer is not None:
-                # Converter para int se necessário para comparar
-                try:
-                    ans_int = int(student_answer)
-                    correct_int = int(question.get('correct'))
-                    if ans_int == correct_int:
-                        correct_count += 1
-                except (ValueError, TypeError):
-                    pass
-        
-        print(f"  ✅ Final score: {correct_count}/{total_questions}")
-        
+    def apply_score(self, correct_count, total_questions):
+        """Preenche os campos de resultado do quiz"""
         self.score = correct_count
         self.total = total_questions
         self.percentage = (correct_count / total_questions * 100) if total_questions > 0 else 0
         self.is_correct = correct_count == total_questions
+    
+    def calculate_quiz_score(self):
+        """
+        Calcula pontuação básica para quiz
+        (usa o gabarito compilado da atividade; o commit fica a cargo de quem chama)
+        """
+        activity = self.activity or LiveActivity.query.get(self.activity_id)
+        if not activity or activity.activity_type != 'quiz':
+            return
         
-        db.session.commit()
+        answer_key = activity.answer_key
+        answers = (self.response_data or {}).get('answers', {})
+        self.apply_score(answer_key.score(answers), answer_key.total)
     
     def to_dict(self):
         return {
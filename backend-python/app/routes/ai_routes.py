@@ -5,6 +5,7 @@ from flask import Blueprint, request, jsonify, Response, stream_with_context
 from app.middleware.auth_middleware import token_required
 from app.services.ai_service import chat_with_ai, chat_stream, create_or_get_session, generate_content_with_prompt
 from app.models.ai_session import AISession, AIMessage
+from app.services.context_index import get_session_index, discard_session_index
 from datetime import datetime
 from app import db
 
@@ -211,6 +212,7 @@ def delete_session(current_user, session_id):
     
     db.session.delete(session)
     db.session.commit()
+    discard_session_index(session_id)
     
     return jsonify({
         'success': True,
@@ -385,6 +387,9 @@ def upload_context(current_user):
         )
         db.session.add(context_file)
         db.session.commit()
+
+        # Indexa os trechos para o chat (BM25 da sessão)
+        get_session_index(session.id, AIContextFile.query.filter_by(session_id=session.id).all())
         
         return jsonify({
             'success': True,
@@ -335,6 +335,7 @@ def send_to_presentation(current_user):
             'data': final_document_data,
             'timestamp': datetime.utcnow().isoformat()
         }
+        PresentationSession.bump_version(session.id)
         db.session.commit()
         
         # Emitir via WebSocket
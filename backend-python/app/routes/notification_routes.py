@@ -4,6 +4,9 @@ from app.models.notification import Notification
 from app.models.teaching import Teaching
 from app.models.subject import Subject
 from app.middleware.auth_middleware import token_required
+from app.utils.http_cache import make_etag, not_modified, with_etag
+from sqlalchemy import func
+import zlib
 
 notification_bp = Blueprint('notification', __name__)
 
@@ -67,13 +70,23 @@ from app.models.enrollment import Enrollment
 def get_student_notifications(student_id):
     """
     Retorna notificações para um aluno (baseado nas disciplinas que ele cursa).
+    
+    ETag = disciplinas + quantidade/última notificação delas (as notificações só são criadas):
+    com If-None-Match igual, responde 304 sem carregar as notificações.
     """
     # 1. Buscar disciplinas que o aluno está matriculado
     enrolled_subjects = db.session.query(Enrollment.subject_id).filter_by(student_id=student_id).all()
-    subject_ids = [s[0] for s in enrolled_subjects]
+    subject_ids = sorted({s[0] for s in enrolled_subjects})
     
     if not subject_ids:
         return jsonify({'success': True, 'notifications': []})
+    
+    count, last_id = db.session.query(func.count(Notification.id), func.max(Notification.id))\
+        .filter(Notification.subject_id.in_(subject_ids)).one()
+    etag = make_etag('notifications', student_id, zlib.crc32(repr(subject_ids).encode()), count, last_id or 0)
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
     # 2. Buscar notificações apenas dessas disciplinas
     notifications = Notification.query\
@@ -82,7 +95,7 @@ def get_student_notifications(student_id):
         .limit(20)\
         .all()
     
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
         'notifications': [n.to_dict() for n in notifications]
-    })
+    }), etag)
@@ -2,9 +2,15 @@
 Rotas da API de Apresentação/Transmissão
 Baseado no padrão de quiz_routes.py
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from app.middleware.auth_middleware import token_required
 from app.models.presentation import PresentationSession
+from app.models.transcription_session import TranscriptionSession
+from app.services.transcript_feed import stream_events, parse_last_event_id
+from app.services.realtime import stream_room, presentation_room, parse_room_event_id
+from app.services.websocket_service import emit_presentation_content, emit_presentation_clear, emit_presentation_ended
+from app.utils.http_cache import make_etag, not_modified, with_etag
+from sqlalchemy.orm import defer
 from app import db
 from datetime import datetime
 import logging
@@ -98,8 +104,11 @@ def get_presentation_status(code):
     """
     Endpoint leve para Polling
     Retorna apenas timestamp e tipo do conteúdo atual
+    
+    ETag = versão da sessão: com If-None-Match igual, responde 304 sem ler o conteúdo.
     """
-    session = PresentationSession.query.filter_by(code=code).first()
+    session = db.session.query(PresentationSession.status, PresentationSession.version)\
+        .filter_by(code=code).first()
     
     if not session or session.status != 'active':
         return jsonify({
@@ -107,13 +116,83 @@ def get_presentation_status(code):
             'active': False
         })
     
-    current = session.current_content or {}
+    cached = not_modified(make_etag('presentation', code, session.version or 0))
+    if cached:
+        return cached
     
-    return jsonify({
+    current, version = db.session.query(PresentationSession.current_content, PresentationSession.version)\
+        .filter_by(code=code).first()
+    current = current or {}
+    
+    return with_etag(jsonify({
         'success': True,
         'active': True,
         'timestamp': current.get('timestamp'),
         'type': current.get('type')
+    }), make_etag('presentation', code, version or 0))
+
+
+@presentation_bp.route('/<string:code>/transcript/stream', methods=['GET'])
+def stream_presentation_transcript(code):
+    """
+    Transcrição ao vivo da aula do professor na tela de apresentação (Server-Sent Events)
+    Usa a sessão de transcrição mais recente ainda não encerrada do professor.
+    
+    Sem autenticação necessária (mesmo acesso por código da tela)!
+    """
+    session = PresentationSession.query.filter_by(code=code).first()
+    
+    if not session or session.status != 'active':
+        return jsonify({
+            'success': False,
+            'error': 'Apresentação não encontrada ou encerrada'
+        }), 404
+    
+    transcription = TranscriptionSession.query.options(
+        defer(TranscriptionSession._full_transcript)
+    ).filter(
+        TranscriptionSession.teacher_id == session.teacher_id,
+        TranscriptionSession.status != 'ended'
+    ).order_by(TranscriptionSession.created_at.desc()).first()
+    
+    if not transcription:
+        return jsonify({
+            'success': False,
+            'error': 'Nenhuma transcrição em andamento'
+        }), 404
+    
+    transcription_id = transcription.id
+    last_seq = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    db.session.close()
+    
+    return Response(stream_with_context(stream_events(transcription_id, last_seq)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@presentation_bp.route('/<string:code>/events', methods=['GET'])
+def stream_presentation_events(code):
+    """
+    Eventos da tela de apresentação (Server-Sent Events)
+    Eventos: presentation_content, presentation_clear, presentation_ended.
+    
+    Sem autenticação necessária (mesmo acesso por código da tela)!
+    """
+    session = PresentationSession.query.filter_by(code=code).first()
+    
+    if not session or session.status != 'active':
+        return jsonify({
+            'success': False,
+            'error': 'Apresentação não encontrada ou encerrada'
+        }), 404
+    
+    last_seq = parse_room_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    db.session.close()
+    
+    return Response(stream_with_context(stream_room(presentation_room(code), last_seq)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
 
@@ -155,16 +234,12 @@ def send_content(current_user, code):
         'data': content_data,
         'timestamp': datetime.utcnow().isoformat()
     }
+    PresentationSession.bump_version(session.id)
     db.session.commit()
     
-    # Emitir via WebSocket para todas as telas conectadas
-    # (Removido para Polling Strategy)
-    # try:
-    #     from app.services.websocket_service import emit_presentation_content
-    #     emit_presentation_content(code, session.current_content)
-    #     logger.info(f"Conteúdo enviado para apresentação {code}: {content_type}")
-    # except Exception as e:
-    #     logger.error(f"Erro ao emitir WebSocket: {e}")
+    # Emitir para todas as telas conectadas ao stream (/<code>/events)
+    emit_presentation_content(code, session.current_content)
+    logger.info(f"Conteúdo enviado para apresentação {code}: {content_type}")
     
     return jsonify({
         'success': True,
@@ -193,15 +268,11 @@ def clear_presentation(current_user, code):
         'data': {},
         'timestamp': datetime.utcnow().isoformat()
     }
+    PresentationSession.bump_version(session.id)
     db.session.commit()
     
-    # Emitir via WebSocket
-    # (Removido para Polling Strategy)
-    # try:
-    #     from app.services.websocket_service import emit_presentation_clear
-    #     emit_presentation_clear(code)
-    # except Exception as e:
-    #     logger.error(f"Erro ao emitir WebSocket: {e}")
+    # Emitir para as telas conectadas
+    emit_presentation_clear(code)
     
     return jsonify({
         'success': True,
@@ -225,13 +296,8 @@ def end_presentation(current_user, code):
     
     session.end_session()
     
-    # Emitir via WebSocket para desconectar telas
-    # (Removido para Polling Strategy)
-    # try:
-    #     from app.services.websocket_service import emit_presentation_ended
-    #     emit_presentation_ended(code)
-    # except Exception as e:
-    #     logger.error(f"Erro ao emitir WebSocket: {e}")
+    # Emitir para desconectar telas
+    emit_presentation_ended(code)
     
     logger.info(f"Apresentação encerrada: {code}")
     
@@ -313,9 +379,12 @@ def control_content(current_user, code_or_id):
     # Forçar detecção de mudança pelo SQLAlchemy (JSON mutable)
     from sqlalchemy.orm.attributes import flag_modified
     flag_modified(session, "current_content")
+    PresentationSession.bump_version(session.id)
     
     db.session.commit()
     
+    # Telas conectadas ao stream recebem o comando na hora (as demais pelo polling)
+    emit_presentation_content(session.code, session.current_content)
     logger.info(f"Comando de vídeo persistido para {session.code}: {command}")
     
     return jsonify({'success': True, 'message': f'Command {command} saved'})
@@ -1,11 +1,20 @@
 """
 Rotas da API de Quiz ao Vivo
+Obs: quiz_bp não é registrado em create_app e as tabelas de quiz ficam fora do schema
+(models/__init__ e generate_sql_ddl.py); o quiz ao vivo do app usa as atividades da transcrição.
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from app.middleware.auth_middleware import token_required
 from app.models.quiz import Quiz, QuizQuestion, QuizResponse
 from app.models.enrollment import Enrollment
 from app import db
+from app.services.analytics_service import quiz_analytics
+from app.services.realtime import stream_room, quiz_room, parse_room_event_id
+from app.services.websocket_service import emit_new_response, emit_ranking_update, emit_quiz_ended
+from app.services.roster_cache import get_roster
+from app.services.ranking_feed import ranking_row, get_ranking_feed, record_response
+from app.services.expiry_scheduler import schedule_quiz, expire_if_due, KIND_QUIZ, EXPIRY_INLINE
+from app.utils.http_cache import make_etag, not_modified, with_etag
 from datetime import datetime
 import logging
 
@@ -13,6 +22,14 @@ logger = logging.getLogger(__name__)
 
 quiz_bp = Blueprint('quiz', __name__)
 
+# Nível de desempenho (analytics) -> segmento do suporte personalizado
+SEGMENT_BY_LEVEL = {
+    'excellent': 'excellent',
+    'good': 'good',
+    'average': 'attention',
+    'below_average': 'critical'
+}
+
 
 @quiz_bp.route('/create', methods=['POST'])
 @token_required
@@ -96,8 +113,9 @@ def broadcast_quiz(current_user, quiz_id):
     if quiz.status != 'waiting':
         return jsonify({'success': False, 'error': 'Quiz já foi enviado ou encerrado'}), 400
     
-    # Broadcast - inicia o timer
+    # Broadcast - inicia o timer (o encerramento no prazo fica com o agendador)
     quiz.broadcast()
+    schedule_quiz(quiz)
     
     # Contar alunos matriculados
     enrolled_count = Enrollment.query.filter_by(subject_id=quiz.subject_id).count()
@@ -140,6 +158,8 @@ def get_active_quiz(current_user, subject_id):
     
     # Verificar se o tempo acabou
     if not quiz.is_active:
+        if EXPIRY_INLINE:
+            expire_if_due(KIND_QUIZ, quiz.id, quiz.status, quiz.ends_at)
         return jsonify({
             'success': True,
             'active': False,
@@ -180,8 +200,9 @@ def submit_response(current_user, quiz_id):
     if not quiz:
         return jsonify({'success': False, 'error': 'Quiz não encontrado'}), 404
     
-    # Verificar se ainda está ativo
+    # Verificar se ainda está ativo (vencido e ninguém encerrou ainda: encerra agora)
     if not quiz.is_active:
+        expire_if_due(KIND_QUIZ, quiz_id, quiz.status, quiz.ends_at)
         return jsonify({'success': False, 'error': 'Quiz encerrado'}), 400
     
     # Verificar se já respondeu
@@ -205,59 +226,45 @@ def submit_response(current_user, quiz_id):
         time_taken=time_taken
     )
     db.session.add(response)
-    db.session.commit()
     
     # Calcular pontuação
     response.calculate_score()
+    Quiz.bump_response_version(quiz_id)
+    db.session.commit()
+    
+    _emit_response_events(quiz, current_user, response)
     
-    # Emitir evento WebSocket para atualizar ranking em tempo real
+    return jsonify({
+        'success': True,
+        'message': 'Resposta enviada!',
+        'result': response.to_dict()
+    })
+
+
+def _emit_response_events(quiz, student, response):
+    """Eventos em tempo real de uma resposta gravada: nova resposta + só as linhas do ranking que mudaram"""
     try:
-        from app.services.websocket_service import emit_new_response, emit_ranking_update
-        
-        # Emitir nova resposta
-        emit_new_response(quiz_id, {
-            'student_id': current_user.id,
-            'student_name': current_user.name,
+        emit_new_response(quiz.id, {
+            'student_id': student.id,
+            'student_name': student.name,
             'points': response.points,
             'percentage': response.percentage
         })
         
-        # Buscar ranking atualizado e emitir
-        responses = QuizResponse.query.filter_by(quiz_id=quiz_id)\
-            .order_by(QuizResponse.points.desc(), QuizResponse.submitted_at.asc())\
-            .all()
-        
-        enrolled_count = Enrollment.query.filter_by(subject_id=quiz.subject_id).count()
-        
-        ranking = []
-        for i, r in enumerate(responses):
-            ranking.append({
-                'position': i + 1,
-                'student_id': r.student_id,
-                'student_name': r.student.name if r.student else 'Desconhecido',
-                'points': r.points,
-                'score': r.score,
-                'total': r.total,
-                'percentage': r.percentage,
-                'time_taken': r.time_taken,
-            })
-        
-        emit_ranking_update(quiz_id, {
-            'quiz_id': quiz_id,
+        version = db.session.query(Quiz.response_version).filter_by(id=quiz.id).scalar() or 0
+        row = ranking_row(
+            student.id, student.name, response.points, response.score, response.total,
+            response.percentage, response.time_taken, response.submitted_at
+        )
+        emit_ranking_update(quiz.id, {
+            'quiz_id': quiz.id,
             'quiz_status': quiz.status,
-            'enrolled_count': enrolled_count,
-            'response_count': len(responses),
-            'ranking': ranking
+            'enrolled_count': len(get_roster(quiz.subject_id)),
+            **record_response(quiz.id, row, version)
         })
         
     except Exception as e:
-        logger.error(f"Erro ao emitir evento WebSocket: {e}")
-    
-    return jsonify({
-        'success': True,
-        'message': 'Resposta enviada!',
-        'result': response.to_dict()
-    })
+        logger.error(f"Erro ao emitir evento em tempo real: {e}")
 
 
 @quiz_bp.route('/<int:quiz_id>/progress', methods=['POST'])
@@ -272,8 +279,9 @@ def update_progress(current_user, quiz_id):
     if not quiz:
         return jsonify({'success': False, 'error': 'Quiz não encontrado'}), 404
     
-    # Verificar se ainda está ativo
+    # Verificar se ainda está ativo (vencido e ninguém encerrou ainda: encerra agora)
     if not quiz.is_active:
+        expire_if_due(KIND_QUIZ, quiz_id, quiz.status, quiz.ends_at)
         return jsonify({'success': False, 'error': 'Quiz encerrado'}), 400
     
     data = request.get_json()
@@ -301,22 +309,12 @@ def update_progress(current_user, quiz_id):
         response.answers = current_answers
         response.time_taken = time_taken
     
-    # Calcular pontuação parcial
+    # Calcular pontuação parcial (nova versão: o live-ranking e o feed em cache são recalculados)
     response.calculate_score()
+    Quiz.bump_response_version(quiz_id)
     db.session.commit()
     
-    # Emitir evento WebSocket (opcional, se já tiver implementado)
-    try:
-        from app.services.websocket_service import emit_new_response
-        emit_new_response(quiz_id, {
-            'student_id': current_user.id,
-            'student_name': current_user.name,
-            'points': response.points,
-            'percentage': response.percentage
-        })
-    except Exception as e:
-        # Silencioso se não tiver websocket
-        pass
+    _emit_response_events(quiz, current_user, response)
     
     return jsonify({
         'success': True,
@@ -347,154 +345,40 @@ def get_report(current_user, quiz_id):
     # Contar matriculados
     enrolled_count = Enrollment.query.filter_by(subject_id=quiz.subject_id).count()
     
-    # Calcular estatísticas básicas
-    total_responses = len(responses)
-    avg_score = sum(r.percentage for r in responses) / total_responses if total_responses > 0 else 0
+    # Matriz alunos x questões montada uma vez; todas as métricas saem dela
+    questions = quiz.questions
+    analytics = quiz_analytics(questions, responses)
+    total_responses = analytics.count
+    avg_score = analytics.average()
     
     # Top 3 estudantes
     top_students = [r.to_dict() for r in responses[:3]]
     
     # ========== PERFORMANCE DISTRIBUTION ==========
-    performance_distribution = {
-        'excellent': 0,    # 90-100%
-        'good': 0,         # 70-89%
-        'average': 0,      # 50-69%
-        'below_average': 0 # <50%
-    }
-    
-    for response in responses:
-        if response.percentage >= 90:
-            performance_distribution['excellent'] += 1
-        elif response.percentage >= 70:
-            performance_distribution['good'] += 1
-        elif response.percentage >= 50:
-            performance_distribution['average'] += 1
-        else:
-            performance_distribution['below_average'] += 1
+    performance_distribution = analytics.performance_distribution()
     
     # ========== QUESTION ANALYTICS ==========
-    question_analytics = []
-    for question in quiz.questions:
-        correct_count = 0
-        incorrect_count = 0
-        wrong_answers = {}  # Conta respostas erradas
-        
-        for response in responses:
-            student_answer = response.answers.get(str(question.id))
-            if student_answer is not None:
-                if student_answer == question.correct:
-                    correct_count += 1
-                else:
-                    incorrect_count += 1
-                    # Contar qual resposta errada foi mais escolhida
-                    wrong_answers[student_answer] = wrong_answers.get(student_answer, 0) + 1
-        
-        total_answers = correct_count + incorrect_count
-        correct_rate = (correct_count / total_answers * 100) if total_answers > 0 else 0
-        
-        # Determinar dificuldade baseada na taxa de acerto
-        if correct_rate >= 70:
-            difficulty = 'easy'
-        elif correct_rate >= 40:
-            difficulty = 'medium'
-        else:
-            difficulty = 'hard'
-        
-        # Resposta errada mais comum
-        most_common_wrong = max(wrong_answers.items(), key=lambda x: x[1])[0] if wrong_answers else None
-        
-        question_analytics.append({
+    question_analytics = [
+        {
             'question_id': question.id,
             'question_text': question.question,
-            'correct_count': correct_count,
-            'incorrect_count': incorrect_count,
-            'correct_rate': round(correct_rate, 1),
-            'difficulty_level': difficulty,
-            'most_common_wrong_answer': most_common_wrong
-        })
+            **stats
+        }
+        for question, stats in zip(questions, analytics.question_stats())
+    ]
     
     # Encontrar melhor e pior questão
     best_question = max(question_analytics, key=lambda x: x['correct_rate']) if question_analytics else None
     worst_question = min(question_analytics, key=lambda x: x['correct_rate']) if question_analytics else None
     
     # ========== TIME ANALYTICS ==========
-    time_analytics = {
-        'average_completion_time': 0,
-        'fastest_completion': 0,
-        'slowest_completion': 0,
-        'median_time': 0
-    }
-    
-    if responses:
-        times = [r.time_taken for r in responses if r.time_taken > 0]
-        if times:
-            time_analytics['average_completion_time'] = round(sum(times) / len(times), 1)
-            time_analytics['fastest_completion'] = min(times)
-            time_analytics['slowest_completion'] = max(times)
-            
-            # Calcular mediana
-            sorted_times = sorted(times)
-            mid = len(sorted_times) // 2
-            if len(sorted_times) % 2 == 0:
-                time_analytics['median_time'] = (sorted_times[mid-1] + sorted_times[mid]) / 2
-            else:
-                time_analytics['median_time'] = sorted_times[mid]
+    time_analytics = analytics.time_analytics()
     
     # ========== SCORE DISTRIBUTION ==========
-    score_ranges = [
-        {'min': 0, 'max': 20, 'count': 0},
-        {'min': 20, 'max': 40, 'count': 0},
-        {'min': 40, 'max': 60, 'count': 0},
-        {'min': 60, 'max': 80, 'count': 0},
-        {'min': 80, 'max': 100, 'count': 0}
-    ]
-    
-    for response in responses:
-        for range_item in score_ranges:
-            if range_item['min'] <= response.percentage < range_item['max'] or \
-               (range_item['max'] == 100 and response.percentage == 100):
-                range_item['count'] += 1
-                break
-    
-    # Adicionar porcentagens
-    for range_item in score_ranges:
-        range_item['percentage'] = round((range_item['count'] / total_responses * 100), 1) if total_responses > 0 else 0
+    score_ranges = analytics.score_ranges()
     
     # ========== COMPARATIVE STATS ==========
-    percentages = [r.percentage for r in responses]
-    
-    # Calcular mediana
-    class_median = 0
-    if percentages:
-        sorted_percentages = sorted(percentages)
-        mid = len(sorted_percentages) // 2
-        if len(sorted_percentages) % 2 == 0:
-            class_median = (sorted_percentages[mid-1] + sorted_percentages[mid]) / 2
-        else:
-            class_median = sorted_percentages[mid]
-    
-    # Calcular moda (valor mais frequente)
-    from collections import Counter
-    class_mode = 0
-    if percentages:
-        rounded_percentages = [round(p) for p in percentages]
-        counter = Counter(rounded_percentages)
-        class_mode = counter.most_common(1)[0][0] if counter else 0
-    
-    # Calcular desvio padrão
-    import math
-    standard_deviation = 0
-    if len(percentages) > 1:
-        mean = sum(percentages) / len(percentages)
-        variance = sum((x - mean) ** 2 for x in percentages) / len(percentages)
-        standard_deviation = math.sqrt(variance)
-    
-    comparative_stats = {
-        'class_median': round(class_median, 1),
-        'class_mode': class_mode,
-        'standard_deviation': round(standard_deviation, 1),
-        'participation_rate': round((total_responses / enrolled_count * 100), 1) if enrolled_count > 0 else 0
-    }
+    comparative_stats = analytics.comparative_stats(enrolled_count)
     
     # ========== RETORNAR RELATÓRIO COMPLETO ==========
     return jsonify({
@@ -542,6 +426,7 @@ def end_quiz_manually(current_user, quiz_id):
         return jsonify({'success': False, 'error': 'Não autorizado'}), 403
     
     quiz.end_quiz()
+    emit_quiz_ended(quiz_id)
     
     return jsonify({
         'success': True,
@@ -549,13 +434,47 @@ def end_quiz_manually(current_user, quiz_id):
     })
 
 
+@quiz_bp.route('/<int:quiz_id>/events', methods=['GET'])
+@token_required
+def stream_quiz_events(current_user, quiz_id):
+    """
+    Eventos em tempo real do quiz (Server-Sent Events)
+    Eventos: new_response, ranking_update, quiz_ended.
+    """
+    quiz = Quiz.query.get(quiz_id)
+    
+    if not quiz:
+        return jsonify({'success': False, 'error': 'Quiz não encontrado'}), 404
+    
+    if quiz.created_by != current_user.id:
+        enrollment = Enrollment.query.filter_by(student_id=current_user.id, subject_id=quiz.subject_id).first()
+        if not enrollment:
+            return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+    
+    last_seq = parse_room_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    db.session.close()
+    
+    return Response(stream_with_context(stream_room(quiz_room(quiz_id), last_seq)), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @quiz_bp.route('/<int:quiz_id>/live-ranking', methods=['GET'])
 @token_required
 def get_live_ranking(current_user, quiz_id):
     """
     Retorna ranking em tempo real do quiz (para WebSocket/polling)
+    
+    Envie ?since=<version da última resposta> para receber só as mudanças desde então:
+    changes (linhas novas/alteradas), moved ([student_id, posição]) e removed. Com full=true,
+    a resposta traz o ranking completo em ranking (primeira chamada ou cliente muito atrasado).
+    
+    ETag = status + versão das respostas + matrículas: com If-None-Match igual, responde 304
+    sem montar o ranking.
     """
-    quiz = Quiz.query.get(quiz_id)
+    quiz = db.session.query(Quiz.created_by, Quiz.subject_id, Quiz.status, Quiz.response_version)\
+        .filter_by(id=quiz_id).first()
     
     if not quiz:
         return jsonify({'success': False, 'error': 'Quiz não encontrado'}), 404
@@ -563,37 +482,21 @@ def get_live_ranking(current_user, quiz_id):
     if quiz.created_by != current_user.id:
         return jsonify({'success': False, 'error': 'Não autorizado'}), 403
     
-    # Buscar todas as respostas ordenadas por pontos
-    responses = QuizResponse.query.filter_by(quiz_id=quiz_id)\
-        .order_by(QuizResponse.points.desc(), QuizResponse.submitted_at.asc())\
-        .all()
-    
-    # Contar matriculados
-    enrolled_count = Enrollment.query.filter_by(subject_id=quiz.subject_id).count()
+    roster = get_roster(quiz.subject_id)
+    etag = make_etag('quiz', quiz_id, quiz.status, quiz.response_version or 0, roster.fingerprint)
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    # Preparar ranking
-    ranking = []
-    for i, response in enumerate(responses):
-        ranking.append({
-            'position': i + 1,
-            'student_id': response.student_id,
-            'student_name': response.student.name if response.student else 'Desconhecido',
-            'points': response.points,
-            'score': response.score,
-            'total': response.total,
-            'percentage': response.percentage,
-            'time_taken': response.time_taken,
-            'submitted_at': response.submitted_at.isoformat() if response.submitted_at else None
-        })
+    feed = get_ranking_feed(quiz_id, quiz.response_version or 0)
     
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
         'quiz_id': quiz_id,
         'quiz_status': quiz.status,
-        'enrolled_count': enrolled_count,
-        'response_count': len(responses),
-        'ranking': ranking
-    })
+        'enrolled_count': len(roster),
+        **feed.payload(request.args.get('since', type=int))
+    }), etag)
 
 
 @quiz_bp.route('/<int:quiz_id>/export-pdf', methods=['GET'])
@@ -636,77 +539,28 @@ def export_quiz_pdf(current_user, quiz_id):
             'time_taken': response.time_taken,
         })
     
-    # ========== PERFORMANCE DISTRIBUTION ==========
-    performance_distribution = {
-        'excellent': 0,    # 90-100%
-        'good': 0,         # 70-89%
-        'average': 0,      # 50-69%
-        'below_average': 0 # <50%
-    }
+    questions = quiz.questions
+    analytics = quiz_analytics(questions, responses)
     
-    for response in responses:
-        if response.percentage >= 90:
-            performance_distribution['excellent'] += 1
-        elif response.percentage >= 70:
-            performance_distribution['good'] += 1
-        elif response.percentage >= 50:
-            performance_distribution['average'] += 1
-        else:
-            performance_distribution['below_average'] += 1
+    # ========== PERFORMANCE DISTRIBUTION ==========
+    performance_distribution = analytics.performance_distribution()
     
     # ========== QUESTION ANALYTICS ==========
-    question_analytics = []
-    for question in quiz.questions:
-        correct_count = 0
-        incorrect_count = 0
-        
-        for response in responses:
-            student_answer = response.answers.get(str(question.id))
-            if student_answer is not None:
-                if student_answer == question.correct:
-                    correct_count += 1
-                else:
-                    incorrect_count += 1
-        
-        total_answers = correct_count + incorrect_count
-        correct_rate = (correct_count / total_answers * 100) if total_answers > 0 else 0
-        
-        question_analytics.append({
+    question_analytics = [
+        {
             'question_text': question.question,
-            'correct_count': correct_count,
-            'incorrect_count': incorrect_count,
-            'correct_rate': round(correct_rate, 1),
-        })
+            'correct_count': stats['correct_count'],
+            'incorrect_count': stats['incorrect_count'],
+            'correct_rate': stats['correct_rate'],
+        }
+        for question, stats in zip(questions, analytics.question_stats())
+    ]
     
     # ========== TIME ANALYTICS ==========
-    time_analytics = {
-        'average_completion_time': 0,
-        'fastest_completion': 0,
-        'slowest_completion': 0,
-    }
-    
-    if responses:
-        times = [r.time_taken for r in responses if r.time_taken > 0]
-        if times:
-            time_analytics['average_completion_time'] = round(sum(times) / len(times), 1)
-            time_analytics['fastest_completion'] = min(times)
-            time_analytics['slowest_completion'] = max(times)
+    time_analytics = analytics.time_analytics(with_median=False)
     
     # ========== SCORE DISTRIBUTION ==========
-    score_ranges = [
-        {'min': 0, 'max': 20, 'count': 0, 'label': '0-20%'},
-        {'min': 20, 'max': 40, 'count': 0, 'label': '20-40%'},
-        {'min': 40, 'max': 60, 'count': 0, 'label': '40-60%'},
-        {'min': 60, 'max': 80, 'count': 0, 'label': '60-80%'},
-        {'min': 80, 'max': 100, 'count': 0, 'label': '80-100%'}
-    ]
-    
-    for response in responses:
-        for range_item in score_ranges:
-            if range_item['min'] <= response.percentage < range_item['max'] or \
-               (range_item['max'] == 100 and response.percentage == 100):
-                range_item['count'] += 1
-                break
+    score_ranges = analytics.score_ranges(with_percentage=False, with_label=True)
     
     ranking_data = {
         'enrolled_count': enrolled_count,
@@ -777,40 +631,29 @@ def segment_students(current_user, quiz_id):
     
     students_data = []
     
-    for response in responses:
-        student_data = {
+    questions = quiz.questions
+    analytics = quiz_analytics(questions, responses)
+    levels = analytics.performance_levels()
+    wrong_questions = analytics.wrong_questions_by_student()
+    
+    for response, level, wrong in zip(responses, levels, wrong_questions):
+        segment = SEGMENT_BY_LEVEL[level]
+        segments[segment].append(response.student_id)
+        students_data.append({
             'id': response.student_id,
             'name': response.student.name if response.student else 'Desconhecido',
             'percentage': response.percentage,
             'score': response.score,
             'total': response.total,
-            'performance_level': '',
-            'weak_topics': []
-        }
-        
-        if response.percentage < 50:
-            student_data['performance_level'] = 'critical'
-            segments['critical'].append(response.student_id)
-        elif response.percentage < 70:
-            student_data['performance_level'] = 'attention'
-            segments['attention'].append(response.student_id)
-        elif response.percentage < 90:
-            student_data['performance_level'] = 'good'
-            segments['good'].append(response.student_id)
-        else:
-            student_data['performance_level'] = 'excellent'
-            segments['excellent'].append(response.student_id)
-        
-        answers = response.answers
-        for question in quiz.questions:
-            student_answer = answers.get(str(question.id))
-            if student_answer is not None and student_answer != question.correct:
-                student_data['weak_topics'].append({
-                    'question_id': question.id,
-                    'question': question.question[:100]
-                })
-        
-        students_data.append(student_data)
+            'performance_level': segment,
+            'weak_topics': [
+                {
+                    'question_id': questions[i].id,
+                    'question': questions[i].question[:100]
+                }
+                for i in wrong
+            ]
+        })
     
     return jsonify({
         'success': True,
@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models.system_setting import SystemSetting
 from app.middleware.admin_middleware import super_admin_required
+from app.services.ai_service import AI_CONFIG_KEYS, invalidate_ai_config
+from app.services.ai_cache import get_ai_cache
 
 settings_bp = Blueprint('settings', __name__)
 
@@ -53,6 +55,10 @@ def update_setting(current_user):
             
         db.session.commit()
         
+        # Chave/modelo da IA mudaram: próxima chamada relê a configuração e cria um novo client
+        if key in AI_CONFIG_KEYS:
+            invalidate_ai_config()
+        
         return jsonify({
             'success': True,
             'message': 'Configuração salva com sucesso',
@@ -61,3 +67,22 @@ def update_setting(current_user):
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
+
+@settings_bp.route('/ai-cache', methods=['GET'])
+@super_admin_required
+def get_ai_cache_stats(current_user):
+    """Contadores do cache de respostas da IA neste processo (acertos, faltas, entradas) (Super Admin)"""
+    return jsonify({
+        'success': True,
+        'stats': get_ai_cache().stats()
+    }), 200
+
+@settings_bp.route('/ai-cache', methods=['DELETE'])
+@super_admin_required
+def clear_ai_cache(current_user):
+    """Esvazia o cache de respostas da IA (memória deste processo e tabela) (Super Admin)"""
+    try:
+        get_ai_cache().clear()
+        return jsonify({'success': True, 'message': 'Cache da IA esvaziado'}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
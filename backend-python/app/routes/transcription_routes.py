@@ -1,7 +1,7 @@
 """
 Rotas da API de Transcrição ao Vivo com Atividades
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response, Response, stream_with_context, url_for
 from app.middleware.auth_middleware import token_required
 from app.models.transcription_session import (
     TranscriptionSession,
@@ -17,7 +17,22 @@ from app import db
 from app.models.notification import Notification
 from app.models.study_material import StudyMaterial
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import or_
+from sqlalchemy.orm import defer
+from app.services.job_service import submit_job, get_job_store, run_in_background, AI_JOBS_ASYNC
+from app.services.transcript_feed import stream_events, notify_transcript_changed, parse_last_event_id
+from app.services.live_state import get_activity_state, get_leaderboard, record_progress, mark_submitted, end_activity_state, flush_activity, get_live_state_store
+from app.services.roster_cache import get_roster, is_enrolled
+from app.services.analytics_service import activity_analytics
+from app.services.report_cache import get_cached_report
+from app.services.websocket_service import emit_presentation_content, emit_activity_started, emit_activity_response, emit_activity_ended
+from app.services.realtime import stream_room, activity_room, parse_room_event_id
+from app.services.expiry_scheduler import schedule_activity, expire_if_due, expire_overdue_activities, KIND_ACTIVITY, EXPIRY_INLINE
+from app.services.subject_state import ACTIVE_WAIT_SECONDS, get_active_state_tagged, wait_for_change, stream_active_state
+from app.utils.http_cache import make_etag, not_modified, with_etag
 import json
+import time
 
 transcription_bp = Blueprint('transcription', __name__)
 
@@ -98,6 +113,61 @@ def get_session(current_user, session_id):
     })
 
 
+@transcription_bp.route('/sessions/<int:session_id>/transcript', methods=['GET'])
+@token_required
+def get_transcript(current_user, session_id):
+    """
+    Obtém a transcrição (ou um trecho dela) com suporte a ETag / If-None-Match
+    
+    Query params (opcionais):
+        start, end: intervalo em caracteres (mesmos offsets dos segmentos)
+        from_word, to_word: intervalo em palavras
+    """
+    session = TranscriptionSession.query.options(
+        defer(TranscriptionSession._full_transcript)
+    ).get(session_id)
+    
+    if not session:
+        return jsonify({'success': False, 'error': 'Sessão não encontrada'}), 404
+    
+    if session.teacher_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+    
+    etag = session.transcript_etag
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+        response.set_etag(etag, weak=True)
+        return response
+    
+    start = request.args.get('start', 0, type=int)
+    end = request.args.get('end', type=int)
+    from_word = request.args.get('from_word', type=int)
+    to_word = request.args.get('to_word', type=int)
+    
+    if from_word is not None or to_word is not None:
+        words = session.full_transcript.split()
+        from_word = max(0, from_word or 0)
+        text = ' '.join(words[from_word:to_word])
+        range_info = {'from_word': from_word, 'to_word': min(to_word, len(words)) if to_word is not None else len(words)}
+    else:
+        text = session.transcript_range(start, end)
+        start = max(0, start)
+        range_info = {'start': start, 'end': start + len(text)}
+    
+    response = jsonify({
+        'success': True,
+        'session_id': session.id,
+        'transcript_length': session.transcript_length or 0,
+        'segment_count': session.segment_count or 0,
+        'word_count': session.word_count or 0,
+        'range': range_info,
+        'text': text
+    })
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @transcription_bp.route('/sessions/<int:session_id>', methods=['PUT'])
 @token_required
 def update_session(current_user, session_id):
@@ -110,7 +180,8 @@ def update_session(current_user, session_id):
         "title": str (optional)
     }
     """
-    session = TranscriptionSession.query.get(session_id)
+    # Mesmo lock do /append: os dois gravam o próximo seq de segmento
+    session = TranscriptionSession.query.filter_by(id=session_id).with_for_update().first()
     
     if not session:
         return jsonify({'success': False, 'error': 'Sessão não encontrada'}), 404
@@ -120,19 +191,154 @@ def update_session(current_user, session_id):
     
     data = request.get_json() or {}
     
-    if 'full_transcript' in data:
-        session.full_transcript = data['full_transcript']
-    
-    if 'title' in data:
-        session.title = data['title']
+    try:
+        if 'full_transcript' in data:
+            # Se o texto só cresceu, grava apenas o sufixo como novo segmento
+            session.save_transcript(data['full_transcript'])
+        
+        if 'title' in data:
+            session.title = data['title']
+        
+        session.updated_at = datetime.utcnow()
+        db.session.commit()
+    except IntegrityError:
+        # Outro auto-save (PUT ou /append) gravou o mesmo seq ao mesmo tempo
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Conflito de sequência, tente novamente'}), 409
     
-    session.updated_at = datetime.utcnow()
-    db.session.commit()
+    notify_transcript_changed(session_id)
     
     return jsonify({
         'success': True,
         'message': 'Transcrição salva',
-        'word_count': session.word_count
+        'word_count': session.word_count or 0
+    })
+
+
+@transcription_bp.route('/sessions/<int:session_id>/append', methods=['POST'])
+@token_required
+def append_transcript(current_user, session_id):
+    """
+    Anexa um novo trecho à transcrição (auto-save incremental)
+    
+    Body:
+    {
+        "text": str,
+        "offset": int (optional) - tamanho da transcrição que o cliente conhece
+    }
+    """
+    session = TranscriptionSession.query.filter_by(id=session_id).with_for_update().first()
+    
+    if not session:
+        return jsonify({'success': False, 'error': 'Sessão não encontrada'}), 404
+    
+    if session.teacher_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+    
+    data = request.get_json() or {}
+    text = data.get('text') or ''
+    offset = data.get('offset')
+    current_length = session.transcript_length or len(session._full_transcript or '')
+    
+    if offset is not None:
+        if offset + len(text) <= current_length:
+            # Reenvio de um trecho já gravado (ex: retry após timeout)
+            db.session.rollback()
+            return jsonify({
+                'success': True,
+                'message': 'Trecho já gravado',
+                'duplicate': True,
+                'seq': session.segment_count or 0,
+                'transcript_length': current_length,
+                'word_count': session.word_count or 0
+            })
+        if offset != current_length:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': 'Offset divergente da transcrição salva',
+                'transcript_length': current_length
+            }), 409
+    
+    try:
+        segment = session.append_text(text)
+        db.session.commit()
+    except IntegrityError:
+        # Outro auto-save gravou o mesmo seq ao mesmo tempo
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Conflito de sequência, tente novamente'}), 409
+    
+    notify_transcript_changed(session_id)
+    
+    return jsonify({
+        'success': True,
+        'message': 'Trecho anexado',
+        'seq': segment.seq if segment else (session.segment_count or 0),
+        'start_offset': segment.start_offset if segment else current_length,
+        'transcript_length': session.transcript_length or 0,
+        'word_count': session.word_count or 0
+    })
+
+
+@transcription_bp.route('/sessions/<int:session_id>/stream', methods=['GET'])
+@token_required
+def stream_transcript(current_user, session_id):
+    """
+    Transcrição ao vivo (Server-Sent Events): envia apenas os segmentos novos
+    
+    Eventos: segment (trecho anexado), reset (transcrição reescrita), end (sessão encerrada).
+    O id de cada evento é o seq do segmento; reconecte com Last-Event-ID
+    (ou ?last_event_id=) para continuar de onde parou. Sem ele, envia a transcrição desde o início.
+    """
+    session = TranscriptionSession.query.options(
+        defer(TranscriptionSession._full_transcript)
+    ).get(session_id)
+    
+    if not session:
+        return jsonify({'success': False, 'error': 'Sessão não encontrada'}), 404
+    
+    if session.teacher_id != current_user.id:
+        enrollment = Enrollment.query.filter_by(
+            student_id=current_user.id,
+            subject_id=session.subject_id
+        ).first()
+        if not enrollment:
+            return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+    
+    last_seq = parse_last_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    # O stream não usa a sessão do request: libera a conexão antes de começar
+    db.session.close()
+    
+    return _event_stream_response(stream_events(session_id, last_seq))
+
+
+@transcription_bp.route('/activities/<int:activity_id>/events', methods=['GET'])
+@token_required
+def stream_activity_events(current_user, activity_id):
+    """
+    Eventos em tempo real da atividade (Server-Sent Events)
+    
+    Eventos: activity_started, new_response (resposta final de um aluno), activity_ended.
+    Reconecte com Last-Event-ID para receber o que ainda estiver no buffer da sala.
+    """
+    activity = LiveActivity.query.get(activity_id)
+    
+    if not activity:
+        return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
+    
+    if activity.session.teacher_id != current_user.id and not is_enrolled(activity.session.subject_id, current_user.id):
+        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+    
+    last_seq = parse_room_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    db.session.close()
+    
+    return _event_stream_response(stream_room(activity_room(activity_id), last_seq))
+
+
+def _event_stream_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
 
@@ -158,13 +364,8 @@ def create_checkpoint(current_user, session_id):
     data = request.get_json() or {}
     reason = data.get('reason', '')
     
-    # Criar checkpoint com snapshot da transcrição atual
-    checkpoint = TranscriptionCheckpoint(
-        session_id=session_id,
-        transcript_at_checkpoint=session.full_transcript,
-        word_count=session.word_count,
-        reason=reason
-    )
+    # Criar checkpoint com a posição atual da transcrição
+    checkpoint = TranscriptionCheckpoint.from_session(session, reason=reason)
     db.session.add(checkpoint)
     
     # Pausar a sessão
@@ -213,6 +414,7 @@ def end_session(current_user, session_id):
         return jsonify({'success': False, 'error': 'Não autorizado'}), 403
     
     session.end()
+    notify_transcript_changed(session_id)
     
     return jsonify({
         'success': True,
@@ -232,11 +434,16 @@ def generate_quiz(current_user, session_id):
     Body:
     {
         "num_questions": int (1-20, default 5),
-        "time_limit": int (seconds, default 60 per question)
+        "time_limit": int (seconds, default 60 per question),
+        "mode": "full" | "incremental" (default "full")
     }
-    """
-    from app.services.ai_service import generate_quiz
     
+    No modo incremental só o texto novo desde o último checkpoint é enviado à IA,
+    junto com um resumo compacto (cacheado) das partes anteriores.
+    
+    Com "async": true (ou ?async=1) responde 202 com o id do job em vez de esperar a IA.
+    Com "fresh": true (ou ?fresh=1) gera de novo, ignorando o cache de respostas da IA.
+    """
     session = TranscriptionSession.query.get(session_id)
     
     if not session:
@@ -251,20 +458,50 @@ def generate_quiz(current_user, session_id):
     data = request.get_json() or {}
     num_questions = min(max(data.get('num_questions', 5), 1), 20)
     time_limit = data.get('time_limit', num_questions * 60)  # Default: 1 minute per question
+    mode = data.get('mode', 'full')
+    
+    use_cache = not _wants_fresh(data)
+    
+    if _wants_async(data):
+        job = submit_job('generate_quiz', current_user.id, _generate_quiz_activity,
+                         session_id, num_questions, time_limit, mode, use_cache)
+        return _job_accepted(job)
+    
+    payload, status_code = _generate_quiz_activity(session_id, num_questions, time_limit, mode, use_cache)
+    return jsonify(payload), status_code
+
+
+def _generate_quiz_activity(session_id, num_questions, time_limit, mode='full', use_cache=True):
+    """Cria o checkpoint, gera o quiz via IA e salva a atividade. Retorna (payload, status)"""
+    from app.services.ai_service import generate_quiz
+    
+    session = TranscriptionSession.query.get(session_id)
+    
+    previous_checkpoint = None
+    if mode == 'incremental':
+        previous_checkpoint = TranscriptionCheckpoint.query.filter(
+            TranscriptionCheckpoint.session_id == session_id,
+            TranscriptionCheckpoint.transcript_offset.isnot(None)
+        ).order_by(TranscriptionCheckpoint.id.desc()).first()
     
     # Criar checkpoint antes da atividade
-    checkpoint = TranscriptionCheckpoint(
-        session_id=session_id,
-        transcript_at_checkpoint=session.full_transcript,
-        word_count=session.word_count,
-        reason='quiz'
-    )
+    checkpoint = TranscriptionCheckpoint.from_session(session, reason='quiz')
     db.session.add(checkpoint)
     db.session.flush()
     
+    quiz_source = session.full_transcript
+    context_digest = None
+    if previous_checkpoint:
+        quiz_source = session.transcript_range(previous_checkpoint.transcript_offset, checkpoint.transcript_offset)
+        if len(quiz_source.strip()) < 5:
+            db.session.rollback()
+            return {'success': False, 'error': 'Pouco conteúdo novo desde o último checkpoint para gerar quiz'}, 400
+        context_digest = _checkpoint_digest(previous_checkpoint, session, use_cache)
+    
     try:
         # Gerar quiz via IA (retorna JSON string)
-        quiz_text = generate_quiz(session.full_transcript, session.title, num_questions)
+        quiz_text = generate_quiz(quiz_source, session.title, num_questions, context_digest=context_digest,
+                                  use_cache=use_cache)
         
         # Tentar fazer parse do JSON
         import json
@@ -295,24 +532,71 @@ def generate_quiz(current_user, session_id):
         session.status = 'paused'
         db.session.commit()
         
-        return jsonify({
+        if mode == 'incremental':
+            # O próximo quiz incremental encontra o digest deste checkpoint pronto (uma chamada à IA, não duas)
+            run_in_background(_precompute_checkpoint_digest, checkpoint.id, use_cache)
+        
+        return {
             'success': True,
             'message': 'Quiz gerado com sucesso',
+            'mode': 'incremental' if previous_checkpoint else 'full',
             'activity': activity.to_dict(),
             'checkpoint': checkpoint.to_dict()
-        }), 201
+        }, 201
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'error': f'Erro ao gerar quiz: {str(e)}'}), 500
+        return {'success': False, 'error': f'Erro ao gerar quiz: {str(e)}'}, 500
+
+
+def _checkpoint_digest(checkpoint, session, use_cache=True):
+    """
+    Resumo compacto da aula até o checkpoint, cacheado em checkpoint.context_digest.
+    Parte do último checkpoint anterior que já tem digest, então cada chamada
+    só processa o texto novo. Normalmente já vem pronto de _precompute_checkpoint_digest;
+    calcular aqui (no request) é o fallback.
+    """
+    from app.services.ai_service import update_transcript_digest
+    
+    if checkpoint.context_digest:
+        return checkpoint.context_digest
+    
+    base = TranscriptionCheckpoint.query.filter(
+        TranscriptionCheckpoint.session_id == checkpoint.session_id,
+        TranscriptionCheckpoint.id < checkpoint.id,
+        TranscriptionCheckpoint.transcript_offset.isnot(None),
+        TranscriptionCheckpoint.transcript_offset <= checkpoint.transcript_offset,
+        TranscriptionCheckpoint.context_digest.isnot(None)
+    ).order_by(TranscriptionCheckpoint.id.desc()).first()
+    
+    base_digest = base.context_digest if base else ''
+    base_offset = base.transcript_offset if base else 0
+    new_text = session.transcript_range(base_offset, checkpoint.transcript_offset)
+    
+    digest = update_transcript_digest(base_digest, new_text, session.title, use_cache=use_cache)
+    if digest:
+        checkpoint.context_digest = digest
+    return digest or None
+
+
+def _precompute_checkpoint_digest(checkpoint_id, use_cache=True):
+    """Calcula em segundo plano o digest de um checkpoint recém-criado"""
+    checkpoint = TranscriptionCheckpoint.query.get(checkpoint_id)
+    if not checkpoint or checkpoint.context_digest or checkpoint.transcript_offset is None:
+        return
+    if _checkpoint_digest(checkpoint, checkpoint.session, use_cache):
+        db.session.commit()
 
 
 @transcription_bp.route('/sessions/<int:session_id>/generate-summary', methods=['POST'])
 @token_required
 def generate_summary(current_user, session_id):
-    """Gera resumo via IA baseado na transcrição"""
-    from app.services.ai_service import generate_summary
+    """
+    Gera resumo via IA baseado na transcrição
     
+    Com "async": true (ou ?async=1) responde 202 com o id do job em vez de esperar a IA.
+    Com "fresh": true (ou ?fresh=1) gera de novo, ignorando o cache de respostas da IA.
+    """
     session = TranscriptionSession.query.get(session_id)
     
     if not session:
@@ -324,19 +608,31 @@ def generate_summary(current_user, session_id):
     if not session.full_transcript or len(session.full_transcript.strip()) < 5:
         return jsonify({'success': False, 'error': f'Transcrição muito curta para gerar resumo. Atual: {len(session.full_transcript.strip()) if session.full_transcript else 0} caracteres, mínimo: 5'}), 400
     
+    data = request.get_json(silent=True) or {}
+    use_cache = not _wants_fresh(data)
+    
+    if _wants_async(data):
+        job = submit_job('generate_summary', current_user.id, _generate_summary_activity, session_id, use_cache)
+        return _job_accepted(job)
+    
+    payload, status_code = _generate_summary_activity(session_id, use_cache)
+    return jsonify(payload), status_code
+
+
+def _generate_summary_activity(session_id, use_cache=True):
+    """Cria o checkpoint, gera o resumo via IA e salva a atividade. Retorna (payload, status)"""
+    from app.services.ai_service import generate_summary
+    
+    session = TranscriptionSession.query.get(session_id)
+    
     # Criar checkpoint
-    checkpoint = TranscriptionCheckpoint(
-        session_id=session_id,
-        transcript_at_checkpoint=session.full_transcript,
-        word_count=session.word_count,
-        reason='summary'
-    )
+    checkpoint = TranscriptionCheckpoint.from_session(session, reason='summary')
     db.session.add(checkpoint)
     db.session.flush()
     
     try:
         # Gerar resumo via IA (retorna string)
-        summary_text = generate_summary(session.full_transcript, session.title)
+        summary_text = generate_summary(session.full_transcript, session.title, use_cache=use_cache)
         
         # Criar atividade
         activity = LiveActivity(
@@ -354,17 +650,86 @@ def generate_summary(current_user, session_id):
         session.status = 'paused'
         db.session.commit()
         
-        return jsonify({
+        return {
             'success': True,
             'message': 'Resumo gerado',
             'activity': activity.to_dict(),
             'checkpoint': checkpoint.to_dict()
-        }), 201
+        }, 201
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'error': f'Erro ao gerar resumo: {str(e)}'}), 500
+        return {'success': False, 'error': f'Erro ao gerar resumo: {str(e)}'}, 500
+
+
+# ==================== JOBS ASSÍNCRONOS ====================
+
+JOB_STREAM_TIMEOUT = 300  # Duração máxima de um stream de job (segundos)
+JOB_STREAM_HEARTBEAT = 15  # Intervalo dos comentários de keep-alive
+
+
+def _wants_async(data):
+    """Modo assíncrono é opcional e pode ser desligado no servidor (AI_JOBS_ASYNC=false, ex: Vercel)"""
+    if not AI_JOBS_ASYNC:
+        return False
+    flag = data.get('async', request.args.get('async', ''))
+    return flag is True or str(flag).lower() in ('1', 'true', 'yes')
+
 
+def _wants_fresh(data):
+    """Gerar de novo ignorando o cache de respostas da IA (ex: botão "gerar novamente")"""
+    flag = data.get('fresh', request.args.get('fresh', ''))
+    return flag is True or str(flag).lower() in ('1', 'true', 'yes')
+
+
+def _job_accepted(job):
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('transcription.get_job', job_id=job.id),
+        'stream_url': url_for('transcription.stream_job', job_id=job.id)
+    }), 202
+
+
+@transcription_bp.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def get_job(current_user, job_id):
+    """Consulta o status/resultado de um job de IA (polling)"""
+    job = get_job_store().get(job_id)
+    
+    if not job or job.owner_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@transcription_bp.route('/jobs/<job_id>/stream', methods=['GET'])
+@token_required
+def stream_job(current_user, job_id):
+    """Stream (Server-Sent Events) das mudanças de status de um job até ele terminar"""
+    store = get_job_store()
+    job = store.get(job_id)
+    
+    if not job or job.owner_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    
+    def generate():
+        current = job
+        version = -1
+        deadline = time.monotonic() + JOB_STREAM_TIMEOUT
+        while current and time.monotonic() < deadline:
+            if current.version > version:
+                version = current.version
+                yield f"id: {version}\nevent: {current.status}\ndata: {json.dumps(current.to_dict())}\n\n"
+                if current.finished:
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            current = store.wait_for_update(job_id, version, JOB_STREAM_HEARTBEAT)
+    
+    db.session.close()
+    return _event_stream_response(generate())
 
 
 @transcription_bp.route('/sessions/<int:session_id>/save-generated-activity', methods=['POST'])
@@ -401,12 +766,7 @@ def save_generated_activity(current_user, session_id):
         time_limit = len(content['questions']) * 60
     
     # Criar checkpoint
-    checkpoint = TranscriptionCheckpoint(
-        session_id=session_id,
-        transcript_at_checkpoint=session.full_transcript or '',
-        word_count=session.word_count,
-        reason=activity_type
-    )
+    checkpoint = TranscriptionCheckpoint.from_session(session, reason=activity_type)
     db.session.add(checkpoint)
     db.session.flush()
     
@@ -475,12 +835,7 @@ def create_activity(current_user, session_id):
         question_text = question
     
     # Criar checkpoint
-    checkpoint = TranscriptionCheckpoint(
-        session_id=session_id,
-        transcript_at_checkpoint=session.full_transcript,
-        word_count=session.word_count,
-        reason='open_question'
-    )
+    checkpoint = TranscriptionCheckpoint.from_session(session, reason='open_question')
     db.session.add(checkpoint)
     db.session.flush()
     
@@ -550,6 +905,8 @@ def broadcast_activity(current_user, activity_id):
         activity.title = data['title']
     
     activity.broadcast()
+    schedule_activity(activity)
+    emit_activity_started(activity.id, activity.to_dict(include_content=False))
     
     # Contar alunos matriculados na disciplina
     enrolled_count = Enrollment.query.filter_by(
@@ -585,14 +942,11 @@ def broadcast_activity(current_user, activity_id):
                 'timestamp': datetime.utcnow().isoformat(),
                 'activity_id': activity.id # Referência útil
             }
+            PresentationSession.bump_version(presentation_session.id)
             db.session.commit()
 
-            # Polling: Polling detectará a mudança via timestamp
-            # try:
-            #     from app.services.websocket_service import emit_presentation_content
-            #     emit_presentation_content(presentation_session.code, presentation_session.current_content)
-            # except Exception as e:
-            #     pass
+            # Telas conectadas ao stream recebem na hora (o polling por timestamp continua funcionando)
+            emit_presentation_content(presentation_session.code, presentation_session.current_content)
 
     except Exception as e:
         print(f"[AUTO-SYNC] Falha ao sincronizar com apresentação: {e}")
@@ -649,14 +1003,11 @@ def share_summary(current_user, activity_id):
                 'timestamp': datetime.utcnow().isoformat(),
                 'activity_id': activity.id
             }
+            PresentationSession.bump_version(presentation_session.id)
             db.session.commit()
 
-            # Polling: Polling detectará a mudança via timestamp
-            # try:
-            #     from app.services.websocket_service import emit_presentation_content
-            #     emit_presentation_content(presentation_session.code, presentation_session.current_content)
-            # except Exception as e:
-            #     pass
+            # Telas conectadas ao stream recebem na hora (o polling por timestamp continua funcionando)
+            emit_presentation_content(presentation_session.code, presentation_session.current_content)
                 
     except Exception as e:
         print(f"[AUTO-SYNC] Falha ao sincronizar resumo: {e}")
@@ -681,7 +1032,14 @@ def end_activity(current_user, activity_id):
     if activity.session.teacher_id != current_user.id:
         return jsonify({'success': False, 'error': 'Não autorizado'}), 403
     
+    # Gravar o progresso parcial que ainda está em memória antes de encerrar
+    try:
+        end_activity_state(activity_id)
+    except Exception as e:
+        print(f"[LIVE STATE] Falha ao gravar progresso da atividade {activity_id}: {e}")
+    
     activity.end_activity()
+    emit_activity_ended(activity_id)
     
     return jsonify({
         'success': True,
@@ -719,6 +1077,7 @@ def update_activity(current_user, activity_id):
     # Atualizar conteúdo
     if 'content' in data:
         activity.content = data['content']
+        LiveActivity.bump_response_version(activity_id)
         # Atualizar também o ai_generated_content se for quiz
         if activity.activity_type == 'quiz':
             import json
@@ -741,197 +1100,263 @@ def update_activity(current_user, activity_id):
     })
 
 
+@transcription_bp.route('/activities/<int:activity_id>/rescore', methods=['POST'])
+@token_required
+def rescore_activity(current_user, activity_id):
+    """Recalcula a nota de todas as respostas do quiz (ex: após corrigir o gabarito)"""
+    activity = LiveActivity.query.get(activity_id)
+    
+    if not activity:
+        return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
+    
+    if activity.session.teacher_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+    
+    if activity.activity_type != 'quiz':
+        return jsonify({'success': False, 'error': 'Apenas quizzes podem ser recalculados'}), 400
+    
+    _flush_live_progress(activity_id)
+    responses = activity.rescore_responses()
+    db.session.commit()
+    # O ranking em memória é reconstruído na próxima leitura
+    end_activity_state(activity_id)
+    
+    return jsonify({
+        'success': True,
+        'message': f'{len(responses)} respostas recalculadas'
+    })
+
+
 @transcription_bp.route('/activities/<int:activity_id>/ranking', methods=['GET'])
 @token_required
 def get_ranking(current_user, activity_id):
     """
     Obtém ranking em tempo real para quiz (polling)
     Retorna lista COMPLETA de alunos matriculados e seus status
+    
+    O ranking é mantido ordenado em memória (live_state) e os alunos vêm do cache de matrículas;
+    use ?offset=&limit= para ler só uma página.
+    
+    ETag = versão do ranking em memória + matrículas + status/prazo: com If-None-Match igual,
+    responde 304 sem montar a página.
     """
-    activity = LiveActivity.query.get(activity_id)
+    session = db.session.query(TranscriptionSession.teacher_id, TranscriptionSession.subject_id)\
+        .join(LiveActivity, LiveActivity.session_id == TranscriptionSession.id)\
+        .filter(LiveActivity.id == activity_id).first()
     
-    if not activity:
+    if not session:
         return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
     
-    if activity.session.teacher_id != current_user.id:
+    if session.teacher_id != current_user.id:
         return jsonify({'success': False, 'error': 'Não autorizado'}), 403
     
-    # 1. Buscar todos os alunos matriculados
-    enrollments = Enrollment.query.filter_by(
-        subject_id=activity.session.subject_id
-    ).join(Enrollment.student).all()
+    state = get_leaderboard(activity_id)
+    roster = get_roster(session.subject_id)
+    
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    stop = offset + max(limit, 0) if limit is not None else None
     
-    # 2. Buscar todas as respostas existentes
-    responses = LiveActivityResponse.query.filter_by(activity_id=activity_id).all()
-    response_map = {r.student_id: r for r in responses}
+    etag = make_etag(
+        'ranking', activity_id, state.epoch, state.leaderboard.version, roster.fingerprint,
+        state.status, state.is_active, state.ends_at.isoformat() if state.ends_at else None, offset, limit
+    )
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    # 3. Construir lista combinada
-    full_ranking = []
+    activity = LiveActivity.query.get(activity_id)
     
-    for enrollment in enrollments:
-        student = enrollment.student
-        resp = response_map.get(student.id)
+    with state.lock:
+        leaderboard = state.leaderboard
         
-        if resp:
-            # Aluno já respondeu (ou começou)
-            rank_status = 'submitted' if resp.submitted_at else 'in_progress'
-            
-            full_ranking.append({
-                'student_id': student.id,
-                'student_name': student.name,
-                'status': rank_status,
-                'score': resp.score,
-                'total': resp.total,
-                'percentage': resp.percentage,
-                'is_correct': resp.is_correct,
-                'submitted_at': resp.submitted_at.isoformat() if resp.submitted_at else None
-            })
-        else:
-            # Aluno ainda não respondeu (Waiting Room)
-            full_ranking.append({
-                'student_id': student.id,
-                'student_name': student.name,
-                'status': 'waiting',
-                'score': 0,
-                'total': 0,
-                'percentage': 0,
-                'is_correct': None,
-                'submitted_at': None
-            })
-            
-    # 4. Ordenar: Quem respondeu primeiro (por nota), depois quem tá esperando (alfabético)
-    def sort_key(item):
-        if item['status'] == 'submitted':
-            # Prioridade 0 (topo), ordena por percentage decrescente
-            return (0, -item['percentage'], -item['score'])
-        elif item['status'] == 'in_progress':
-            # Prioridade 0.5 (meio), ordena por score parcial
-            return (0, -item['percentage'], -item['score'])
-        else:
-            # Prioridade 1 (fundo), ordena por nome
-            return (1, item['student_name'])
-            
-    full_ranking.sort(key=sort_key)
-    
-    # Adicionar posição apenas para quem já respondeu
-    current_rank = 1
-    for item in full_ranking:
-        if item['status'] == 'submitted':
-            item['position'] = current_rank
-            current_rank += 1
-        else:
-            item['position'] = None
+        # Quem respondeu/está respondendo (por nota), depois quem tá esperando (alfabético)
+        view = state.roster_view(roster)
+        
+        page = []
+        for item in view.page(offset, stop):
+            if isinstance(item, dict):
+                page.append(dict(
+                    item,
+                    student_name=roster.names[item['student_id']],
+                    position=leaderboard.position(item)
+                ))
+            else:
+                # Aluno ainda não respondeu (Waiting Room)
+                student_id, name = item
+                page.append({
+                    'student_id': student_id,
+                    'student_name': name,
+                    'status': 'waiting',
+                    'score': 0,
+                    'total': 0,
+                    'percentage': 0,
+                    'is_correct': None,
+                    'submitted_at': None,
+                    'position': None
+                })
+        
+        # Só matriculados (quem saiu da disciplina depois de responder não conta)
+        response_count = view.response_count
     
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
         'activity_status': activity.status,
         'time_remaining': activity.time_remaining if activity.is_active else 0,
-        'enrolled_count': len(enrollments),
-        'response_count': len(responses),
-        'response_rate': (len(responses) / len(enrollments) * 100) if len(enrollments) > 0 else 0,
-        'ranking': full_ranking
-    })
+        'enrolled_count': len(roster),
+        'response_count': response_count,
+        'response_rate': (response_count / len(roster) * 100) if len(roster) > 0 else 0,
+        'ranking': page
+    }), etag)
 
 
 # ==================== ROTAS PARA ALUNOS ====================
 
-@transcription_bp.route('/subjects/<int:subject_id>/active', methods=['GET'])
-@token_required
-def get_active_activity(current_user, subject_id):
+def _subject_live_state(subject_id):
     """
-    Aluno verifica se há atividade ativa na disciplina (polling)
+    Parte do /active comum a todos os alunos da disciplina: atividade ativa compartilhada
+    (a mais recente) ou, sem ela, o último resumo compartilhado. Calculado uma vez por versão.
     """
-    # Verificar matrícula
-    enrollment = Enrollment.query.filter_by(
-        student_id=current_user.id,
-        subject_id=subject_id
-    ).first()
+    if EXPIRY_INLINE:
+        expire_overdue_activities(subject_id)
     
-    if not enrollment and current_user.role != 'teacher':
-        return jsonify({'success': False, 'error': 'Não matriculado'}), 403
-    
-    # Buscar atividade ativa que foi compartilhada (pegar a mais recente)
+    # Vencida mas ainda não encerrada (o agendador encerra em seguida) já não conta como ativa
     activity = LiveActivity.query.join(TranscriptionSession)\
         .filter(
             TranscriptionSession.subject_id == subject_id,
             LiveActivity.status == 'active',
-            LiveActivity.shared_with_students == True
+            LiveActivity.shared_with_students == True,
+            or_(LiveActivity.ends_at.is_(None), LiveActivity.ends_at > datetime.utcnow())
         ).order_by(LiveActivity.created_at.desc()).first()
     
     if activity:
-        # Verificar se já respondeu
-        existing_response = LiveActivityResponse.query.filter_by(
-            activity_id=activity.id,
-            student_id=current_user.id
-        ).first()
+        activity_data = activity.to_dict(include_responses=False)
+        activity_data['subject_name'] = activity.session.subject.name if activity.session.subject else "Disciplina"
+        return {'activity': activity_data, 'summary': None}
+    
+    # Verificar resumo compartilhado (não precisa estar ativo)
+    summary = LiveActivity.query.join(TranscriptionSession)\
+        .filter(
+            TranscriptionSession.subject_id == subject_id,
+            LiveActivity.activity_type == 'summary',
+            LiveActivity.shared_with_students == True
+        ).order_by(LiveActivity.created_at.desc()).first()
+    
+    return {'activity': None, 'summary': summary.to_dict() if summary else None}
 
-        if existing_response and existing_response.submitted_at is not None:
-            # Se já respondeu FINALMENTE, não mostra como ativo para este aluno
-            return jsonify({
+
+def _subject_state(subject_id):
+    """(versão, estado, assinatura) da disciplina; a conexão do banco é devolvida ao pool logo após o cálculo"""
+    try:
+        return get_active_state_tagged(subject_id, lambda: _subject_live_state(subject_id))
+    finally:
+        db.session.close()
+
+
+def _student_active_payload(state, student_id, refresh_time=True):
+    """Resposta do /active para um aluno a partir do estado compartilhado da disciplina"""
+    activity = state['activity']
+    
+    if activity:
+        # Se já respondeu FINALMENTE, não mostra como ativo para este aluno. O estado ao vivo deste
+        # processo só confirma; a resposta pode ter sido enviada a outro processo, então o banco decide
+        live = get_live_state_store().get(activity['id'])
+        progress = live.progress.get(student_id) if live else None
+        answered = (progress is not None and progress.submitted) or db.session.query(LiveActivityResponse.id).filter(
+            LiveActivityResponse.activity_id == activity['id'],
+            LiveActivityResponse.student_id == student_id,
+            LiveActivityResponse.submitted_at.isnot(None)
+        ).first() is not None
+        if answered:
+            return {
                 'success': True,
                 'active': False,
                 'already_answered': True,
                 'activity': None
-            })
-        else:
-            # Se não respondeu ou só tem progresso parcial, mostra activity
-            # Se tiver partial, podemos passar previous answers se quisermos (TODO)
-             activity_data = activity.to_dict(include_responses=False)
-             activity_data['subject_name'] = activity.session.subject.name if activity.session.subject else "Disciplina"
-             
-             return jsonify({
-                 'success': True,
-                 'active': True,
-                 'activity': activity_data
-             })
-    
-    if not activity:
-        # Verificar resumo compartilhado (não precisa estar ativo)
-        summary = LiveActivity.query.join(TranscriptionSession)\
-            .filter(
-                TranscriptionSession.subject_id == subject_id,
-                LiveActivity.activity_type == 'summary',
-                LiveActivity.shared_with_students == True
-            ).order_by(LiveActivity.created_at.desc()).first()
+            }
         
-        if summary:
-            return jsonify({
-                'success': True,
-                'active': False,
-                'has_summary': True,
-                'summary': summary.to_dict()
-            })
+        # O estado fica em cache: o tempo restante é recalculado na hora da resposta
+        if refresh_time and activity.get('ends_at'):
+            ends_at = datetime.fromisoformat(activity['ends_at'])
+            activity = {**activity, 'time_remaining': max(0, int((ends_at - datetime.utcnow()).total_seconds()))}
         
-        return jsonify({
+        return {
             'success': True,
-            'active': False,
-            'activity': None
-        })
+            'active': True,
+            'activity': activity
+        }
     
-    # Verificar se tempo acabou
-    if not activity.is_active:
-        return jsonify({
+    if state['summary']:
+        return {
             'success': True,
             'active': False,
-            'activity': None
-        })
-    
-    # Verificar se já respondeu
-    existing_response = LiveActivityResponse.query.filter_by(
-        activity_id=activity.id,
-        student_id=current_user.id
-    ).first()
+            'has_summary': True,
+            'summary': state['summary']
+        }
     
-    return jsonify({
+    return {
         'success': True,
-        'active': True,
-        'already_answered': existing_response is not None,
-        'activity': activity.to_dict()
-    })
+        'active': False,
+        'activity': None
+    }
 
 
+@transcription_bp.route('/subjects/<int:subject_id>/active', methods=['GET'])
+@token_required
+def get_active_activity(current_user, subject_id):
+    """
+    Aluno verifica se há atividade ativa na disciplina (polling)
+    
+    Long-poll: envie ?version=<version da última resposta> e a requisição aguarda
+    (até ?wait=segundos, máx. ACTIVE_WAIT_SECONDS) uma mudança na disciplina antes de responder.
+    A espera e o estado da disciplina ficam em memória (ver subject_state).
+    
+    ETag = versão + assinatura do estado da disciplina + se o aluno já respondeu: com
+    If-None-Match igual, responde 304 sem corpo.
+    """
+    # Verificar matrícula
+    if current_user.role != 'teacher' and not is_enrolled(subject_id, current_user.id):
+        return jsonify({'success': False, 'error': 'Não matriculado'}), 403
+    
+    student_id = current_user.id
+    version = request.args.get('version', type=int)
+    if version is not None:
+        wait = min(request.args.get('wait', ACTIVE_WAIT_SECONDS, type=int), ACTIVE_WAIT_SECONDS)
+        # Não segurar a conexão do pool durante a espera
+        db.session.close()
+        wait_for_change(subject_id, version, max(wait, 0))
+    
+    version, state, tag = _subject_state(subject_id)
+    payload = _student_active_payload(state, student_id)
+    db.session.close()
+    
+    etag = make_etag('active', subject_id, version, tag, int(bool(payload.get('already_answered'))))
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    return with_etag(jsonify({**payload, 'version': version}), etag)
 
 
+@transcription_bp.route('/subjects/<int:subject_id>/active/stream', methods=['GET'])
+@token_required
+def stream_active_activity(current_user, subject_id):
+    """
+    Server-Sent Events com a resposta de /subjects/<id>/active
+    Envia o estado ao conectar e sempre que uma sessão/atividade da disciplina mudar.
+    """
+    if current_user.role != 'teacher' and not is_enrolled(subject_id, current_user.id):
+        return jsonify({'success': False, 'error': 'Não matriculado'}), 403
+    
+    student_id = current_user.id
+    db.session.close()
+    
+    def render(state):
+        payload = _student_active_payload(state, student_id, refresh_time=False)
+        db.session.close()
+        return payload
+    
+    return _event_stream_response(stream_active_state(subject_id, lambda: _subject_state(subject_id)[:2], render))
+
 
 @transcription_bp.route('/subjects/<int:subject_id>/history', methods=['GET'])
 @token_required
@@ -1008,64 +1433,29 @@ def get_student_history(current_user, subject_id):
 def update_activity_progress(current_user, activity_id):
     """
     Aluno envia progresso parcial (quiz) para LiveActivity
+    
+    O progresso fica no estado ao vivo em memória e é gravado em lotes (ver live_state);
+    a resposta final continua indo direto para o banco em /respond.
     """
     try:
-        activity = LiveActivity.query.get(activity_id)
+        state = get_activity_state(activity_id)
         
-        if not activity:
+        if not state:
             return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
         
-        if not activity.is_active:
+        if not state.is_active:
+            # Prazo vencido e ninguém encerrou ainda (sem a thread do agendador): encerra agora
+            expire_if_due(KIND_ACTIVITY, activity_id, state.status, state.ends_at)
             return jsonify({'success': False, 'error': 'Atividade encerrada'}), 400
             
         data = request.get_json() or {}
         answers = data.get('answers', {})
         
-        # Buscar ou criar resposta
-        response = LiveActivityResponse.query.filter_by(
-            activity_id=activity_id,
-            student_id=current_user.id
-        ).first()
-        
-        if not response:
-            response = LiveActivityResponse(
-                activity_id=activity_id,
-                student_id=current_user.id,
-                response_data={'answers': answers},
-                score=0,
-                submitted_at=None
-            )
-            db.session.add(response)
-        else:
-            # Merge answers if dealing with a quiz
-            if activity.activity_type == 'quiz':
-                current_data = response.response_data or {}
-                # Ensure current_data is a dict (handle potential None or corrupted data)
-                if not isinstance(current_data, dict):
-                     current_data = {}
-                     
-                current_answers = current_data.get('answers', {})
-                if not isinstance(current_answers, dict):
-                    current_answers = {}
-                
-                if isinstance(answers, dict):
-                    current_answers.update(answers)
-                    
-                current_data['answers'] = current_answers
-                response.response_data = current_data
-                
-                from sqlalchemy.orm.attributes import flag_modified
-                flag_modified(response, "response_data")
-            
-        # Calcular score parcial
-        if activity.activity_type == 'quiz':
-            response.calculate_quiz_score()
-            
-        db.session.commit()
+        progress = record_progress(state, current_user.id, answers)
         
         return jsonify({
             'success': True,
-            'points': response.score * 100
+            'points': progress.score * 100
         })
     except Exception as e:
         db.session.rollback()
@@ -1073,6 +1463,14 @@ def update_activity_progress(current_user, activity_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _flush_live_progress(activity_id):
+    """Grava o progresso parcial pendente antes de ler as respostas do banco"""
+    try:
+        flush_activity(activity_id)
+    except Exception as e:
+        print(f"[LIVE STATE] Falha ao gravar progresso da atividade {activity_id}: {e}")
+
+
 @transcription_bp.route('/activities/<int:activity_id>/respond', methods=['POST'])
 @token_required
 def submit_response(current_user, activity_id):
@@ -1084,22 +1482,14 @@ def submit_response(current_user, activity_id):
         if not activity:
             return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
         
+        # Prazo vencido e ninguém encerrou ainda (sem a thread do agendador): encerra agora
+        if expire_if_due(KIND_ACTIVITY, activity.id, activity.status, activity.ends_at):
+            db.session.refresh(activity)
+        
         # Verificar se está ativa (exceto para read/confirm)
         if not activity.is_active and activity.activity_type == 'quiz':
              return jsonify({'success': False, 'error': 'Atividade encerrada'}), 400
         
-        existing = LiveActivityResponse.query.filter_by(
-            activity_id=activity_id,
-            student_id=current_user.id
-        ).first()
-        
-        if existing and existing.submitted_at is not None:
-            return jsonify({
-                'success': True,
-                'message': 'Resposta já enviada anteriormente',
-                'result': existing.to_dict()
-            })
-        
         data = request.get_json() or {}
         print(f"Data received: {data}")
         
@@ -1111,25 +1501,28 @@ def submit_response(current_user, activity_id):
         else:  # open_question
             response_data = {'text': data.get('text', '')}
         
-        if existing:
-            response = existing
-            response.response_data = response_data
-            response.submitted_at = datetime.utcnow()
-            from sqlalchemy.orm.attributes import flag_modified
-            flag_modified(response, "response_data")
-        else:
-            response = LiveActivityResponse(
-                activity_id=activity_id,
-                student_id=current_user.id,
-                response_data=response_data,
-                submitted_at=datetime.utcnow()
-            )
-            db.session.add(response)
+        try:
+            response, already_submitted = _store_final_response(activity, current_user.id, response_data)
+        except IntegrityError:
+            # O flush do progresso (outro processo) criou a linha do aluno ao mesmo tempo: grava nela
+            db.session.rollback()
+            response, already_submitted = _store_final_response(activity, current_user.id, response_data)
         
-        db.session.commit()
+        if already_submitted:
+            return jsonify({
+                'success': True,
+                'message': 'Resposta já enviada anteriormente',
+                'result': response.to_dict()
+            })
         
-        if activity.activity_type == 'quiz':
-            response.calculate_quiz_score()
+        mark_submitted(response)
+        emit_activity_response(activity_id, {
+            'student_id': current_user.id,
+            'student_name': current_user.name,
+            'score': response.score,
+            'total': response.total,
+            'percentage': response.percentage
+        })
         
         return jsonify({
             'success': True,
@@ -1144,54 +1537,68 @@ def submit_response(current_user, activity_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-@transcription_bp.route('/activities/<int:activity_id>/report', methods=['GET'])
-@token_required
-def get_activity_report(current_user, activity_id):
+def _store_final_response(activity, student_id, response_data):
     """
-    Professor obtém relatório detalhado da atividade (paridade com Quiz)
+    Grava a resposta final na linha única do aluno (criada pelo flush do progresso ou aqui).
+    Retorna (resposta, já_enviada); já_enviada = True quando havia uma resposta final antes.
     """
-    activity = LiveActivity.query.get(activity_id)
-    
-    if not activity:
-        return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
-    
-    if activity.session.teacher_id != current_user.id:
-        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+    existing = LiveActivityResponse.query.filter_by(
+        activity_id=activity.id,
+        student_id=student_id
+    ).first()
     
-    # Buscar todas as respostas
-    responses = LiveActivityResponse.query.filter_by(activity_id=activity_id)\
-        .order_by(LiveActivityResponse.percentage.desc())\
-        .all()
+    if existing and existing.submitted_at is not None:
+        return existing, True
     
-    # Contar matriculados
-    enrolled_count = Enrollment.query.filter_by(
-        subject_id=activity.session.subject_id
-    ).count()
+    if existing:
+        response = existing
+        response.response_data = response_data
+        response.submitted_at = datetime.utcnow()
+        from sqlalchemy.orm.attributes import flag_modified
+        flag_modified(response, "response_data")
+    else:
+        response = LiveActivityResponse(
+            activity_id=activity.id,
+            student_id=student_id,
+            response_data=response_data,
+            submitted_at=datetime.utcnow()
+        )
+        db.session.add(response)
     
-    # Calcular estatísticas
-    total_responses = len(responses)
-    avg_score = sum(r.percentage for r in responses) / total_responses if total_responses > 0 else 0
+    if activity.activity_type == 'quiz':
+        response.calculate_quiz_score()
     
-    # Top 3
-    top_students = [r.to_dict() for r in responses[:3]]
+    LiveActivity.bump_response_version(activity.id)
+    db.session.commit()
+    return response, False
+
+
+def _build_activity_report(activity, enrolled_count):
+    """
+    Calcula o relatório da atividade (usado pelo JSON do relatório e pela exportação em PDF).
+    Não inclui status/título: o relatório fica em cache até as respostas mudarem.
+    """
+    # Buscar ranking (a ordem define o top 3 e as posições do PDF)
+    responses = LiveActivityResponse.query.filter_by(activity_id=activity.id)\
+        .order_by(LiveActivityResponse.percentage.desc(), LiveActivityResponse.submitted_at.asc())\
+        .all()
     
-    # ========== PERFORMANCE DISTRIBUTION ==========
-    performance_distribution = {
-        'excellent': 0,    # 90-100%
-        'good': 0,         # 70-89%
-        'average': 0,      # 50-69%
-        'below_average': 0 # <50%
-    }
+    # Matriz alunos x questões montada uma vez; todas as métricas saem dela
+    analytics = activity_analytics(activity, responses)
+    total_responses = analytics.count
     
-    for response in responses:
-        if response.percentage >= 90:
-            performance_distribution['excellent'] += 1
-        elif response.percentage >= 70:
-            performance_distribution['good'] += 1
-        elif response.percentage >= 50:
-            performance_distribution['average'] += 1
-        else:
-            performance_distribution['below_average'] += 1
+    ranking = []
+    for i, response in enumerate(responses):
+        ranking.append({
+            'position': i + 1,
+            'student_id': response.student_id,
+            'student_name': response.student.name if response.student else 'Desconhecido',
+            'points': response.points if hasattr(response, 'points') and response.points else int(response.percentage),
+            'score': response.score,
+            'total': response.total,
+            'percentage': response.percentage,
+            'time_taken': response.time_taken if hasattr(response, 'time_taken') else 0,
+        })
     
     # ========== QUESTION ANALYTICS ==========
     question_analytics = []
@@ -1201,58 +1608,11 @@ def get_activity_report(current_user, activity_id):
     if activity.activity_type == 'quiz' and activity.content and 'questions' in activity.content:
         questions = activity.content['questions']
         
-        for i, question in enumerate(questions):
-            correct_count = 0
-            incorrect_count = 0
-            wrong_answers = {}
-            
-            for response in responses:
-                answers = response.response_data.get('answers', {})
-                
-                # Tentar encontrar resposta pelo ID (se houver) ou pelo índice
-                q_id = str(question.get('id', i))
-                student_answer = answers.get(q_id)
-                
-                # Fallback: tentar pelo índice string se não achou pelo ID
-                if student_answer is None and q_id != str(i):
-                    student_answer = answers.get(str(i))
-                
-                if student_answer is not None:
-                    # Comparar convertendo para int
-                    try:
-                        ans_int = int(student_answer)
-                        correct_int = int(question.get('correct'))
-                        
-                        if ans_int == correct_int:
-                            correct_count += 1
-                        else:
-                            incorrect_count += 1
-                            wrong_answers[ans_int] = wrong_answers.get(ans_int, 0) + 1
-                    except (ValueError, TypeError):
-                        pass
-            
-            total_answers = correct_count + incorrect_count
-            correct_rate = (correct_count / total_answers * 100) if total_answers > 0 else 0
-            
-            # Determinar dificuldade
-            if correct_rate >= 70:
-                difficulty = 'easy'
-            elif correct_rate >= 40:
-                difficulty = 'medium'
-            else:
-                difficulty = 'hard'
-            
-            # Resposta errada mais comum
-            most_common_wrong = max(wrong_answers.items(), key=lambda x: x[1])[0] if wrong_answers else None
-            
+        for i, (question, stats) in enumerate(zip(questions, analytics.question_stats())):
             question_analytics.append({
                 'question_id': i,
                 'question_text': question.get('question', f'Questão {i+1}'),
-                'correct_count': correct_count,
-                'incorrect_count': incorrect_count,
-                'correct_rate': round(correct_rate, 1),
-                'difficulty_level': difficulty,
-                'most_common_wrong_answer': most_common_wrong
+                **stats
             })
         
         # Encontrar melhor e pior questão
@@ -1260,85 +1620,71 @@ def get_activity_report(current_user, activity_id):
             best_question = max(question_analytics, key=lambda x: x['correct_rate'])
             worst_question = min(question_analytics, key=lambda x: x['correct_rate'])
     
-    # ========== TIME ANALYTICS ==========
-    time_analytics = {
-        'average_completion_time': 0,
-        'fastest_completion': 0,
-        'slowest_completion': 0,
-        'median_time': 0
-    }
+    all_responses = [r.to_dict() for r in responses]
     
-    if responses:
-        times = [r.time_taken for r in responses if hasattr(r, 'time_taken') and r.time_taken > 0]
-        if times:
-            time_analytics['average_completion_time'] = round(sum(times) / len(times), 1)
-            time_analytics['fastest_completion'] = min(times)
-            time_analytics['slowest_completion'] = max(times)
-            
-            # Calcular mediana
-            sorted_times = sorted(times)
-            mid = len(sorted_times) // 2
-            if len(sorted_times) % 2 == 0:
-                time_analytics['median_time'] = (sorted_times[mid-1] + sorted_times[mid]) / 2
-            else:
-                time_analytics['median_time'] = sorted_times[mid]
-    
-    # ========== SCORE DISTRIBUTION ==========
-    score_ranges = [
-        {'min': 0, 'max': 20, 'count': 0},
-        {'min': 20, 'max': 40, 'count': 0},
-        {'min': 40, 'max': 60, 'count': 0},
-        {'min': 60, 'max': 80, 'count': 0},
-        {'min': 80, 'max': 100, 'count': 0}
-    ]
-    
-    for response in responses:
-        for range_item in score_ranges:
-            if range_item['min'] <= response.percentage < range_item['max'] or \
-               (range_item['max'] == 100 and response.percentage == 100):
-                range_item['count'] += 1
-                break
-    
-    # Adicionar porcentagens
-    for range_item in score_ranges:
-        range_item['percentage'] = round((range_item['count'] / total_responses * 100), 1) if total_responses > 0 else 0
-    
-    # ========== COMPARATIVE STATS ==========
-    percentages = [r.percentage for r in responses]
-    
-    # Calcular mediana
-    class_median = 0
-    if percentages:
-        sorted_percentages = sorted(percentages)
-        mid = len(sorted_percentages) // 2
-        if len(sorted_percentages) % 2 == 0:
-            class_median = (sorted_percentages[mid-1] + sorted_percentages[mid]) / 2
-        else:
-            class_median = sorted_percentages[mid]
-    
-    # Calcular moda
-    from collections import Counter
-    class_mode = 0
-    if percentages:
-        rounded_percentages = [round(p) for p in percentages]
-        counter = Counter(rounded_percentages)
-        class_mode = counter.most_common(1)[0][0] if counter else 0
-    
-    # Calcular desvio padrão
-    import math
-    standard_deviation = 0
-    if len(percentages) > 1:
-        mean = sum(percentages) / len(percentages)
-        variance = sum((x - mean) ** 2 for x in percentages) / len(percentages)
-        standard_deviation = math.sqrt(variance)
-    
-    comparative_stats = {
-        'class_median': round(class_median, 1),
-        'class_mode': class_mode,
-        'standard_deviation': round(standard_deviation, 1),
-        'participation_rate': round((total_responses / enrolled_count * 100), 1) if enrolled_count > 0 else 0
+    return {
+        'enrolled_count': enrolled_count,
+        'response_count': total_responses,
+        'response_rate': (total_responses / enrolled_count * 100) if enrolled_count > 0 else 0,
+        'average_score': round(analytics.average(), 1),
+        'top_students': all_responses[:3],
+        'all_responses': all_responses,
+        'ranking': ranking,
+        
+        # Análises avançadas
+        'performance_distribution': analytics.performance_distribution(),
+        'question_analytics': question_analytics,
+        'time_analytics': analytics.time_analytics(),
+        'score_ranges': analytics.score_ranges(with_label=True),
+        'comparative_stats': analytics.comparative_stats(enrolled_count),
+        
+        # Destaques
+        'best_question': {
+            'question': best_question['question_text'],
+            'correct_rate': best_question['correct_rate']
+        } if best_question else None,
+        'worst_question': {
+            'question': worst_question['question_text'],
+            'correct_rate': worst_question['correct_rate']
+        } if worst_question else None
     }
 
+
+def _activity_report_data(activity):
+    """
+    Relatório da atividade em cache, chaveado pela versão das respostas e pelo número de matriculados.
+    Envios, gravação do progresso ao vivo, recorreção e edição do conteúdo incrementam a versão.
+    """
+    _flush_live_progress(activity.id)
+    
+    # Contar matriculados
+    enrolled_count = Enrollment.query.filter_by(
+        subject_id=activity.session.subject_id
+    ).count()
+    
+    version = (activity.response_version or 0, enrolled_count)
+    return get_cached_report(
+        ('activity', activity.id), version,
+        lambda: _build_activity_report(activity, enrolled_count)
+    )
+
+
+@transcription_bp.route('/activities/<int:activity_id>/report', methods=['GET'])
+@token_required
+def get_activity_report(current_user, activity_id):
+    """
+    Professor obtém relatório detalhado da atividade (paridade com Quiz)
+    """
+    activity = LiveActivity.query.get(activity_id)
+    
+    if not activity:
+        return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
+    
+    if activity.session.teacher_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+    
+    data = _activity_report_data(activity)
+
     return jsonify({
         'success': True,
         'report': {
@@ -1349,29 +1695,23 @@ def get_activity_report(current_user, activity_id):
                 'status': activity.status,
                 'question_count': len(activity.content.get('questions', [])) if activity.content else 0
             },
-            'enrolled_count': enrolled_count,
-            'response_count': total_responses,
-            'response_rate': (total_responses / enrolled_count * 100) if enrolled_count > 0 else 0,
-            'average_score': round(avg_score, 1),
-            'top_students': top_students,
-            'all_responses': [r.to_dict() for r in responses],
+            'enrolled_count': data['enrolled_count'],
+            'response_count': data['response_count'],
+            'response_rate': data['response_rate'],
+            'average_score': data['average_score'],
+            'top_students': data['top_students'],
+            'all_responses': data['all_responses'],
             
             # Análises avançadas
-            'performance_distribution': performance_distribution,
-            'question_analytics': question_analytics,
-            'time_analytics': time_analytics,
-            'score_distribution': {'ranges': score_ranges},
-            'comparative_stats': comparative_stats,
+            'performance_distribution': data['performance_distribution'],
+            'question_analytics': data['question_analytics'],
+            'time_analytics': data['time_analytics'],
+            'score_distribution': {'ranges': data['score_ranges']},
+            'comparative_stats': data['comparative_stats'],
             
             # Destaques
-            'best_question': {
-                'question': best_question['question_text'],
-                'correct_rate': best_question['correct_rate']
-            } if best_question else None,
-            'worst_question': {
-                'question': worst_question['question_text'],
-                'correct_rate': worst_question['correct_rate']
-            } if worst_question else None
+            'best_question': data['best_question'],
+            'worst_question': data['worst_question']
         }
     })
 
@@ -1394,112 +1734,17 @@ def export_activity_pdf(current_user, activity_id):
     if activity.session.teacher_id != current_user.id:
         return jsonify({'success': False, 'error': 'Não autorizado'}), 403
     
-    # Buscar ranking
-    responses = LiveActivityResponse.query.filter_by(activity_id=activity_id)\
-        .order_by(LiveActivityResponse.percentage.desc(), LiveActivityResponse.submitted_at.asc())\
-        .all()
-    
-    enrolled_count = Enrollment.query.filter_by(subject_id=activity.session.subject_id).count()
-    total_responses = len(responses)
-    
-    # Preparar dados do ranking
-    ranking = []
-    for i, response in enumerate(responses):
-        ranking.append({
-            'position': i + 1,
-            'student_id': response.student_id,
-            'student_name': response.student.name if response.student else 'Desconhecido',
-            'points': response.points if hasattr(response, 'points') and response.points else int(response.percentage),
-            'score': response.score,
-            'total': response.total,
-            'percentage': response.percentage,
-            'time_taken': response.time_taken if hasattr(response, 'time_taken') else 0,
-        })
-    
-    # ========== PERFORMANCE DISTRIBUTION ==========
-    performance_distribution = {
-        'excellent': 0,
-        'good': 0,
-        'average': 0,
-        'below_average': 0
-    }
-    
-    for response in responses:
-        if response.percentage >= 90:
-            performance_distribution['excellent'] += 1
-        elif response.percentage >= 70:
-            performance_distribution['good'] += 1
-        elif response.percentage >= 50:
-            performance_distribution['average'] += 1
-        else:
-            performance_distribution['below_average'] += 1
-    
-    # ========== QUESTION ANALYTICS ==========
-    question_analytics = []
-    if activity.activity_type == 'quiz' and activity.content and 'questions' in activity.content:
-        questions = activity.content['questions']
-        
-        for i, question in enumerate(questions):
-            correct_count = 0
-            incorrect_count = 0
-            
-            for response in responses:
-                answers = response.response_data.get('answers', {})
-                student_answer = answers.get(str(i))
-                if student_answer is not None:
-                    if student_answer == question.get('correct'):
-                        correct_count += 1
-                    else:
-                        incorrect_count += 1
-            
-            total_answers = correct_count + incorrect_count
-            correct_rate = (correct_count / total_answers * 100) if total_answers > 0 else 0
-            
-            question_analytics.append({
-                'question_text': question.get('question', f'Questão {i+1}'),
-                'correct_count': correct_count,
-                'incorrect_count': incorrect_count,
-                'correct_rate': round(correct_rate, 1),
-            })
-    
-    # ========== TIME ANALYTICS ==========
-    time_analytics = {
-        'average_completion_time': 0,
-        'fastest_completion': 0,
-        'slowest_completion': 0,
-    }
-    
-    if responses:
-        times = [r.time_taken for r in responses if hasattr(r, 'time_taken') and r.time_taken > 0]
-        if times:
-            time_analytics['average_completion_time'] = round(sum(times) / len(times), 1)
-            time_analytics['fastest_completion'] = min(times)
-            time_analytics['slowest_completion'] = max(times)
-    
-    # ========== SCORE DISTRIBUTION ==========
-    score_ranges = [
-        {'min': 0, 'max': 20, 'count': 0, 'label': '0-20%'},
-        {'min': 20, 'max': 40, 'count': 0, 'label': '20-40%'},
-        {'min': 40, 'max': 60, 'count': 0, 'label': '40-60%'},
-        {'min': 60, 'max': 80, 'count': 0, 'label': '60-80%'},
-        {'min': 80, 'max': 100, 'count': 0, 'label': '80-100%'}
-    ]
-    
-    for response in responses:
-        for range_item in score_ranges:
-            if range_item['min'] <= response.percentage < range_item['max'] or \
-               (range_item['max'] == 100 and response.percentage == 100):
-                range_item['count'] += 1
-                break
+    # Mesmo relatório (em cache) do /report
+    data = _activity_report_data(activity)
     
     ranking_data = {
-        'enrolled_count': enrolled_count,
-        'response_count': total_responses,
-        'ranking': ranking,
-        'performance_distribution': performance_distribution,
-        'question_analytics': question_analytics,
-        'time_analytics': time_analytics,
-        'score_distribution': score_ranges,
+        'enrolled_count': data['enrolled_count'],
+        'response_count': data['response_count'],
+        'ranking': data['ranking'],
+        'performance_distribution': data['performance_distribution'],
+        'question_analytics': data['question_analytics'],
+        'time_analytics': data['time_analytics'],
+        'score_distribution': data['score_ranges'],
     }
     
     # Preparar dados da atividade
@@ -1533,15 +1778,66 @@ def export_activity_pdf(current_user, activity_id):
 @transcription_bp.route('/subjects/<int:subject_id>/sessions', methods=['GET'])
 @token_required
 def list_sessions(current_user, subject_id):
-    """Lista todas as sessões de transcrição de uma disciplina"""
+    """
+    Lista todas as sessões de transcrição de uma disciplina (sem o texto).
+    Use /sessions/<id>/transcript para baixar a transcrição.
+    """
     sessions = TranscriptionSession.query.filter_by(
         subject_id=subject_id,
         teacher_id=current_user.id
+    ).options(
+        defer(TranscriptionSession._full_transcript)
     ).order_by(TranscriptionSession.created_at.desc()).all()
     
     return jsonify({
         'success': True,
-        'sessions': [s.to_dict() for s in sessions]
+        'sessions': [s.to_summary_dict() for s in sessions]
+    })
+
+
+@transcription_bp.route('/subjects/<int:subject_id>/search', methods=['GET'])
+@token_required
+def search_sessions(current_user, subject_id):
+    """
+    Busca textual nas transcrições das sessões de uma disciplina
+    
+    Query params: q (termos), limit (padrão 20, máx. 50)
+    Retorna trechos ordenados por relevância com o offset na transcrição completa da sessão
+    (use /sessions/<id>/transcript?start=...&end=... para abrir o contexto). Resultados com
+    checkpoint_id vêm do snapshot congelado do checkpoint (offset no texto do snapshot).
+    """
+    from app.services.search_service import search_transcripts
+    
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'success': False, 'error': 'Informe o termo de busca (q)'}), 400
+    
+    limit = request.args.get('limit', 20, type=int)
+    
+    sessions = TranscriptionSession.query.filter_by(
+        subject_id=subject_id,
+        teacher_id=current_user.id
+    ).options(
+        defer(TranscriptionSession._full_transcript)
+    ).all()
+    sessions_by_id = {s.id: s for s in sessions}
+    
+    try:
+        results = search_transcripts(list(sessions_by_id), query, limit)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro na busca: {str(e)}")
+        return jsonify({'success': False, 'error': 'Índice de busca indisponível (execute migrate_transcript_search.py)'}), 503
+    
+    for result in results:
+        session = sessions_by_id[result['session_id']]
+        result['session_title'] = session.title
+        result['session_created_at'] = session.created_at.isoformat() if session.created_at else None
+    
+    return jsonify({
+        'success': True,
+        'query': query,
+        'results': results
     })
 
 
@@ -1802,13 +2098,29 @@ def generate_ai_summary_for_activity(current_user, activity_id):
     """
     Gera um resumo do assunto abordado na atividade usando IA.
     Útil para enviar como material de reforço.
+    
+    Com "async": true (ou ?async=1) responde 202 com o id do job em vez de esperar a IA.
     """
+    activity = LiveActivity.query.get(activity_id)
+    if not activity:
+        return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
+    
+    if _wants_async(request.get_json(silent=True) or {}):
+        job = submit_job('activity_ai_summary', current_user.id, _activity_review_summary, activity_id)
+        return _job_accepted(job)
+    
+    payload, status_code = _activity_review_summary(activity_id)
+    return jsonify(payload), status_code
+
+
+def _activity_review_summary(activity_id):
+    """Gera o material de revisão da atividade. Retorna (payload, status)"""
     try:
         from app.services.ai_service import generate_content_with_prompt
         
         activity = LiveActivity.query.get(activity_id)
         if not activity:
-            return jsonify({'success': False, 'error': 'Atividade não encontrada'}), 404
+            return {'success': False, 'error': 'Atividade não encontrada'}, 404
             
         # Construir o contexto base
         context_text = ""
@@ -1853,11 +2165,14 @@ O resumo deve:
 Gere um resumo que explique o assunto para que o aluno possa estudar e melhorar seu desempenho."""
 
         summary = generate_content_with_prompt(system_instruction, prompt)
+        if summary.startswith('Erro'):
+            # O serviço de IA devolve a falha como texto
+            return {'success': False, 'error': summary}, 502
         
-        return jsonify({
+        return {
             'success': True,
             'summary': summary
-        })
+        }, 200
     except Exception as e:
         import traceback
         error_msg = f"Erro ao gerar resumo IA: {str(e)}\n{traceback.format_exc()}"
@@ -1870,4 +2185,4 @@ Gere um resumo que explique o assunto para que o aluno possa estudar e melhorar
         except:
             pass
             
-        return jsonify({'success': False, 'error': f"Erro interno: {str(e)}"}), 200
+        return {'success': False, 'error': f"Erro interno: {str(e)}"}, 500
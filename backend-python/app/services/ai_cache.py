@@ -0,0 +1,206 @@
+"""
+Cache de respostas da IA endereçado pelo conteúdo
+A chave é o sha256 de (função, modelo, prompt/mensagens, parâmetros) da chamada à OpenAI: a mesma
+entrada não é cobrada nem esperada de novo (ex: professor clicando "gerar" duas vezes, quiz do
+mesmo checkpoint). Só respostas bem-sucedidas entram no cache.
+
+Camadas:
+- memória: LRU por processo (AI_CACHE_MEMORY_SIZE entradas)
+- persistente (AI_CACHE_BACKEND=database): tabela ai_response_cache, compartilhada entre processos
+  e reinícios, limitada a AI_CACHE_MAX_ROWS linhas (despeja as usadas há mais tempo). Usa uma
+  conexão própria: nunca faz commit da transação de quem chama.
+
+Para gerar de novo ignorando o cache, as funções do ai_service aceitam use_cache=False.
+Faltas simultâneas da mesma chave passam pelo single_flight (uma chamada à IA por chave).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.ai_response_cache import AIResponseCache
+from app.services.single_flight import get_single_flight, worker_lock
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+AI_CACHE_BACKEND = os.getenv('AI_CACHE_BACKEND', 'database').lower()  # database | memory
+AI_CACHE_MEMORY_SIZE = int(os.getenv('AI_CACHE_MEMORY_SIZE', 256))  # Entradas em memória por processo
+AI_CACHE_MAX_ROWS = int(os.getenv('AI_CACHE_MAX_ROWS', 5000))  # Linhas na tabela
+AI_CACHE_EVICT_EVERY = 50  # Gravações entre verificações do tamanho da tabela
+
+
+def cache_key(function, model, request):
+    """sha256 da requisição (json canônico: a ordem das chaves não muda a chave)"""
+    payload = json.dumps(
+        {'function': function, 'model': model, 'request': request},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DatabaseAICacheStore:
+    """Tabela ai_response_cache (conexão própria, uma transação curta por operação)"""
+
+    def __init__(self, max_rows=AI_CACHE_MAX_ROWS):
+        self.max_rows = max_rows
+        self.table = AIResponseCache.__table__
+        self._writes = 0
+
+    def get(self, key):
+        with db.engine.begin() as conn:
+            response = conn.execute(select(self.table.c.response).where(self.table.c.key == key)).scalar()
+            if response is not None:
+                conn.execute(
+                    update(self.table).where(self.table.c.key == key).values(last_used_at=datetime.utcnow())
+                )
+            return response
+
+    def put(self, key, function, model, response):
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(self.table.insert().values(
+                    key=key, function=function, model=model, response=response, created_at=now, last_used_at=now
+                ))
+        except IntegrityError:
+            # Outro processo gravou a mesma chave: mesma requisição, basta marcar o uso
+            with db.engine.begin() as conn:
+                conn.execute(update(self.table).where(self.table.c.key == key).values(last_used_at=now))
+
+        self._writes += 1
+        if self._writes % AI_CACHE_EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Mantém no máximo max_rows linhas (remove as usadas há mais tempo)"""
+        table = self.table
+        with db.engine.begin() as conn:
+            count = conn.execute(select(func.count()).select_from(table)).scalar()
+            if count <= self.max_rows:
+                return 0
+            cutoff = conn.execute(
+                select(table.c.last_used_at).order_by(table.c.last_used_at.desc()).offset(self.max_rows).limit(1)
+            ).scalar()
+            return conn.execute(delete(table).where(table.c.last_used_at <= cutoff)).rowcount
+
+    def clear(self):
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table))
+
+
+class AICache:
+    """LRU em memória na frente da camada persistente (opcional), com contadores de acerto"""
+
+    def __init__(self, store=None, memory_size=AI_CACHE_MEMORY_SIZE):
+        self.store = store
+        self.memory_size = memory_size
+        self._memory = OrderedDict()  # chave -> resposta
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'store_hits': 0, 'misses': 0, 'bypassed': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, key, response):
+        with self._lock:
+            self._memory[key] = response
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        """Memória, depois a camada persistente (None se não houver)"""
+        with self._lock:
+            response = self._memory.get(key)
+            if response is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return response
+
+        if self.store is not None:
+            try:
+                response = self.store.get(key)
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"[AI CACHE] Falha ao ler o cache persistente: {e}")
+            if response is not None:
+                self._count('store_hits')
+                self._remember(key, response)
+                return response
+        return None
+
+    def get_or_create(self, function, model, request, create, use_cache=True):
+        """
+        Resposta em cache para a requisição; create() só é chamado em caso de falta (ou bypass).
+        Faltas simultâneas da mesma chave são coalescidas: uma chamada à IA, o mesmo resultado para todos.
+        """
+        key = cache_key(function, model, request)
+        if not AI_CACHE_ENABLED or not use_cache:
+            self._count('bypassed')
+            # Sem cache, chamadas idênticas simultâneas ainda compartilham a mesma geração
+            return get_single_flight().do('fresh:' + key, create)
+
+        response = self._lookup(key)
+        if response is not None:
+            return response
+        return get_single_flight().do(key, lambda: self._create(function, model, key, create))
+
+    def _create(self, function, model, key, create):
+        """Chamada líder da chave (neste processo e, com o lock, entre workers)"""
+        with worker_lock(key):
+            # Outro líder (deste ou de outro worker) pode ter gravado enquanto esperávamos
+            response = self._lookup(key)
+            if response is not None:
+                return response
+
+            self._count('misses')
+            response = create()
+            if response:
+                self._remember(key, response)
+                if self.store is not None:
+                    try:
+                        self.store.put(key, function, model, response)
+                    except Exception as e:
+                        self._count('errors')
+                        logger.error(f"[AI CACHE] Falha ao gravar o cache persistente: {e}")
+            return response
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        stats['coalesced'] = get_single_flight().coalesced
+        hits = stats['memory_hits'] + stats['store_hits']
+        lookups = hits + stats['misses']
+        stats.update({
+            'enabled': AI_CACHE_ENABLED,
+            'backend': type(self.store).__name__ if self.store is not None else 'memory',
+            'hits': hits,
+            'hit_rate': hits / lookups if lookups else 0
+        })
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+
+_cache = AICache(DatabaseAICacheStore() if AI_CACHE_BACKEND == 'database' else None)
+
+
+def get_ai_cache():
+    return _cache
+
+
+def set_ai_cache(cache):
+    global _cache
+    _cache = cache
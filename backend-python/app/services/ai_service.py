@@ -4,45 +4,111 @@ Sistema de Transcrição - Geração de Resumos e Quizzes
 """
 import os
 from dotenv import load_dotenv
+from flask import current_app, has_app_context
 import openai
 from app import db
 from app.models.ai_session import AISession, AIMessage
 from app.models.system_setting import SystemSetting
+from app.services.ai_cache import get_ai_cache
+from app.services.prompt_budget import build_chat_prompt, CHAT_HISTORY_MESSAGES
+from app.services.context_index import select_context
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
+import logging
+import re
+import threading
+import time
 
 # Carregar .env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Configuração Padrão (Fallback)
 DEFAULT_MODEL = "gpt-4o-mini"
 
+# Resumo de aulas longas (map-reduce)
+SHORT_TEXT_WORDS = 300  # Até aqui usa o resumo direto
+SUMMARY_CHUNK_WORDS = int(os.getenv('AI_SUMMARY_CHUNK_WORDS', 1500))  # Palavras por bloco
+AI_MAX_WORKERS = int(os.getenv('AI_MAX_WORKERS', 4))  # Chamadas simultâneas à OpenAI
+
+# Configuração em cache (evita consultar SystemSetting a cada chamada)
+AI_CONFIG_TTL = int(os.getenv('AI_CONFIG_TTL', 60))  # Segundos (outros processos veem a mudança após o TTL)
+AI_CONFIG_KEYS = ('openai_api_key', 'ai_model')
+
+_config_cache = None  # (lido_em, (api_key, model))
+_clients = {}  # (api_key, model) -> openai.OpenAI
+_clients_lock = threading.Lock()
+
+
 def get_ai_config():
-    """Retorna a configuração atual de IA (Banco de Dados ou Env)"""
-    # Tentar buscar do banco
+    """Retorna a configuração atual de IA (Banco de Dados ou Env), em cache por AI_CONFIG_TTL segundos"""
+    global _config_cache
+    cached = _config_cache
+    if cached and time.monotonic() - cached[0] < AI_CONFIG_TTL:
+        return cached[1]
+    
+    # Tentar buscar do banco (uma consulta para as duas chaves)
     try:
-        api_key_setting = SystemSetting.query.get('openai_api_key')
-        model_setting = SystemSetting.query.get('ai_model')
-        
-        api_key = api_key_setting.value if api_key_setting else os.getenv('OPENAI_API_KEY', '')
-        model = model_setting.value if model_setting else DEFAULT_MODEL
-        
-        return api_key, model
+        settings = {
+            setting.key: setting.value
+            for setting in SystemSetting.query.filter(SystemSetting.key.in_(AI_CONFIG_KEYS)).all()
+        }
     except Exception:
-        # Fallback caso dê erro no banco (ex: durante migrações)
+        # Fallback caso dê erro no banco (ex: durante migrações); não fica em cache
         return os.getenv('OPENAI_API_KEY', ''), DEFAULT_MODEL
+    
+    api_key = settings['openai_api_key'] if 'openai_api_key' in settings else os.getenv('OPENAI_API_KEY', '')
+    model = settings['ai_model'] if 'ai_model' in settings else DEFAULT_MODEL
+    
+    _config_cache = (time.monotonic(), (api_key, model))
+    return api_key, model
+
 
-def get_client():
-    """Retorna uma instância do client OpenAI configurada"""
-    api_key, _ = get_ai_config()
+def invalidate_ai_config():
+    """Descarta a configuração em cache e os clients de chaves/modelos antigos (chamado ao salvar a configuração)"""
+    global _config_cache
+    _config_cache = None
+    with _clients_lock:
+        _clients.clear()
+
+
+def get_client(api_key=None, model_name=None):
+    """
+    Retorna o client OpenAI do processo para (api_key, model)
+    O client é reutilizado entre chamadas e threads, mantendo o pool de conexões keep-alive.
+    """
+    if api_key is None:
+        api_key, model_name = get_ai_config()
     if not api_key:
         return None
-    return openai.OpenAI(api_key=api_key)
+    
+    key = (api_key, model_name)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = openai.OpenAI(api_key=api_key)
+    return client
+
+def _complete(function: str, client, use_cache: bool = True, **request) -> str:
+    """
+    Chamada à OpenAI (chat.completions) passando pelo cache de respostas (ai_cache)
+    A chave é (função, modelo, mensagens, parâmetros); só respostas bem-sucedidas ficam em cache.
+    """
+    def create():
+        response = client.chat.completions.create(**request)
+        return response.choices[0].message.content
+    
+    return get_ai_cache().get_or_create(function, request.get('model'), request, create, use_cache)
 
-def generate_content_with_prompt(system_instruction: str, prompt: str, json_mode: bool = False) -> str:
-    """Gera conteúdo genérico com prompts personalizados via OpenAI"""
+
+def generate_content_with_prompt(system_instruction: str, prompt: str, json_mode: bool = False, use_cache: bool = True) -> str:
+    """Gera conteúdo genérico com prompts personalizados via OpenAI (use_cache=False ignora o cache)"""
     api_key, model_name = get_ai_config()
-    client = get_client()
+    client = get_client(api_key, model_name)
     
     if not client:
         return "Erro: OPENAI_API_KEY não configurada."
@@ -60,18 +126,17 @@ def generate_content_with_prompt(system_instruction: str, prompt: str, json_mode
         if json_mode:
             kwargs["response_format"] = { "type": "json_object" }
             
-        response = client.chat.completions.create(**kwargs)
-        return response.choices[0].message.content
+        return _complete('generate_content_with_prompt', client, use_cache, **kwargs)
     except Exception as e:
         return f"Erro na geração AI: {str(e)}"
 
 
-def generate_summary(text: str, subject_name: str = "Aula") -> str:
+def generate_summary(text: str, subject_name: str = "Aula", use_cache: bool = True) -> str:
     """
-    Gera um resumo do texto transcrito usando OpenAI
+    Gera um resumo do texto transcrito usando OpenAI (use_cache=False ignora o cache)
     """
     api_key, model_name = get_ai_config()
-    client = get_client()
+    client = get_client(api_key, model_name)
 
     if not client:
         return "Erro: OPENAI_API_KEY não configurada."
@@ -79,7 +144,7 @@ def generate_summary(text: str, subject_name: str = "Aula") -> str:
     try:
         # Lógica Adaptativa baseada no tamanho do texto
         word_count = len(text.split())
-        is_long_text = word_count > 300
+        is_long_text = word_count > SHORT_TEXT_WORDS
         
         system_instruction = """Você é um assistente educacional especializado em criar resumos.
 Sua tarefa é criar um resumo claro, objetivo e bem estruturado do conteúdo fornecido.
@@ -113,14 +178,28 @@ Como o texto é curto, você deve:
 3. Não use tópicos, prefira texto corrido (parágrafos).
 4. Resuma o que foi dito de forma clara."""
 
+        chunks = _split_into_chunks(text) if is_long_text else [text]
+        
+        if len(chunks) > 1:
+            # Map: resume cada bloco em paralelo; Reduce: o resumo final parte dos parciais
+            partial_summaries = _summarize_chunks(client, model_name, chunks, subject_name, use_cache)
+            source_label = "Resumos parciais da aula, em ordem cronológica"
+            source_text = "\n\n".join(
+                f"[Parte {i + 1}]\n{partial}" for i, partial in enumerate(partial_summaries)
+            )
+        else:
+            source_label = "Texto da Transcrição"
+            source_text = text
+        
         prompt = f"""{prompt_instruction}
 
-Texto da Transcrição:
-{text}
+{source_label}:
+{source_text}
 
 Resumo:"""
         
-        response = client.chat.completions.create(
+        return _complete(
+            'generate_summary', client, use_cache,
             model=model_name,
             messages=[
                 {"role": "system", "content": system_instruction},
@@ -128,19 +207,96 @@ Resumo:"""
             ],
             temperature=0.7
         )
-        
-        return response.choices[0].message.content
     
     except Exception as e:
         return f"Erro ao gerar resumo: {str(e)}"
 
 
-def generate_quiz(text: str, subject_name: str = "Aula", num_questions: int = 20) -> str:
+def _split_into_chunks(text: str, max_words: int = SUMMARY_CHUNK_WORDS) -> list[str]:
+    """
+    Divide o texto em blocos de até max_words palavras, quebrando no fim das frases.
+    Frases maiores que o bloco (transcrição sem pontuação) são cortadas por palavras.
+    """
+    sentences = re.split(r'(?<=[.!?…])\s+', text.strip())
+    
+    chunks = []
+    current = []
+    current_words = 0
+    
+    for sentence in sentences:
+        words = sentence.split()
+        if not words:
+            continue
+        
+        pieces = [words[i:i + max_words] for i in range(0, len(words), max_words)]
+        for piece in pieces:
+            if current and current_words + len(piece) > max_words:
+                chunks.append(' '.join(current))
+                current = []
+                current_words = 0
+            current.append(' '.join(piece))
+            current_words += len(piece)
+    
+    if current:
+        chunks.append(' '.join(current))
+    
+    return chunks
+
+
+def _summarize_chunks(client, model_name: str, chunks: list[str], subject_name: str, use_cache: bool = True) -> list[str]:
+    """Resume os blocos da transcrição em paralelo (pool limitado), mantendo a ordem"""
+    system_instruction = """Você é um assistente educacional que extrai os pontos principais de trechos de aulas.
+Liste de forma objetiva os conceitos, definições, exemplos e conclusões apresentados no trecho.
+Use apenas texto simples, sem markdown. Responda sempre em português brasileiro."""
+    
+    def summarize(index: int, chunk: str) -> str:
+        prompt = f"""Trecho {index + 1} de {len(chunks)} da transcrição de uma aula de {subject_name}.
+Extraia os pontos principais deste trecho em até 150 palavras.
+
+Trecho:
+{chunk}
+
+Pontos principais:"""
+        
+        return _complete(
+            'summarize_chunk', client, use_cache,
+            model=model_name,
+            messages=[
+                {"role": "system", "content": system_instruction},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3
+        )
+    
+    # As threads do pool não herdam o app context: sem ele o cache no banco (db.engine) falha
+    # em cada bloco e todos viram chamadas à IA. Cada worker entra no contexto do app de quem chamou.
+    app = current_app._get_current_object() if has_app_context() else None
+    
+    def summarize_in_app(index: int, chunk: str) -> str:
+        if app is None:
+            return summarize(index, chunk)
+        with app.app_context():
+            try:
+                return summarize(index, chunk)
+            finally:
+                db.session.remove()
+    
+    max_workers = max(1, min(AI_MAX_WORKERS, len(chunks)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(summarize_in_app, range(len(chunks)), chunks))
+
+
+def generate_quiz(text: str, subject_name: str = "Aula", num_questions: int = 20, context_digest: str = None,
+                  use_cache: bool = True) -> str:
     """
     Gera um quiz baseado no texto transcrito usando OpenAI
+    
+    Se context_digest for informado, text contém apenas o trecho novo da aula e o
+    digest resume as partes anteriores (usado só como contexto).
+    use_cache=False ignora o cache de respostas (gera de novo).
     """
     api_key, model_name = get_ai_config()
-    client = get_client()
+    client = get_client(api_key, model_name)
 
     if not client:
         return "Erro: OPENAI_API_KEY não configurada."
@@ -183,7 +339,14 @@ TRANSCRIÇÃO DA AULA:
 
 Retorne apenas o JSON com as questões sobre o conteúdo educacional."""
 
-        response = client.chat.completions.create(
+        if context_digest:
+            prompt = f"""CONTEXTO - resumo das partes anteriores da aula (use apenas para entender o trecho novo, NÃO crie perguntas sobre ele):
+{context_digest}
+
+{prompt.replace('TRANSCRIÇÃO DA AULA:', 'TRECHO NOVO DA TRANSCRIÇÃO (crie as perguntas sobre ele):')}"""
+
+        return _complete(
+            'generate_quiz', client, use_cache,
             model=model_name,
             messages=[
                 {"role": "system", "content": system_instruction},
@@ -192,19 +355,60 @@ Retorne apenas o JSON com as questões sobre o conteúdo educacional."""
             response_format={ "type": "json_object" },
             temperature=0.5
         )
-        
-        return response.choices[0].message.content
     
     except Exception as e:
         return f"Erro ao gerar quiz: {str(e)}"
 
 
-def format_to_quiz_json(text: str) -> str:
+def update_transcript_digest(previous_digest: str, new_text: str, subject_name: str = "Aula",
+                             use_cache: bool = True) -> str:
+    """
+    Atualiza o resumo compacto (digest) de uma aula com um trecho novo da transcrição.
+    O tamanho do digest é limitado, então o custo não cresce com a duração da aula.
+    Retorna string vazia em caso de erro.
+    """
+    api_key, model_name = get_ai_config()
+    client = get_client(api_key, model_name)
+    
+    if not client or not new_text.strip():
+        return previous_digest or ''
+    
+    try:
+        system_instruction = """Você mantém um resumo compacto e cumulativo de uma aula em andamento.
+Combine o resumo anterior com o trecho novo em no máximo 200 palavras, listando apenas os conceitos e tópicos já ensinados.
+Use apenas texto simples, sem markdown. Responda sempre em português brasileiro."""
+        
+        prompt = f"""Aula de {subject_name}.
+
+RESUMO ANTERIOR:
+{previous_digest or '(vazio)'}
+
+TRECHO NOVO DA TRANSCRIÇÃO:
+{new_text}
+
+Resumo atualizado:"""
+        
+        return _complete(
+            'update_transcript_digest', client, use_cache,
+            model=model_name,
+            messages=[
+                {"role": "system", "content": system_instruction},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3
+        )
+    
+    except Exception as e:
+        logger.error(f"Erro ao atualizar digest da aula: {e}")
+        return ''
+
+
+def format_to_quiz_json(text: str, use_cache: bool = True) -> str:
     """
     Formata um texto que JÁ É um quiz para JSON, sem alterar o conteúdo.
     """
     api_key, model_name = get_ai_config()
-    client = get_client()
+    client = get_client(api_key, model_name)
 
     if not client:
         return "Erro: OPENAI_API_KEY não configurada."
@@ -236,7 +440,8 @@ Formato de Saída (JSON puro):
 
 JSON:"""
         
-        response = client.chat.completions.create(
+        return _complete(
+            'format_to_quiz_json', client, use_cache,
             model=model_name,
             messages=[
                 {"role": "system", "content": system_instruction},
@@ -245,8 +450,6 @@ JSON:"""
             response_format={ "type": "json_object" },
             temperature=0.1
         )
-        
-        return response.choices[0].message.content
     
     except Exception as e:
         return f"Erro ao formatar quiz: {str(e)}"
@@ -271,9 +474,9 @@ def create_or_get_session(teacher_id: int, subject_id: int) -> AISession:
     return session
 
 
-def _prepare_ai_context(teacher_id: int, subject_id: int):
-    """Prepara a sessão e o contexto para o chat"""
-    api_key, _ = get_ai_config()
+def _prepare_ai_context(teacher_id: int, subject_id: int, message: str):
+    """Prepara a sessão e as mensagens do chat (dentro do orçamento de tokens, ver prompt_budget)"""
+    api_key, model_name = get_ai_config()
     
     if not api_key:
         raise Exception("API Key não configurada")
@@ -297,12 +500,9 @@ IMPORTANTE: NÃO USE NENHUMA FORMATAÇÃO MARKDOWN.
 
 Se tiver acesso a documentos abaixo, use-os como fonte principal."""
 
-    system_context = ""
-    if context_files:
-        system_context = "\n\nVocê tem acesso aos seguintes documentos para responder:\n\n"
-        for file in context_files:
-            system_context += f"--- DOCUMENTO: {file.filename} ---\n{file.content}\n----------------\n\n"
-        system_context += """
+    documents_intro = "\n\nVocê tem acesso aos seguintes documentos (trechos relevantes para a pergunta) para responder:\n\n"
+    document_template = "--- DOCUMENTO: {filename} ---\n{content}\n----------------\n\n"
+    documents_rules = """
 ATENÇÃO - REGRA CRÍTICA:
 1. Você deve basear sua resposta EXCLUSIVAMENTE nos textos delimitados acima como 'DOCUMENTO'.
 2. O histórico de conversa serve apenas para manter o contexto do diálogo (perguntas anteriores/resoluções).
@@ -313,45 +513,55 @@ ATENÇÃO - REGRA CRÍTICA:
     # Recuperar histórico
     history_msgs = AIMessage.query.filter_by(session_id=session.id)\
         .order_by(AIMessage.created_at.desc())\
-        .limit(20)\
+        .limit(CHAT_HISTORY_MESSAGES)\
         .all()
     history_msgs.reverse()
     
-    messages = [{"role": "system", "content": system_initial_instruction + system_context}]
-    
-    for msg in history_msgs:
-        role = "user" if msg.role == "user" else "assistant"
-        messages.append({"role": role, "content": msg.content})
+    # Injetar lembrete de contexto na mensagem do usuário
+    files_list = [f.filename for f in context_files] if context_files else []
+    if files_list:
+        files_str = ", ".join(files_list)
+        system_injection = f"\n\n[SISTEMA: Responda APENAS com base nos arquivos ativos: {files_str}. Ignore qualquer arquivo mencionado no histórico que não esteja nesta lista exata.]"
+    else:
+        system_injection = "\n\n[SISTEMA: NENHUM arquivo anexado atualmente. Se o usuário perguntar sobre documentos antigos, informe que eles não estão mais disponíveis.]"
+
+    # Só os trechos dos documentos relevantes para a pergunta (índice BM25 da sessão)
+    documents = select_context(session.id, context_files, message) if context_files else []
+
+    messages, prompt_tokens = build_chat_prompt(
+        system_initial_instruction,
+        documents,
+        [("user" if msg.role == "user" else "assistant", msg.content) for msg in history_msgs],
+        message + system_injection,
+        model=model_name,
+        documents_intro=documents_intro,
+        documents_rules=documents_rules,
+        document_template=document_template
+    )
+    logger.info(
+        f"[PROMPT] Sessão {session.id}: {prompt_tokens['total']}/{prompt_tokens['budget']} tokens "
+        f"(sistema {prompt_tokens['system']}, documentos {prompt_tokens['documents']}, "
+        f"histórico {prompt_tokens['history']}, pergunta {prompt_tokens['user']}; "
+        f"{prompt_tokens['history_dropped']} mensagens antigas fora, "
+        f"{len(prompt_tokens['documents_truncated'])} documentos truncados, {prompt_tokens['tokenizer']})"
+    )
         
-    return session, messages, context_files
+    return session, messages, context_files, prompt_tokens
 
 
 def chat_with_ai(teacher_id: int, subject_id: int, message: str) -> str:
     """Processa mensagem no chat e retorna resposta completa usando OpenAI"""
     api_key, model_name = get_ai_config()
-    client = get_client()
+    client = get_client(api_key, model_name)
 
     try:
         from app.models.ai_session import AIMessage
-        session, messages, context_files = _prepare_ai_context(teacher_id, subject_id)
+        session, messages, _, _ = _prepare_ai_context(teacher_id, subject_id, message)
         
         # Salvar mensagem do usuário
         user_msg = AIMessage(session_id=session.id, role='user', content=message)
         db.session.add(user_msg)
         
-        # Injetar lembrete de contexto na última mensagem user
-        files_list = [f.filename for f in context_files] if context_files else []
-        if files_list:
-            files_str = ", ".join(files_list)
-            system_injection = f"\n\n[SISTEMA: Responda APENAS com base nos arquivos ativos: {files_str}. Ignore qualquer arquivo mencionado no histórico que não esteja nesta lista exata.]"
-            message_to_send = message + system_injection
-        else:
-             system_injection = "\n\n[SISTEMA: NENHUM arquivo anexado atualmente. Se o usuário perguntar sobre documentos antigos, informe que eles não estão mais disponíveis.]"
-             message_to_send = message + system_injection
-
-        # Append user message to history provided to AI
-        messages.append({"role": "user", "content": message_to_send})
-        
         response = client.chat.completions.create(
             model=model_name,
             messages=messages,
@@ -374,29 +584,17 @@ chat_with_gemini = chat_with_ai
 def chat_stream(teacher_id: int, subject_id: int, message: str):
     """Gera resposta em stream usando OpenAI"""
     api_key, model_name = get_ai_config()
-    client = get_client()
+    client = get_client(api_key, model_name)
 
     try:
         from app.models.ai_session import AIMessage
-        session, messages, context_files = _prepare_ai_context(teacher_id, subject_id)
+        session, messages, _, _ = _prepare_ai_context(teacher_id, subject_id, message)
         
         # Salvar mensagem do usuário
         user_msg = AIMessage(session_id=session.id, role='user', content=message)
         db.session.add(user_msg)
         db.session.commit() # Commit user msg before streaming
         
-        # Injetar lembrete
-        files_list = [f.filename for f in context_files] if context_files else []
-        if files_list:
-            files_str = ", ".join(files_list)
-            system_injection = f"\n\n[SISTEMA: Responda APENAS com base nos arquivos ativos: {files_str}. Ignore qualquer arquivo mencionado no histórico que não esteja nesta lista exata.]"
-            message_to_send = message + system_injection
-        else:
-             system_injection = "\n\n[SISTEMA: NENHUM arquivo anexado atualmente. Se o usuário perguntar sobre documentos antigos, informe que eles não estão mais disponíveis.]"
-             message_to_send = message + system_injection
-
-        messages.append({"role": "user", "content": message_to_send})
-
         response = client.chat.completions.create(
             model=model_name,
             messages=messages,
@@ -421,12 +619,12 @@ def chat_stream(teacher_id: int, subject_id: int, message: str):
         yield f"Erro no streaming: {str(e)}"
 
 
-def generate_study_questions(text: str) -> list[str]:
+def generate_study_questions(text: str, use_cache: bool = True) -> list[str]:
     """
     Gera 3 sugestões de perguntas baseadas no texto fornecido.
     """
     api_key, model_name = get_ai_config()
-    client = get_client()
+    client = get_client(api_key, model_name)
     
     if not client:
         return []
@@ -440,14 +638,15 @@ Texto:
 
 Perguntas:"""
         
-        response = client.chat.completions.create(
+        content = _complete(
+            'generate_study_questions', client, use_cache,
             model=model_name,
             messages=[
                 {"role": "user", "content": prompt}
             ],
             temperature=0.7
         )
-        questions = [q.strip() for q in response.choices[0].message.content.strip().split('\n') if q.strip()]
+        questions = [q.strip() for q in content.strip().split('\n') if q.strip()]
         return questions[:3]
     except Exception as e:
         print(f"Erro ao gerar sugestões: {e}")
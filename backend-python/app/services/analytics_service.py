@@ -0,0 +1,199 @@
+"""
+Estatísticas dos relatórios de atividades/quizzes
+Monta uma única vez a matriz alunos x questões (a partir do gabarito compilado) e calcula
+todas as métricas dos relatórios com operações vetorizadas (numpy).
+"""
+import numpy as np
+from app.services.answer_keys import NO_ANSWER, NO_CORRECT, compile_quiz_key
+
+PERFORMANCE_LEVELS = (
+    # (nome, percentual mínimo) - do maior para o menor
+    ('excellent', 90),
+    ('good', 70),
+    ('average', 50),
+    ('below_average', None),
+)
+SCORE_RANGE_EDGES = [0, 20, 40, 60, 80, 100]
+
+
+class ReportAnalytics:
+    """
+    Métricas de um conjunto de respostas.
+
+    percentages: percentual de acerto de cada resposta (na ordem das respostas)
+    times: tempo gasto de cada resposta (opcional; 0 = não informado)
+    answer_key/answers_list: gabarito compilado e respostas de cada aluno (para a análise por questão)
+    """
+
+    def __init__(self, percentages, times=None, answer_key=None, answers_list=None):
+        self.percentages = np.asarray(percentages, dtype=np.float64)
+        self.times = np.asarray(times if times is not None else [], dtype=np.float64)
+        self.answer_key = answer_key
+        self.matrix = None
+        if answer_key is not None and answer_key.total:
+            self.matrix = answer_key.encode_many(answers_list or [])
+
+    @property
+    def count(self):
+        return len(self.percentages)
+
+    # ========== RESPOSTAS ==========
+
+    def average(self):
+        return float(self.percentages.mean()) if self.count else 0
+
+    def performance_distribution(self):
+        p = self.percentages
+        excellent = int(np.count_nonzero(p >= 90))
+        good = int(np.count_nonzero(p >= 70)) - excellent
+        average = int(np.count_nonzero(p >= 50)) - excellent - good
+        return {
+            'excellent': excellent,
+            'good': good,
+            'average': average,
+            'below_average': self.count - excellent - good - average
+        }
+
+    def performance_levels(self):
+        """Nível de cada resposta (mesmos cortes de performance_distribution)"""
+        levels = np.full(self.count, 'below_average', dtype=object)
+        for name, minimum in reversed(PERFORMANCE_LEVELS[:-1]):
+            levels[self.percentages >= minimum] = name
+        return levels
+
+    def score_ranges(self, with_percentage=True, with_label=False):
+        """Faixas de 20 em 20 pontos (100% entra na última faixa)"""
+        counts, _ = np.histogram(self.percentages, bins=SCORE_RANGE_EDGES)
+        ranges = []
+        for i, count in enumerate(counts):
+            item = {'min': SCORE_RANGE_EDGES[i], 'max': SCORE_RANGE_EDGES[i + 1], 'count': int(count)}
+            if with_label:
+                item['label'] = f'{SCORE_RANGE_EDGES[i]}-{SCORE_RANGE_EDGES[i + 1]}%'
+            if with_percentage:
+                item['percentage'] = round(int(count) / self.count * 100, 1) if self.count else 0
+            ranges.append(item)
+        return ranges
+
+    def comparative_stats(self, enrolled_count):
+        p = self.percentages
+        class_median = float(np.median(p)) if self.count else 0
+        standard_deviation = float(p.std()) if self.count > 1 else 0
+
+        # Moda dos percentuais arredondados; empate: o valor que aparece primeiro
+        class_mode = 0
+        if self.count:
+            values, first_index, counts = np.unique(np.round(p), return_index=True, return_counts=True)
+            tied = np.flatnonzero(counts == counts.max())
+            class_mode = int(values[tied[np.argmin(first_index[tied])]])
+
+        return {
+            'class_median': round(class_median, 1),
+            'class_mode': class_mode,
+            'standard_deviation': round(standard_deviation, 1),
+            'participation_rate': round((self.count / enrolled_count * 100), 1) if enrolled_count > 0 else 0
+        }
+
+    def time_analytics(self, with_median=True):
+        data = {
+            'average_completion_time': 0,
+            'fastest_completion': 0,
+            'slowest_completion': 0,
+        }
+        if with_median:
+            data['median_time'] = 0
+
+        times = self.times[self.times > 0]
+        if len(times):
+            data['average_completion_time'] = round(float(times.mean()), 1)
+            data['fastest_completion'] = _number(times.min())
+            data['slowest_completion'] = _number(times.max())
+            if with_median:
+                data['median_time'] = _number(np.median(times))
+        return data
+
+    # ========== QUESTÕES ==========
+
+    def _masks(self):
+        answered = self.matrix != NO_ANSWER
+        if self.answer_key.coerce:
+            # Atividade: questão sem gabarito válido não é contabilizada (nem acerto nem erro)
+            answered &= self.answer_key.correct != NO_CORRECT
+        correct = self.matrix == self.answer_key.correct
+        return answered, correct
+
+    def question_stats(self):
+        """Acertos/erros, taxa, dificuldade e resposta errada mais comum de cada questão"""
+        if self.matrix is None:
+            return []
+
+        answered, correct = self._masks()
+        correct_count = correct.sum(axis=0)
+        answered_count = answered.sum(axis=0)
+        incorrect_count = answered_count - correct_count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correct_rate = np.where(answered_count > 0, correct_count / answered_count * 100, 0.0)
+
+        most_common_wrong = self._most_common_wrong(answered & ~correct)
+
+        stats = []
+        for i in range(self.answer_key.total):
+            rate = float(correct_rate[i])
+            stats.append({
+                'correct_count': int(correct_count[i]),
+                'incorrect_count': int(incorrect_count[i]),
+                'correct_rate': round(rate, 1),
+                'difficulty_level': 'easy' if rate >= 70 else ('medium' if rate >= 40 else 'hard'),
+                'most_common_wrong_answer': most_common_wrong[i]
+            })
+        return stats
+
+    def _most_common_wrong(self, wrong):
+        """Histograma das opções erradas por questão (bincount sobre questão x opção)"""
+        n_questions = self.answer_key.total
+        rows, cols = np.nonzero(wrong & (self.matrix >= 0))
+        if not len(rows):
+            return [None] * n_questions
+
+        options = self.matrix[rows, cols]
+        width = int(options.max()) + 1
+        histogram = np.bincount(cols * width + options, minlength=n_questions * width).reshape(n_questions, width)
+        best = histogram.argmax(axis=1)
+        return [int(best[i]) if histogram[i, best[i]] > 0 else None for i in range(n_questions)]
+
+    def wrong_questions_by_student(self):
+        """Posições das questões que cada aluno respondeu errado"""
+        if self.matrix is None:
+            return [[] for _ in range(self.count)]
+        answered, correct = self._masks()
+        wrong = answered & ~correct
+        return [np.flatnonzero(row).tolist() for row in wrong]
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def activity_analytics(activity, responses):
+    """Métricas das respostas de uma LiveActivity"""
+    answer_key = activity.answer_key if activity.activity_type == 'quiz' else None
+    return ReportAnalytics(
+        [r.percentage or 0 for r in responses],
+        [getattr(r, 'time_taken', 0) or 0 for r in responses],
+        answer_key,
+        [(r.response_data or {}).get('answers', {}) for r in responses] if answer_key else None
+    )
+
+
+def quiz_analytics(questions, responses):
+    """
+    Métricas das respostas de um Quiz.
+    O gabarito é compilado da própria lista de questões para que as posições da matriz
+    correspondam à ordem em que o relatório as percorre.
+    """
+    return ReportAnalytics(
+        [r.percentage or 0 for r in responses],
+        [r.time_taken or 0 for r in responses],
+        compile_quiz_key(questions),
+        [r.answers or {} for r in responses]
+    )
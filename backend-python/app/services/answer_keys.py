@@ -0,0 +1,198 @@
+"""
+Gabaritos compilados para correção de quizzes
+O gabarito de cada atividade/quiz é compilado uma vez (id da questão -> posição, array de
+respostas corretas) e fica em cache; a correção compara arrays de inteiros com numpy.
+A chave do cache inclui um hash dos pares (id da questão, resposta correta): um gabarito
+alterado (neste ou em outro processo) gera outra chave, sem invalidação explícita.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+ANSWER_KEY_CACHE_SIZE = 512
+NO_ANSWER = -1  # Questão sem resposta (ou resposta inválida/negativa)
+NO_CORRECT = -2  # Questão sem gabarito válido: nunca conta acerto
+INVALID_ANSWER = -3  # Quiz clássico: respondida com valor que não é uma opção (conta como erro)
+MAX_OPTION = 2 ** 31  # Respostas fora de [0, MAX_OPTION) contam como não respondidas
+
+
+class AnswerKey:
+    """
+    Gabarito compilado.
+
+    by_id: chave da resposta (id da questão como string) -> posições
+    by_index: chave alternativa (índice como string) para questões cujo id é diferente do índice
+    correct: array com o índice da opção correta de cada questão
+    """
+
+    def __init__(self, question_ids, correct, coerce=True, index_fallback=True):
+        self.by_id = {}
+        self.by_index = {}
+        for i, question_id in enumerate(question_ids):
+            # Ids repetidos (ex: id explícito igual ao índice de outra questão) valem para todas
+            self.by_id.setdefault(question_id, []).append(i)
+            if index_fallback and question_id != str(i):
+                self.by_index[str(i)] = i
+        self.correct = np.array(correct, dtype=np.int64)
+        self.coerce = coerce
+        # Caminho rápido do encode_many: um id por questão e sem chave alternativa
+        unique = len(self.by_id) == len(question_ids) and not self.by_index
+        self.keys = list(question_ids) if unique else None
+
+    @property
+    def total(self):
+        return len(self.correct)
+
+    def _value(self, answer):
+        if self.coerce:
+            try:
+                answer = int(answer)
+            except (ValueError, TypeError):
+                return NO_ANSWER
+        elif isinstance(answer, int):
+            # Quiz clássico: só aceita inteiros (mesma regra de antes: comparação direta)
+            answer = int(answer)
+        else:
+            return INVALID_ANSWER
+        return answer if 0 <= answer < MAX_OPTION else NO_ANSWER
+
+    def encode(self, answers, out=None):
+        """Converte {id_da_questão: opção} em um array de inteiros alinhado ao gabarito"""
+        encoded = np.full(self.total, NO_ANSWER, dtype=np.int64) if out is None else out
+        if not isinstance(answers, dict) or not self.total:
+            return encoded
+
+        # Preenche uma lista e copia para o array de uma vez (atribuição item a item no numpy é lenta)
+        values = [NO_ANSWER] * self.total
+        fallback = {}
+        answered = set()
+        for key, answer in answers.items():
+            if answer is None:
+                continue
+            key = str(key)
+            position = self.by_index.get(key)
+            if position is not None:
+                fallback[position] = answer
+            positions = self.by_id.get(key)
+            if positions:
+                value = self._value(answer)
+                for position in positions:
+                    values[position] = value
+                    answered.add(position)
+
+        # A chave pelo índice só vale quando não há resposta pelo id da questão
+        for position, answer in fallback.items():
+            if position not in answered:
+                values[position] = self._value(answer)
+
+        encoded[:] = values
+        return encoded
+
+    def score(self, answers):
+        """Número de acertos de um aluno"""
+        if not self.total:
+            return 0
+        return int(np.count_nonzero(self.encode(answers) == self.correct))
+
+    def encode_many(self, answers_list):
+        """Matriz alunos x questões com as respostas de vários alunos"""
+        if not self.total:
+            return np.full((len(answers_list), 0), NO_ANSWER, dtype=np.int64)
+
+        if self.keys is not None and answers_list:
+            # Respostas em JSON (chaves string) e só com inteiros: o numpy monta a matriz de uma vez
+            blank = [NO_ANSWER] * self.total
+            matrix = np.array([
+                [answers.get(key, NO_ANSWER) for key in self.keys] if isinstance(answers, dict) else blank
+                for answers in answers_list
+            ])
+            if matrix.dtype.kind == 'i' and matrix.ndim == 2:
+                matrix = matrix.astype(np.int64, copy=False)
+                matrix[(matrix < 0) | (matrix >= MAX_OPTION)] = NO_ANSWER
+                return matrix
+
+        # Caso geral (ids repetidos, chave pelo índice, None, strings...): aluno por aluno
+        matrix = np.full((len(answers_list), self.total), NO_ANSWER, dtype=np.int64)
+        for row, answers in enumerate(answers_list):
+            self.encode(answers, out=matrix[row])
+        return matrix
+
+    def score_many(self, answers_list):
+        """Acertos de vários alunos em uma única comparação (matriz alunos x questões)"""
+        if not answers_list or not self.total:
+            return np.zeros(len(answers_list), dtype=np.int64)
+        return np.count_nonzero(self.encode_many(answers_list) == self.correct, axis=1)
+
+
+def _correct_index(value):
+    try:
+        value = int(value)
+    except (ValueError, TypeError):
+        return NO_CORRECT
+    return value if value >= 0 else NO_CORRECT
+
+
+def _activity_pairs(content):
+    questions = content.get('questions', []) if isinstance(content, dict) else []
+    return [(str(question.get('id', i)), question.get('correct')) for i, question in enumerate(questions)]
+
+
+def _quiz_pairs(questions):
+    return [(str(question.id), question.correct) for question in questions]
+
+
+def _fingerprint(pairs):
+    """Hash do gabarito (parte da chave do cache)"""
+    return hashlib.blake2b(repr(pairs).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def compile_activity_key(content):
+    """Gabarito de uma LiveActivity (content['questions'] com 'id' opcional e 'correct')"""
+    pairs = _activity_pairs(content)
+    return AnswerKey(
+        [question_id for question_id, _ in pairs],
+        [_correct_index(correct) for _, correct in pairs]
+    )
+
+
+def compile_quiz_key(questions):
+    """Gabarito de um Quiz (QuizQuestion: respostas indexadas pelo id da questão)"""
+    pairs = _quiz_pairs(questions)
+    return AnswerKey(
+        [question_id for question_id, _ in pairs],
+        [_correct_index(correct) for _, correct in pairs],
+        coerce=False,
+        index_fallback=False
+    )
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cached(cache_key, compile_fn):
+    with _lock:
+        answer_key = _cache.get(cache_key)
+        if answer_key is not None:
+            _cache.move_to_end(cache_key)
+            return answer_key
+
+    answer_key = compile_fn()
+    with _lock:
+        _cache[cache_key] = answer_key
+        while len(_cache) > ANSWER_KEY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return answer_key
+
+
+def get_activity_answer_key(activity_id, content):
+    """Gabarito da atividade para este conteúdo (compilado só se o gabarito mudou)"""
+    fingerprint = _fingerprint(_activity_pairs(content))
+    return _cached(('activity', activity_id, fingerprint), lambda: compile_activity_key(content))
+
+
+def get_quiz_answer_key(quiz_id, questions):
+    """Gabarito do quiz para estas questões (id e correct de cada QuizQuestion)"""
+    fingerprint = _fingerprint(_quiz_pairs(questions))
+    return _cached(('quiz', quiz_id, fingerprint), lambda: compile_quiz_key(questions))
@@ -0,0 +1,171 @@
+"""
+Índice BM25 local dos arquivos de contexto do chat (AIContextFile)
+Cada arquivo é dividido em trechos de CONTEXT_CHUNK_WORDS palavras (com sobreposição) e entra num
+índice invertido por sessão, montado no upload. A cada pergunta, o chat envia só os
+CONTEXT_TOP_K trechos mais relevantes em vez dos documentos inteiros.
+
+O índice fica em memória (LRU de CONTEXT_INDEXES_MAX sessões). Outro processo, ou este depois de um
+reinício, remonta o índice a partir dos arquivos da sessão na primeira pergunta. O índice é
+sincronizado com a lista de arquivos atual: arquivos removidos saem e arquivos novos entram.
+"""
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, namedtuple
+
+CONTEXT_CHUNK_WORDS = int(os.getenv('CONTEXT_CHUNK_WORDS', 200))  # Palavras por trecho
+CONTEXT_CHUNK_OVERLAP = int(os.getenv('CONTEXT_CHUNK_OVERLAP', 40))  # Palavras repetidas entre trechos vizinhos
+CONTEXT_TOP_K = int(os.getenv('CONTEXT_TOP_K', 6))  # Trechos enviados por pergunta
+CONTEXT_INDEXES_MAX = int(os.getenv('CONTEXT_INDEXES_MAX', 128))  # Sessões em memória (LRU)
+NO_RELEVANT_CHUNK = "[Nenhum trecho deste documento é relevante para esta pergunta]"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas para pra
+com sem sob sobre ou mas que se nao sim ao aos ja mais menos muito muita muitos muitas
+como quando onde qual quais quem porque pois entao isso isto esse essa esses essas este esta
+estes estas aquele aquela aqueles aquelas ele ela eles elas eu tu voce voces nos vos me te lhe
+seu sua seus suas meu minha meus minhas ser foi sao era estar esta estao ter tem tinha ha
+""".split())
+
+Chunk = namedtuple('Chunk', 'id file_id filename seq text')
+
+
+def _terms(text):
+    """Termos sem acento e em minúsculas, sem stopwords"""
+    folded = unicodedata.normalize('NFD', (text or '').lower())
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch))
+    return [term for term in re.findall(r'\w+', folded) if len(term) > 1 and term not in STOPWORDS]
+
+
+def chunk_text(text, words=CONTEXT_CHUNK_WORDS, overlap=CONTEXT_CHUNK_OVERLAP):
+    """Trechos do texto original (recortados nas posições das palavras, preservando a formatação)"""
+    spans = [match.span() for match in re.finditer(r'\S+', text or '')]
+    if not spans:
+        return []
+    step = max(words - overlap, 1)
+    chunks = []
+    for start in range(0, len(spans), step):
+        window = spans[start:start + words]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        if start + words >= len(spans):
+            break
+    return chunks
+
+
+class ContextIndex:
+    """Índice invertido BM25 dos trechos dos arquivos de uma sessão"""
+
+    def __init__(self):
+        self.chunks = {}  # id -> Chunk
+        self.lengths = {}  # id -> nº de termos
+        self.postings = {}  # termo -> {id: frequência}
+        self.files = {}  # file_id -> [ids dos trechos]
+        self.total_length = 0
+        self._next_id = 0
+        self.lock = threading.Lock()
+
+    def add_file(self, file_id, filename, content):
+        ids = []
+        for seq, text in enumerate(chunk_text(content)):
+            chunk_id = self._next_id
+            self._next_id += 1
+            terms = Counter(_terms(text))
+            self.chunks[chunk_id] = Chunk(chunk_id, file_id, filename, seq, text)
+            self.lengths[chunk_id] = sum(terms.values())
+            self.total_length += self.lengths[chunk_id]
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = frequency
+            ids.append(chunk_id)
+        self.files[file_id] = ids
+
+    def remove_file(self, file_id):
+        for chunk_id in self.files.pop(file_id, []):
+            for term in set(_terms(self.chunks.pop(chunk_id).text)):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self.postings[term]
+            self.total_length -= self.lengths.pop(chunk_id)
+
+    def sync(self, context_files):
+        """Deixa o índice com exatamente estes arquivos (só indexa os que faltam)"""
+        current = {context_file.id: context_file for context_file in context_files}
+        for file_id in [file_id for file_id in self.files if file_id not in current]:
+            self.remove_file(file_id)
+        for file_id, context_file in current.items():
+            if file_id not in self.files:
+                self.add_file(file_id, context_file.filename, context_file.content)
+
+    def search(self, query, k=CONTEXT_TOP_K):
+        """
+        Os k trechos de maior BM25 para a pergunta (empate: ordem dos documentos). Se menos de k
+        trechos contêm os termos, completa com os primeiros trechos (documentos pequenos vão inteiros).
+        """
+        with self.lock:
+            count = len(self.chunks)
+            if not count:
+                return []
+            average_length = self.total_length / count or 1
+
+            scores = Counter()
+            for term in set(_terms(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, frequency in posting.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunk_id] / average_length)
+                    scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+            ranked = sorted(scores, key=lambda chunk_id: (-scores[chunk_id], chunk_id))[:k]
+            if len(ranked) < k:
+                selected = set(ranked)
+                ranked += [chunk_id for chunk_id in sorted(self.chunks) if chunk_id not in selected][:k - len(ranked)]
+            return [self.chunks[chunk_id] for chunk_id in ranked]
+
+
+_indexes = OrderedDict()  # session_id -> ContextIndex
+_lock = threading.Lock()
+
+
+def get_session_index(session_id, context_files):
+    """Índice da sessão sincronizado com os arquivos informados (criado/atualizado se preciso)"""
+    with _lock:
+        index = _indexes.get(session_id)
+        if index is None:
+            index = _indexes[session_id] = ContextIndex()
+            while len(_indexes) > CONTEXT_INDEXES_MAX:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(session_id)
+    with index.lock:
+        index.sync(context_files)
+    return index
+
+
+def discard_session_index(session_id):
+    with _lock:
+        _indexes.pop(session_id, None)
+
+
+def select_context(session_id, context_files, question, k=CONTEXT_TOP_K):
+    """
+    Trechos relevantes de cada arquivo para a pergunta: [(nome, texto)] na ordem dos arquivos,
+    com os trechos de cada arquivo na ordem original. Arquivos sem trecho selecionado continuam listados.
+    """
+    chunks = get_session_index(session_id, context_files).search(question, k)
+    by_file = {}
+    for chunk in chunks:
+        by_file.setdefault(chunk.file_id, []).append(chunk)
+    return [
+        (
+            context_file.filename,
+            "\n[...]\n".join(chunk.text for chunk in sorted(by_file[context_file.id], key=lambda c: c.seq))
+            if context_file.id in by_file else NO_RELEVANT_CHUNK
+        )
+        for context_file in context_files
+    ]
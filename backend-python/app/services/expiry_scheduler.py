@@ -0,0 +1,212 @@
+"""
+Encerramento automático de atividades e quizzes no prazo (ends_at)
+Uma thread por processo mantém um heap (ends_at, tipo, id) e encerra cada item no horário com
+um UPDATE condicional (ainda 'active' e com o prazo vencido): entre processos, e entre entradas
+repetidas do heap, só um UPDATE encerra de fato, e só quem encerrou emite o evento de fim.
+Com isso is_active é uma leitura pura (nenhum GET grava o encerramento).
+
+Prazos agendados em outro processo (ou antes de um reinício) entram no heap pela varredura do
+banco a cada EXPIRY_SCAN_SECONDS, que carrega os prazos vencidos e os da próxima janela.
+
+A thread só existe enquanto o processo vive. Por isso as rotas de escrita (progresso, resposta,
+envio) também encerram na hora o item vencido que encontrarem (expire_if_due, o mesmo UPDATE
+condicional). Em serverless (Vercel), onde nenhum processo sobrevive entre requisições,
+EXPIRY_INLINE (padrão quando VERCEL está definida) faz o /subjects/<id>/active encerrar as
+atividades vencidas da disciplina antes de montar o estado.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models.transcription_session import TranscriptionSession, LiveActivity
+from app.models.quiz import Quiz
+from app.services.live_state import end_activity_state
+from app.services.subject_state import bump_subjects
+from app.services.websocket_service import emit_activity_ended, emit_quiz_ended
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_SCAN_SECONDS = int(os.getenv('EXPIRY_SCAN_SECONDS', 30))  # Varredura do banco (prazos de outros processos)
+# Encerrar vencidos também nas leituras do estado da disciplina (sem processo vivo entre requisições)
+EXPIRY_INLINE = os.getenv(
+    'EXPIRY_INLINE', 'true' if os.getenv('VERCEL') else 'false'
+).lower() in ('1', 'true', 'yes')
+
+KIND_ACTIVITY = 'activity'
+KIND_QUIZ = 'quiz'
+
+_heap = []  # (ends_at, tipo, id)
+_scheduled = set()  # Entradas já no heap (a varredura não duplica)
+_condition = threading.Condition()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def schedule_expiry(kind, item_id, ends_at):
+    """Agenda o encerramento do item em ends_at (UTC, sem fuso)"""
+    if ends_at is None:
+        return
+    entry = (ends_at, kind, item_id)
+    with _condition:
+        if entry in _scheduled:
+            return
+        _scheduled.add(entry)
+        heapq.heappush(_heap, entry)
+        _condition.notify()
+
+
+def schedule_activity(activity):
+    schedule_expiry(KIND_ACTIVITY, activity.id, activity.ends_at)
+
+
+def schedule_quiz(quiz):
+    schedule_expiry(KIND_QUIZ, quiz.id, quiz.ends_at)
+
+
+def ensure_expiry_scheduler():
+    """Inicia (uma vez por processo) a thread do agendador; usado como before_request"""
+    global _worker
+    if _worker is not None:
+        return
+    with _worker_lock:
+        if _worker is not None:
+            return
+        app = current_app._get_current_object()
+        _worker = threading.Thread(target=_run, args=(app,), name='expiry-scheduler', daemon=True)
+        _worker.start()
+
+
+def _pop_due(now):
+    due = []
+    with _condition:
+        while _heap and _heap[0][0] <= now:
+            entry = heapq.heappop(_heap)
+            _scheduled.discard(entry)
+            due.append(entry)
+    return due
+
+
+def _run(app):
+    next_scan = 0
+    while True:
+        if time.monotonic() >= next_scan:
+            with app.app_context():
+                try:
+                    _scan()
+                except Exception as e:
+                    logger.error(f"[EXPIRY] Falha na varredura de prazos: {e}")
+                finally:
+                    db.session.remove()
+            next_scan = time.monotonic() + EXPIRY_SCAN_SECONDS
+
+        due = _pop_due(datetime.utcnow())
+        if due:
+            with app.app_context():
+                for ends_at, kind, item_id in due:
+                    try:
+                        if kind == KIND_ACTIVITY:
+                            expire_activity(item_id)
+                        else:
+                            expire_quiz(item_id)
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"[EXPIRY] Falha ao encerrar {kind} {item_id}: {e}")
+                db.session.remove()
+            continue
+
+        # Dorme até o próximo prazo, um novo agendamento ou a próxima varredura
+        with _condition:
+            timeout = max(next_scan - time.monotonic(), 0)
+            if _heap:
+                timeout = min(timeout, (_heap[0][0] - datetime.utcnow()).total_seconds())
+            if timeout > 0:
+                _condition.wait(timeout)
+
+
+def _scan():
+    horizon = datetime.utcnow() + timedelta(seconds=EXPIRY_SCAN_SECONDS)
+    for kind, model in ((KIND_ACTIVITY, LiveActivity), (KIND_QUIZ, Quiz)):
+        rows = db.session.query(model.id, model.ends_at).filter(
+            model.status == 'active',
+            model.ends_at.isnot(None),
+            model.ends_at <= horizon
+        ).all()
+        for item_id, ends_at in rows:
+            schedule_expiry(kind, item_id, ends_at)
+
+
+def expire_if_due(kind, item_id, status, ends_at):
+    """
+    Expiração preguiçosa: encerra o item se ele ainda consta ativo com o prazo vencido.
+    Retorna True se este processo encerrou (falhas são registradas e nunca interrompem a requisição).
+    """
+    if status != 'active' or not ends_at or ends_at > datetime.utcnow():
+        return False
+    try:
+        return expire_activity(item_id) if kind == KIND_ACTIVITY else expire_quiz(item_id)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"[EXPIRY] Falha ao encerrar {kind} {item_id}: {e}")
+        return False
+
+
+def expire_overdue_activities(subject_id):
+    """Encerra as atividades vencidas da disciplina que ainda constam ativas"""
+    rows = db.session.query(LiveActivity.id, LiveActivity.status, LiveActivity.ends_at)\
+        .join(TranscriptionSession, LiveActivity.session_id == TranscriptionSession.id)\
+        .filter(
+            TranscriptionSession.subject_id == subject_id,
+            LiveActivity.status == 'active',
+            LiveActivity.ends_at <= datetime.utcnow()
+        ).all()
+    for activity_id, status, ends_at in rows:
+        expire_if_due(KIND_ACTIVITY, activity_id, status, ends_at)
+
+
+def expire_activity(activity_id):
+    """Encerra a atividade se o prazo venceu. Retorna True se este processo encerrou."""
+    row = db.session.query(LiveActivity.status, LiveActivity.ends_at, TranscriptionSession.subject_id)\
+        .join(TranscriptionSession, LiveActivity.session_id == TranscriptionSession.id)\
+        .filter(LiveActivity.id == activity_id).first()
+    now = datetime.utcnow()
+    if not row or row.status != 'active' or not row.ends_at or row.ends_at > now:
+        return False  # Encerrada pelo professor, reiniciada ou ainda no prazo
+
+    # Gravar o progresso parcial que ainda está em memória antes de encerrar
+    end_activity_state(activity_id)
+
+    ended = LiveActivity.query.filter(
+        LiveActivity.id == activity_id,
+        LiveActivity.status == 'active',
+        LiveActivity.ends_at <= now
+    ).update({LiveActivity.status: 'ended'}, synchronize_session=False)
+    db.session.commit()
+    if not ended:
+        return False
+
+    # UPDATE em lote não passa pelos eventos do ORM: avisa o /subjects/<id>/active diretamente
+    bump_subjects([row.subject_id])
+    emit_activity_ended(activity_id)
+    logger.info(f"[EXPIRY] Atividade {activity_id} encerrada no prazo")
+    return True
+
+
+def expire_quiz(quiz_id):
+    """Encerra o quiz se o prazo venceu. Retorna True se este processo encerrou."""
+    now = datetime.utcnow()
+    ended = Quiz.query.filter(
+        Quiz.id == quiz_id,
+        Quiz.status == 'active',
+        Quiz.ends_at <= now
+    ).update({Quiz.status: 'ended'}, synchronize_session=False)
+    db.session.commit()
+    if not ended:
+        return False
+
+    emit_quiz_ended(quiz_id)
+    logger.info(f"[EXPIRY] Quiz {quiz_id} encerrado no prazo")
+    return True
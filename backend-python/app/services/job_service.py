@@ -0,0 +1,254 @@
+"""
+Serviço de jobs assíncronos
+Executa tarefas demoradas (chamadas à IA) fora do worker WSGI, em um pool limitado de threads.
+O resultado fica no armazenamento de jobs (MemoryJobStore/DatabaseJobStore) e pode ser consultado por polling ou stream (SSE).
+
+AI_JOB_STORE=database (padrão): estado na tabela ai_jobs, visível para qualquer worker (o polling
+pode cair em outro processo). AI_JOB_STORE=memory: só no processo (um único worker / testes).
+A execução continua no pool de threads do processo que recebeu o pedido: em hospedagem serverless
+(Vercel), que congela a instância ao responder, o job nunca rodaria. Por isso AI_JOBS_ASYNC é
+false por padrão quando VERCEL está definida: as rotas respondem de forma síncrona mesmo quando
+o app pede "async".
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, delete
+from app import db
+from app.models.ai_job import AIJob
+
+logger = logging.getLogger(__name__)
+
+AI_JOB_WORKERS = int(os.getenv('AI_JOB_WORKERS', 4))  # Jobs de IA simultâneos
+JOB_TTL_SECONDS = int(os.getenv('AI_JOB_TTL_SECONDS', 3600))  # Tempo que um job finalizado fica disponível
+# Aceitar pedidos assíncronos (desligado em serverless, onde a thread do job não sobrevive à resposta)
+AI_JOBS_ASYNC = os.getenv(
+    'AI_JOBS_ASYNC', 'false' if os.getenv('VERCEL') else 'true'
+).lower() in ('1', 'true', 'yes')
+AI_JOB_STORE = os.getenv('AI_JOB_STORE', 'database').lower()  # database | memory
+JOB_POLL_SECONDS = 0.5  # Intervalo de leitura do banco enquanto o stream espera uma mudança
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_ERROR = 'error'
+FINISHED_STATUSES = (JOB_DONE, JOB_ERROR)
+JOB_FIELDS = ('id', 'kind', 'owner_id', 'status', 'result', 'status_code', 'error', 'version',
+              'created_at', 'started_at', 'finished_at')
+
+
+class Job:
+    """Estado de um job; 'version' aumenta a cada mudança (usado pelo stream)"""
+
+    def __init__(self, kind, owner_id):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner_id = owner_id
+        self.status = JOB_QUEUED
+        self.result = None
+        self.status_code = None
+        self.error = None
+        self.version = 0
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    @classmethod
+    def from_row(cls, row):
+        job = cls.__new__(cls)
+        for field in JOB_FIELDS:
+            setattr(job, field, getattr(row, field))
+        return job
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'status_code': self.status_code,
+            'error': self.error,
+            'version': self.version,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class MemoryJobStore:
+    """Armazenamento em memória do processo (um único worker / testes)"""
+
+    def __init__(self, ttl_seconds=JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._condition = threading.Condition()
+
+    def save(self, job):
+        with self._condition:
+            self._purge_expired()
+            self._jobs[job.id] = job
+            self._condition.notify_all()
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def update(self, job_id, **fields):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.version += 1
+            self._condition.notify_all()
+            return job
+
+    def wait_for_update(self, job_id, version, timeout):
+        """Bloqueia até o job passar da versão informada (ou estourar o timeout)"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                job = self._jobs.get(job_id)
+                if not job or job.version > version:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return job
+                self._condition.wait(remaining)
+
+    def _purge_expired(self):
+        """Remove jobs finalizados há mais de ttl_seconds (chamado com o lock adquirido)"""
+        now = datetime.utcnow()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at
+            and (now - job.finished_at).total_seconds() > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class DatabaseJobStore:
+    """Tabela ai_jobs (conexão própria, uma transação curta por operação)"""
+
+    def __init__(self, ttl_seconds=JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.table = AIJob.__table__
+        self._saves = 0
+
+    def save(self, job):
+        with db.engine.begin() as conn:
+            conn.execute(self.table.insert().values({field: getattr(job, field) for field in JOB_FIELDS}))
+        self._saves += 1
+        if self._saves % 50 == 0:
+            self._purge_expired()
+
+    def get(self, job_id):
+        with db.engine.begin() as conn:
+            row = conn.execute(select(self.table).where(self.table.c.id == job_id)).first()
+        return Job.from_row(row) if row else None
+
+    def update(self, job_id, **fields):
+        fields['version'] = self.table.c.version + 1
+        with db.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == job_id).values(**fields))
+        return self.get(job_id)
+
+    def wait_for_update(self, job_id, version, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if not job or job.version > version or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(JOB_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+
+    def _purge_expired(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(
+                self.table.c.status.in_(FINISHED_STATUSES), self.table.c.finished_at < cutoff
+            ))
+
+
+_store = DatabaseJobStore() if AI_JOB_STORE == 'database' else MemoryJobStore()
+_executor = ThreadPoolExecutor(max_workers=AI_JOB_WORKERS, thread_name_prefix='ai-job')
+
+
+def get_job_store():
+    return _store
+
+
+def set_job_store(store):
+    """Troca o backend de armazenamento (ex: testes ou store compartilhado entre processos)"""
+    global _store
+    _store = store
+
+
+def submit_job(kind, owner_id, fn, *args, **kwargs):
+    """
+    Enfileira fn(*args, **kwargs) no pool de jobs.
+
+    fn roda dentro do app context e deve retornar (payload, status_code).
+    Retorna o Job criado (status 'queued').
+    """
+    app = current_app._get_current_object()
+    store = get_job_store()
+    job = Job(kind, owner_id)
+    store.save(job)
+    _executor.submit(_run_job, app, store, job.id, fn, args, kwargs)
+    return job
+
+
+def _run_job(app, store, job_id, fn, args, kwargs):
+    with app.app_context():
+        store.update(job_id, status=JOB_RUNNING, started_at=datetime.utcnow())
+        try:
+            payload, status_code = fn(*args, **kwargs)
+            # Erro também quando a função responde 200 com success=False
+            failed = status_code >= 400 or (isinstance(payload, dict) and payload.get('success') is False)
+            store.update(
+                job_id,
+                status=JOB_ERROR if failed else JOB_DONE,
+                result=payload,
+                status_code=status_code,
+                error=payload.get('error') if isinstance(payload, dict) else None,
+                finished_at=datetime.utcnow()
+            )
+        except Exception as e:
+            db.session.rollback()
+            store.update(
+                job_id,
+                status=JOB_ERROR,
+                status_code=500,
+                error=f'Erro ao executar job: {str(e)}',
+                finished_at=datetime.utcnow()
+            )
+        finally:
+            db.session.remove()
+
+
+def run_in_background(fn, *args, **kwargs):
+    """Executa fn(*args, **kwargs) no pool de jobs, dentro do app context, sem registro de job (tarefas internas)"""
+    app = current_app._get_current_object()
+    _executor.submit(_run_background, app, fn, args, kwargs)
+
+
+def _run_background(app, fn, args, kwargs):
+    with app.app_context():
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"[JOBS] Falha na tarefa em segundo plano {getattr(fn, '__name__', fn)}: {e}")
+        finally:
+            db.session.remove()
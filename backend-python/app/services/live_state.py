@@ -0,0 +1,480 @@
+"""
+Estado ao vivo das atividades (quiz em andamento)
+O progresso parcial dos alunos (POST /activities/<id>/progress) fica em memória e é gravado
+em LiveActivityResponse em lotes (write-behind): a cada LIVE_FLUSH_SECONDS, no encerramento
+da atividade e antes dos relatórios/ranking do professor.
+
+Garantias:
+- A resposta final (POST /respond) continua sendo gravada na hora (write-through).
+- O flush grava o estado completo do aluno (não deltas) com um upsert na linha única
+  (activity_id, student_id) que só altera linhas ainda sem submitted_at: uma resposta final
+  gravada por outro processo entre a leitura e a escrita nunca é sobrescrita nem duplicada.
+- Um lote só deixa de estar pendente depois do commit; se o commit falhar, volta para a fila.
+
+Janela de perda (assumida): o progresso parcial ainda não gravado fica só na memória do
+processo. Se o processo cair, perde-se até LIVE_FLUSH_SECONDS de progresso; a resposta final não
+é afetada. Em hospedagem serverless (Vercel) a thread de flush não roda entre invocações, então
+lá o progresso é gravado na própria requisição (LIVE_PROGRESS_WRITE_THROUGH, ligado por padrão
+quando a variável VERCEL existe). As respostas parciais do mesmo aluno enviadas a processos
+diferentes são mescladas na leitura do flush; duas gravações simultâneas podem perder a última
+alteração parcial de uma delas (a próxima atualização do aluno corrige).
+"""
+import atexit
+import bisect
+import logging
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.transcription_session import LiveActivity, LiveActivityResponse
+from app.services.answer_keys import get_activity_answer_key
+
+logger = logging.getLogger(__name__)
+
+LIVE_FLUSH_SECONDS = float(os.getenv('LIVE_FLUSH_SECONDS', 2))  # Intervalo do write-behind
+LIVE_FLUSH_BATCH = int(os.getenv('LIVE_FLUSH_BATCH', 500))  # Alunos por commit
+LIVE_STATUS_TTL = 5  # Segundos até reler status/fim da atividade do banco
+LEADERBOARD_RESYNC_SECONDS = int(os.getenv('LEADERBOARD_RESYNC_SECONDS', 10))  # Releitura (respostas de outros processos)
+# Gravar o progresso na própria requisição (sem janela de perda; padrão em serverless)
+LIVE_PROGRESS_WRITE_THROUGH = os.getenv(
+    'LIVE_PROGRESS_WRITE_THROUGH', 'true' if os.getenv('VERCEL') else 'false'
+).lower() in ('1', 'true', 'yes')
+
+
+class Leaderboard:
+    """
+    Ranking da atividade mantido ordenado (bisect) a cada progresso/envio.
+    Ordem: percentual e pontos (decrescente), quem enviou antes, aluno.
+    """
+
+    def __init__(self, version=0):
+        self.entries = {}  # student_id -> entrada do ranking
+        self.keys = []  # chaves de todas as entradas, ordenadas
+        self.submitted_keys = []  # só as enviadas (posição no pódio)
+        self.version = version  # Incrementada a cada mudança (ETag do ranking)
+
+    @staticmethod
+    def _key(entry):
+        submitted_at = entry['submitted_at']
+        return (-entry['percentage'], -entry['score'], 0 if submitted_at else 1, submitted_at or '', entry['student_id'])
+
+    def update(self, student_id, score, total, percentage, is_correct, submitted_at=None):
+        previous = self.entries.get(student_id)
+        if previous:
+            if previous['submitted_at'] and not submitted_at:
+                return  # Progresso atrasado não rebaixa uma resposta final
+            self._discard(previous)
+
+        entry = {
+            'student_id': student_id,
+            'status': 'submitted' if submitted_at else 'in_progress',
+            'score': score or 0,
+            'total': total or 0,
+            'percentage': percentage or 0,
+            'is_correct': is_correct,
+            'submitted_at': submitted_at
+        }
+        key = self._key(entry)
+        self.entries[student_id] = entry
+        self.version += 1
+        bisect.insort(self.keys, key)
+        if submitted_at:
+            bisect.insort(self.submitted_keys, key)
+
+    def _discard(self, entry):
+        key = self._key(entry)
+        del self.keys[bisect.bisect_left(self.keys, key)]
+        if entry['submitted_at']:
+            del self.submitted_keys[bisect.bisect_left(self.submitted_keys, key)]
+
+    def position(self, entry):
+        """Posição entre os que já enviaram (None para quem ainda está respondendo)"""
+        if not entry['submitted_at']:
+            return None
+        return bisect.bisect_left(self.submitted_keys, self._key(entry)) + 1
+
+    def iter_ranked(self):
+        for key in self.keys:
+            yield self.entries[key[-1]]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ActivityState:
+    """Dados da atividade usados a cada clique (carregados uma vez) + progresso dos alunos"""
+
+    def __init__(self, activity):
+        self.activity_id = activity.id
+        self.activity_type = activity.activity_type
+        self.answer_key = activity.answer_key
+        self.status = activity.status
+        self.ends_at = activity.ends_at
+        self.epoch = secrets.token_hex(4)  # Distingue este estado (a versão do ranking é local ao processo)
+        self.loaded_at = time.monotonic()
+        self.progress = {}  # student_id -> StudentProgress
+        self.leaderboard = Leaderboard()
+        self.synced_at = 0
+        self.lock = threading.Lock()
+        self._roster_view = (None, None)  # ((versão do ranking, lista de alunos), RosterView)
+
+    def load_responses(self, responses):
+        """(Re)constrói o ranking e o progresso a partir das respostas gravadas"""
+        with self.lock:
+            leaderboard = Leaderboard()
+            for response in responses:
+                progress = self.progress.get(response.student_id)
+                if progress is None:
+                    data = response.response_data if isinstance(response.response_data, dict) else {}
+                    answers = data.get('answers', {})
+                    progress = self.progress[response.student_id] = StudentProgress(
+                        answers if isinstance(answers, dict) else {}
+                    )
+                    progress.score, progress.total = response.score or 0, response.total or 0
+                if response.submitted_at is not None:
+                    progress.submitted = True
+                    progress.dirty = False
+                    leaderboard.update(
+                        response.student_id, response.score, response.total, response.percentage,
+                        response.is_correct, response.submitted_at.isoformat()
+                    )
+
+            # Progresso parcial: o da memória é o mais recente
+            for student_id, progress in self.progress.items():
+                if not progress.submitted:
+                    leaderboard.update(student_id, *self._progress_result(progress))
+
+            # Releitura sem mudanças mantém a versão (e a ETag do ranking)
+            previous = self.leaderboard
+            leaderboard.version = previous.version + (leaderboard.entries != previous.entries)
+            self.leaderboard = leaderboard
+            self.synced_at = time.monotonic()
+
+    def roster_view(self, roster):
+        """
+        Ranking restrito aos matriculados, indexável (chamado com o lock adquirido).
+        Montado uma vez por versão do ranking/lista de alunos; cada polling só fatia a página.
+        """
+        key = (self.leaderboard.version, roster.fingerprint)
+        cached_key, view = self._roster_view
+        if cached_key != key:
+            view = RosterView(self.leaderboard, roster)
+            self._roster_view = (key, view)
+        return view
+
+    def _progress_result(self, progress):
+        percentage = (progress.score / progress.total * 100) if progress.total else 0
+        return progress.score, progress.total, percentage, None
+
+    @property
+    def is_active(self):
+        if self.status != 'active':
+            return False
+        return not (self.ends_at and datetime.utcnow() > self.ends_at)
+
+
+class RosterView:
+    """
+    Alunos da disciplina na ordem do ranking: quem respondeu/está respondendo (por nota), depois
+    quem ainda não começou (alfabético). Alunos fora da lista de matrículas não entram.
+    """
+
+    def __init__(self, leaderboard, roster):
+        self.ranked = [entry for entry in leaderboard.iter_ranked() if entry['student_id'] in roster]
+        self.waiting = [
+            (student_id, name) for student_id, name in roster.students
+            if student_id not in leaderboard.entries
+        ]
+
+    @property
+    def response_count(self):
+        return len(self.ranked)
+
+    def __len__(self):
+        return len(self.ranked) + len(self.waiting)
+
+    def page(self, offset, stop=None):
+        """Itens [offset, stop) por índice: entradas do ranking (dict) e depois (student_id, nome)"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        ranked_count = len(self.ranked)
+        return (
+            self.ranked[min(offset, ranked_count):min(stop, ranked_count)]
+            + self.waiting[max(offset - ranked_count, 0):max(stop - ranked_count, 0)]
+        )
+
+
+class StudentProgress:
+    def __init__(self, answers=None):
+        self.answers = dict(answers or {})
+        self.score = 0
+        self.total = 0
+        self.dirty = False
+        self.submitted = False
+
+
+class MemoryLiveStateStore:
+    """Estado das atividades no próprio processo"""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def get(self, activity_id):
+        return self._states.get(activity_id)
+
+    def put(self, state):
+        with self._lock:
+            return self._states.setdefault(state.activity_id, state)
+
+    def remove(self, activity_id):
+        with self._lock:
+            return self._states.pop(activity_id, None)
+
+    def activity_ids(self):
+        with self._lock:
+            return list(self._states)
+
+
+_store = MemoryLiveStateStore()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def get_live_state_store():
+    return _store
+
+
+def get_activity_state(activity_id):
+    """Estado da atividade (carrega do banco no primeiro acesso; status relido a cada LIVE_STATUS_TTL)"""
+    state = _store.get(activity_id)
+    if state is None:
+        activity = LiveActivity.query.get(activity_id)
+        if not activity:
+            return None
+        state = ActivityState(activity)
+        state.load_responses(LiveActivityResponse.query.filter_by(activity_id=activity_id).all())
+        state = _store.put(state)
+    elif time.monotonic() - state.loaded_at > LIVE_STATUS_TTL:
+        row = db.session.query(LiveActivity.status, LiveActivity.ends_at, LiveActivity.content).filter(
+            LiveActivity.id == activity_id
+        ).first()
+        if row:
+            state.status, state.ends_at, content = row
+            # Gabarito editado em outro processo: o cache troca de chave (hash do gabarito)
+            if state.activity_type == 'quiz':
+                state.answer_key = get_activity_answer_key(activity_id, content)
+        state.loaded_at = time.monotonic()
+    return state
+
+
+def record_progress(state, student_id, answers):
+    """
+    Mescla as respostas parciais do aluno e recalcula a pontuação em memória.
+    Com LIVE_PROGRESS_WRITE_THROUGH, grava no banco antes de retornar.
+    """
+    if not LIVE_PROGRESS_WRITE_THROUGH:
+        _ensure_flusher()
+    with state.lock:
+        progress = state.progress.get(student_id)
+        if progress is None:
+            progress = state.progress[student_id] = StudentProgress()
+        if isinstance(answers, dict):
+            progress.answers.update({str(key): value for key, value in answers.items()})
+        if state.activity_type == 'quiz':
+            progress.score, progress.total = state.answer_key.score(progress.answers), state.answer_key.total
+        if not progress.submitted:
+            progress.dirty = True
+            state.leaderboard.update(student_id, *state._progress_result(progress))
+    if LIVE_PROGRESS_WRITE_THROUGH:
+        flush_activity(state.activity_id)
+    return progress
+
+
+def mark_submitted(response):
+    """Resposta final gravada (write-through): atualiza o ranking e descarta o progresso pendente"""
+    state = _store.get(response.activity_id)
+    if not state:
+        return
+    with state.lock:
+        progress = state.progress.setdefault(response.student_id, StudentProgress())
+        progress.submitted = True
+        progress.dirty = False
+        state.leaderboard.update(
+            response.student_id, response.score, response.total, response.percentage, response.is_correct,
+            response.submitted_at.isoformat() if response.submitted_at else datetime.utcnow().isoformat()
+        )
+
+
+def get_leaderboard(activity_id):
+    """
+    Estado da atividade com o ranking pronto para leitura.
+    Relê as respostas do banco no máximo a cada LEADERBOARD_RESYNC_SECONDS (envios feitos em outros processos).
+    """
+    state = get_activity_state(activity_id)
+    if state and time.monotonic() - state.synced_at > LEADERBOARD_RESYNC_SECONDS:
+        flush_activity(activity_id)
+        state.load_responses(LiveActivityResponse.query.filter_by(activity_id=activity_id).all())
+    return state
+
+
+def end_activity_state(activity_id):
+    """Grava o que estiver pendente e descarta o estado da atividade encerrada"""
+    flush_activity(activity_id)
+    _store.remove(activity_id)
+
+
+def flush_activity(activity_id):
+    """Grava o progresso pendente da atividade (em lotes). Retorna o número de alunos gravados."""
+    state = _store.get(activity_id)
+    if not state:
+        return 0
+
+    written = 0
+    while True:
+        batch = {}
+        with state.lock:
+            for student_id, progress in state.progress.items():
+                if not progress.dirty:
+                    continue
+                batch[student_id] = (dict(progress.answers), progress.score, progress.total)
+                progress.dirty = False
+                if len(batch) >= LIVE_FLUSH_BATCH:
+                    break
+        if not batch:
+            return written
+
+        try:
+            _write_batch(state, batch)
+            written += len(batch)
+        except Exception:
+            db.session.rollback()
+            # Volta para a fila (a menos que o aluno tenha enviado a resposta final nesse meio tempo)
+            with state.lock:
+                for student_id in batch:
+                    progress = state.progress.get(student_id)
+                    if progress and not progress.submitted:
+                        progress.dirty = True
+            raise
+
+
+def flush_all():
+    """Grava todas as atividades e descarta o estado das que já terminaram (ex: por tempo)"""
+    for activity_id in _store.activity_ids():
+        try:
+            flush_activity(activity_id)
+            state = _store.get(activity_id)
+            if state and not state.is_active:
+                _store.remove(activity_id)
+        except Exception as e:
+            logger.error("Falha ao gravar o estado ao vivo da atividade %s: %s", activity_id, e)
+
+
+def _write_batch(state, batch):
+    """
+    Upsert de um lote: 1 SELECT + 1 INSERT ... ON CONFLICT + 1 commit para todos os alunos do lote.
+    O SELECT só serve para mesclar as respostas parciais; quem decide se a linha pode ser
+    alterada é o WHERE submitted_at IS NULL do upsert (relido pelo banco no momento da escrita).
+    """
+    existing = {
+        row.student_id: row
+        for row in db.session.query(
+            LiveActivityResponse.student_id, LiveActivityResponse.response_data, LiveActivityResponse.submitted_at
+        ).filter(
+            LiveActivityResponse.activity_id == state.activity_id,
+            LiveActivityResponse.student_id.in_(list(batch))
+        ).all()
+    }
+
+    rows = []
+    for student_id, (answers, score, total) in batch.items():
+        current = existing.get(student_id)
+        if current is not None:
+            if current.submitted_at is not None:
+                # Resposta final já gravada (talvez por outro processo): não sobrescrever
+                continue
+            current_data = current.response_data if isinstance(current.response_data, dict) else {}
+            merged = current_data.get('answers', {})
+            if not isinstance(merged, dict):
+                merged = {}
+            merged.update(answers)
+            answers = merged
+            if state.activity_type == 'quiz':
+                score, total = state.answer_key.score(merged), state.answer_key.total
+
+        row = {
+            'activity_id': state.activity_id,
+            'student_id': student_id,
+            'response_data': {'answers': answers},
+            'submitted_at': None,
+            'score': 0,
+            'total': 0,
+            'percentage': 0.0,
+            'is_correct': None
+        }
+        if state.activity_type == 'quiz':
+            row.update(
+                score=score,
+                total=total,
+                percentage=(score / total * 100) if total > 0 else 0,
+                is_correct=score == total
+            )
+        rows.append(row)
+
+    if rows:
+        db.session.execute(_progress_upsert(rows))
+    LiveActivity.bump_response_version(state.activity_id)
+    db.session.commit()
+
+
+def _progress_upsert(rows):
+    """INSERT ... ON CONFLICT (activity_id, student_id) DO UPDATE ... WHERE submitted_at IS NULL"""
+    table = LiveActivityResponse.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(table).values(rows)
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(table).values(rows)
+    else:
+        raise RuntimeError(f'Upsert do progresso não suportado para o banco {dialect}')
+
+    return statement.on_conflict_do_update(
+        index_elements=['activity_id', 'student_id'],
+        set_={
+            column: statement.excluded[column]
+            for column in ('response_data', 'score', 'total', 'percentage', 'is_correct')
+        },
+        where=table.c.submitted_at.is_(None)
+    )
+
+
+def _ensure_flusher():
+    """Inicia (uma vez por processo) a thread que grava o progresso pendente periodicamente"""
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is not None:
+            return
+        app = current_app._get_current_object()
+        _flusher = threading.Thread(target=_flush_loop, args=(app,), name='live-state-flush', daemon=True)
+        _flusher.start()
+        atexit.register(_flush_on_exit, app)
+
+
+def _flush_loop(app):
+    while True:
+        time.sleep(LIVE_FLUSH_SECONDS)
+        with app.app_context():
+            try:
+                flush_all()
+            finally:
+                db.session.remove()
+
+
+def _flush_on_exit(app):
+    with app.app_context():
+        flush_all()
@@ -0,0 +1,176 @@
+"""
+Montagem do prompt do chat com orçamento de tokens
+O prompt (instruções + documentos + histórico + pergunta) não passa de CHAT_PROMPT_MAX_TOKENS.
+Instruções e pergunta entram sempre; o que sobra é dividido entre documentos (CHAT_DOCUMENTS_SHARE)
+e histórico, e a parte que um deles não usa fica para o outro.
+
+Corte determinístico (a mesma entrada gera sempre o mesmo prompt):
+- histórico: mantém as mensagens mais recentes que couberem, sem buracos
+- documentos: os menores entram inteiros e o restante é dividido igualmente entre os maiores,
+  cortados no limite de tokens com um aviso de truncamento
+
+Tokens contados com o tiktoken (encoding do modelo); sem ele, estimativa de ~4 caracteres por token.
+"""
+import logging
+import math
+import os
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken é opcional
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+CHAT_PROMPT_MAX_TOKENS = int(os.getenv('CHAT_PROMPT_MAX_TOKENS', 12000))  # Prompt inteiro (sem a resposta)
+CHAT_DOCUMENTS_SHARE = float(os.getenv('CHAT_DOCUMENTS_SHARE', 0.7))  # Fração do restante para documentos
+CHAT_HISTORY_MESSAGES = int(os.getenv('CHAT_HISTORY_MESSAGES', 20))  # Mensagens do histórico lidas do banco
+MESSAGE_OVERHEAD_TOKENS = 4  # Papel e separadores de cada mensagem no formato de chat
+REPLY_PRIMING_TOKENS = 3  # Início da resposta do assistente
+CHARS_PER_TOKEN = 4  # Estimativa sem o tiktoken
+FALLBACK_ENCODING = 'o200k_base'  # gpt-4o / gpt-4o-mini
+TRUNCATED_MARKER = "\n[... documento truncado para caber no contexto ...]"
+
+
+class Tokenizer:
+    """Contagem e corte por tokens (tiktoken ou estimativa por caracteres)"""
+
+    def __init__(self, model=None):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                try:
+                    self.encoding = tiktoken.get_encoding(FALLBACK_ENCODING)
+                except Exception as e:
+                    logger.warning(f"[PROMPT] tiktoken indisponível, usando estimativa: {e}")
+        self.name = self.encoding.name if self.encoding is not None else 'estimate'
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def truncate(self, text, max_tokens):
+        """Prefixo do texto com no máximo max_tokens tokens"""
+        if max_tokens <= 0 or not text:
+            return ''
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+_tokenizers = {}  # modelo -> Tokenizer
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer(model=None):
+    """Tokenizer do modelo (criado uma vez por processo)"""
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(model)
+        if tokenizer is None:
+            tokenizer = _tokenizers[model] = Tokenizer(model)
+        return tokenizer
+
+
+def message_tokens(messages, tokenizer):
+    """Tokens de uma lista de mensagens no formato de chat"""
+    return REPLY_PRIMING_TOKENS + sum(
+        MESSAGE_OVERHEAD_TOKENS + tokenizer.count(message['content']) for message in messages
+    )
+
+
+def _allocate(sizes, budget):
+    """Divide o orçamento: os menores entram inteiros, o resto é dividido igualmente entre os maiores"""
+    allocation = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(len(sizes)), key=lambda index: (sizes[index], index))
+    for position, index in enumerate(order):
+        allocation[index] = min(sizes[index], remaining // (len(order) - position))
+        remaining -= allocation[index]
+    return allocation
+
+
+def build_chat_prompt(instruction, documents, history, user_message, model=None,
+                      documents_intro='', documents_rules='', document_template='{filename}\n{content}\n\n',
+                      max_tokens=None, documents_share=None):
+    """
+    Monta as mensagens do chat dentro do orçamento.
+    documents: [(nome, conteúdo)]; history: [(papel, conteúdo)] do mais antigo ao mais recente.
+    Retorna (mensagens, relatório com as contagens finais de tokens).
+    """
+    tokenizer = get_tokenizer(model)
+    max_tokens = CHAT_PROMPT_MAX_TOKENS if max_tokens is None else max_tokens
+    documents_share = CHAT_DOCUMENTS_SHARE if documents_share is None else documents_share
+
+    # Fixo: instruções (com a moldura dos documentos), pergunta e formato das mensagens
+    frame = ''
+    if documents:
+        frame = documents_intro + documents_rules + ''.join(
+            document_template.format(filename=filename, content='') for filename, _ in documents
+        )
+    fixed = (
+        REPLY_PRIMING_TOKENS + 2 * MESSAGE_OVERHEAD_TOKENS
+        + tokenizer.count(instruction) + tokenizer.count(frame) + tokenizer.count(user_message)
+    )
+    available = max(max_tokens - fixed, 0)
+
+    document_sizes = [tokenizer.count(content) for _, content in documents]
+    history_sizes = [MESSAGE_OVERHEAD_TOKENS + tokenizer.count(content) for _, content in history]
+    documents_need, history_need = sum(document_sizes), sum(history_sizes)
+
+    # A fatia que um lado não usa fica para o outro
+    documents_budget = min(documents_need, max(int(available * documents_share), available - history_need))
+    history_budget = available - documents_budget
+
+    # Histórico: as mais recentes que couberem
+    kept = 0
+    used = 0
+    for size in reversed(history_sizes):
+        if used + size > history_budget:
+            break
+        used += size
+        kept += 1
+    kept_history = history[len(history) - kept:]
+
+    # Documentos: corte proporcional com aviso
+    marker_tokens = tokenizer.count(TRUNCATED_MARKER)
+    truncated = []
+    rendered = []
+    for (filename, content), size, allocated in zip(documents, document_sizes, _allocate(document_sizes, documents_budget)):
+        if allocated < size:
+            content = tokenizer.truncate(content, allocated - marker_tokens) + TRUNCATED_MARKER
+            truncated.append(filename)
+        rendered.append(document_template.format(filename=filename, content=content))
+
+    system = instruction
+    if documents:
+        system += documents_intro + ''.join(rendered) + documents_rules
+
+    messages = [{"role": "system", "content": system}]
+    messages.extend({"role": role, "content": content} for role, content in kept_history)
+    messages.append({"role": "user", "content": user_message})
+
+    # Contagens finais (do texto realmente enviado)
+    instruction_tokens = tokenizer.count(instruction)
+    system_tokens = tokenizer.count(system)
+    history_tokens = sum(history_sizes[len(history) - kept:])
+    user_tokens = tokenizer.count(user_message)
+    report = {
+        'tokenizer': tokenizer.name,
+        'budget': max_tokens,
+        'system': instruction_tokens,
+        'documents': system_tokens - instruction_tokens,
+        'history': history_tokens,
+        'user': user_tokens,
+        'total': REPLY_PRIMING_TOKENS + 2 * MESSAGE_OVERHEAD_TOKENS + system_tokens + history_tokens + user_tokens,
+        'documents_truncated': truncated,
+        'history_kept': kept,
+        'history_dropped': len(history) - kept
+    }
+    return messages, report
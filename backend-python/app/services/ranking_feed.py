@@ -0,0 +1,170 @@
+"""
+Feed de mudanças do ranking ao vivo do quiz
+O ranking de cada quiz fica em memória na versão Quiz.response_version (contador atômico no
+banco, incrementado a cada resposta). Cada mudança de versão registra quem entrou/mudou e quem
+só mudou de posição: o cliente pede "mudanças desde a versão N" (?since=N) e recebe só essas
+linhas. Sem N, com N de antes das últimas RANKING_FEED_SIZE mudanças ou de outro histórico,
+a resposta é o ranking completo.
+
+Uma resposta enviada neste processo entra no ranking por bisect, sem reler o banco; se a versão
+pulou (respostas gravadas por outros processos), o ranking é relido com uma única consulta
+(nome do aluno via join, sem carregar um usuário por linha).
+"""
+import bisect
+import os
+import threading
+from collections import OrderedDict, deque
+from app import db
+from app.models.quiz import QuizResponse
+from app.models.user import User
+
+RANKING_FEED_SIZE = int(os.getenv('RANKING_FEED_SIZE', 50))  # Mudanças guardadas para deltas
+RANKING_FEEDS_MAX = int(os.getenv('RANKING_FEEDS_MAX', 256))  # Quizzes em memória (LRU)
+
+
+def ranking_row(student_id, student_name, points, score, total, percentage, time_taken, submitted_at):
+    """Linha do ranking (a posição é preenchida pelo feed)"""
+    return {
+        'position': None,
+        'student_id': student_id,
+        'student_name': student_name or 'Desconhecido',
+        'points': points,
+        'score': score,
+        'total': total,
+        'percentage': percentage,
+        'time_taken': time_taken,
+        'submitted_at': submitted_at.isoformat() if submitted_at else None
+    }
+
+
+def _sort_key(row):
+    # Mesma ordem do ranking: pontos (decrescente), quem enviou antes
+    return (-(row['points'] or 0), row['submitted_at'] or '9999', row['student_id'])
+
+
+class RankingFeed:
+    """Ranking ordenado de um quiz + histórico das últimas mudanças"""
+
+    def __init__(self, quiz_id):
+        self.quiz_id = quiz_id
+        self.version = None
+        self.rows = []  # ordenado pelo ranking
+        self.keys = []  # _sort_key de cada linha (bisect)
+        self.by_student = {}
+        self.log = deque(maxlen=RANKING_FEED_SIZE)  # (versão anterior, versão, alterados, movidos, removidos)
+        self.lock = threading.Lock()
+
+    def replace(self, rows, version):
+        """Troca o ranking inteiro (releitura do banco) e registra a diferença"""
+        rows.sort(key=_sort_key)
+        previous = self.by_student
+        changed, moved = set(), set()
+        for position, row in enumerate(rows, 1):
+            row['position'] = position
+            old = previous.get(row['student_id'])
+            if old is None or dict(old, position=position) != row:
+                changed.add(row['student_id'])
+            elif old['position'] != position:
+                moved.add(row['student_id'])
+
+        by_student = {row['student_id']: row for row in rows}
+        removed = set(previous) - set(by_student)
+        if self.version is not None:
+            self.log.append((self.version, version, changed, moved, removed))
+        self.rows, self.keys, self.by_student = rows, [_sort_key(row) for row in rows], by_student
+        self.version = version
+
+    def insert(self, row, version):
+        """Nova resposta (versão seguinte à atual): entra na posição certa, os de baixo descem uma"""
+        key = _sort_key(row)
+        index = bisect.bisect(self.keys, key)
+        self.keys.insert(index, key)
+        self.rows.insert(index, row)
+        self.by_student[row['student_id']] = row
+        for position in range(index, len(self.rows)):
+            self.rows[position]['position'] = position + 1
+
+        moved = {other['student_id'] for other in self.rows[index + 1:]}
+        self.log.append((self.version, version, {row['student_id']}, moved, set()))
+        self.version = version
+
+    def _changes_since(self, since):
+        """Delta desde a versão since, ou None se ela não estiver coberta pelo histórico"""
+        if since == self.version:
+            return {'changes': [], 'moved': [], 'removed': []}
+        if not self.log or since is None or not self.log[0][0] <= since < self.version:
+            return None
+
+        changed, moved, removed = set(), set(), set()
+        for _, version, entry_changed, entry_moved, entry_removed in self.log:
+            if version > since:
+                changed |= entry_changed
+                moved |= entry_moved
+                removed |= entry_removed
+
+        current = self.by_student
+        return {
+            'changes': [dict(current[student_id]) for student_id in changed if student_id in current],
+            'moved': [
+                [student_id, current[student_id]['position']]
+                for student_id in moved - changed if student_id in current
+            ],
+            'removed': [student_id for student_id in removed if student_id not in current]
+        }
+
+    def payload(self, since=None):
+        """Resposta para um cliente na versão since: delta ou (full=True) o ranking completo"""
+        with self.lock:
+            delta = self._changes_since(since)
+            data = {'version': self.version, 'response_count': len(self.rows), 'full': delta is None}
+            if delta is None:
+                data['ranking'] = [dict(row) for row in self.rows]
+            else:
+                data.update(delta)
+            return data
+
+
+_feeds = OrderedDict()  # quiz_id -> RankingFeed
+_lock = threading.Lock()
+
+
+def _get_feed(quiz_id):
+    with _lock:
+        feed = _feeds.get(quiz_id)
+        if feed is None:
+            feed = _feeds[quiz_id] = RankingFeed(quiz_id)
+            while len(_feeds) > RANKING_FEEDS_MAX:
+                _feeds.popitem(last=False)
+        _feeds.move_to_end(quiz_id)
+        return feed
+
+
+def _load_rows(quiz_id):
+    rows = db.session.query(
+        QuizResponse.student_id, User.name, QuizResponse.points, QuizResponse.score, QuizResponse.total,
+        QuizResponse.percentage, QuizResponse.time_taken, QuizResponse.submitted_at
+    ).outerjoin(User, User.id == QuizResponse.student_id).filter(QuizResponse.quiz_id == quiz_id).all()
+    return [ranking_row(*row) for row in rows]
+
+
+def get_ranking_feed(quiz_id, version):
+    """Feed do quiz em pelo menos a versão informada (relê o banco se estiver atrás)"""
+    feed = _get_feed(quiz_id)
+    with feed.lock:
+        if feed.version is None or version > feed.version:
+            feed.replace(_load_rows(quiz_id), version)
+    return feed
+
+
+def record_response(quiz_id, row, version):
+    """
+    Resposta gravada (na versão informada): aplica no ranking e retorna o payload do evento
+    (delta desde a versão anterior, ou o ranking completo se o feed não estava em dia).
+    """
+    feed = _get_feed(quiz_id)
+    with feed.lock:
+        if feed.version == version - 1 and row['student_id'] not in feed.by_student:
+            feed.insert(row, version)
+        elif feed.version is None or version > feed.version:
+            feed.replace(_load_rows(quiz_id), version)
+    return feed.payload(version - 1)
@@ -0,0 +1,306 @@
+"""
+Push em tempo real (Server-Sent Events) com salas por quiz, atividade e apresentação
+emit(sala, evento, dados) publica no backend de pub/sub; cada processo entrega na sala local,
+onde os clientes conectados (GET .../events) esperam.
+
+A mensagem SSE é montada uma vez por emit e guardada no buffer da sala; os membros esperam
+na condição da sala e leem do buffer, então publicar custa o mesmo para 1 ou 500 membros.
+
+Backends (REALTIME_BACKEND):
+- memory: entrega no próprio processo (um nó só, scripts e testes)
+- redis: publica no canal REALTIME_REDIS_CHANNEL; todos os processos inscritos entregam
+  nas suas salas (requer o pacote redis e REALTIME_REDIS_URL/REDIS_URL)
+
+Ids dos eventos (Last-Event-ID): no redis, o seq de cada sala vem de um contador compartilhado
+(INCR), então o mesmo evento tem o mesmo id em qualquer processo e a reconexão pode cair em outro
+worker. No memory o seq é do processo. Quando o buffer da sala não cobre o id recebido (outro
+processo sem o histórico, reinício, buffer esgotado), o stream envia 'resync' e segue do evento
+atual: o cliente recarrega o estado pela API em vez de perder ou repetir eventos.
+
+Os streams ficam abertos até REALTIME_STREAM_TIMEOUT_SECONDS e exigem um servidor de processo
+longo (gunicorn com threads/gevent). Em serverless (Vercel) a função é encerrada no limite de
+duração do plano: use um timeout menor que esse limite ou hospede o backend fora dele.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import redis
+except ImportError:  # redis é opcional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+REALTIME_BACKEND = os.getenv('REALTIME_BACKEND', 'memory').lower()
+REALTIME_REDIS_URL = os.getenv('REALTIME_REDIS_URL') or os.getenv('REDIS_URL')
+REALTIME_REDIS_CHANNEL = os.getenv('REALTIME_REDIS_CHANNEL', 'realtime')
+ROOM_BUFFER_SIZE = 100  # Eventos recentes por sala (reconexão com Last-Event-ID)
+ROOM_IDLE_SECONDS = 3600  # Salas sem membros e sem eventos há mais tempo são descartadas
+STREAM_TIMEOUT_SECONDS = int(os.getenv('REALTIME_STREAM_TIMEOUT_SECONDS', 600))  # Duração máxima de uma conexão (o cliente reconecta sozinho)
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_RETRY_MS = 3000
+EVENT_RESYNC = 'resync'  # O stream não pôde retomar do Last-Event-ID: o cliente recarrega o estado
+
+
+def quiz_room(quiz_id):
+    return f'quiz_{quiz_id}'
+
+
+def activity_room(activity_id):
+    return f'activity_{activity_id}'
+
+
+def presentation_room(code):
+    return f'presentation_{code}'
+
+
+class Room:
+    """Eventos recentes de uma sala, indexados pelo seq da sala (id do evento SSE)"""
+
+    def __init__(self, name, base_seq=0):
+        self.name = name
+        self.events = deque(maxlen=ROOM_BUFFER_SIZE)  # (seq, mensagem SSE pronta)
+        self.last_seq = base_seq  # Último seq conhecido (eventos anteriores à sala não estão no buffer)
+        self.members = 0
+        self.accessed_at = time.monotonic()
+        self.condition = threading.Condition()
+
+    def push(self, event, data, seq=None):
+        """seq vem do backend (contador compartilhado); sem ele, é o próximo seq local"""
+        with self.condition:
+            if seq is None:
+                seq = self.last_seq + 1
+            elif seq <= self.last_seq:
+                return  # Já entregue (ou anterior à criação da sala)
+            self.last_seq = seq
+            message = f"id: {self.last_seq}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+            self.events.append((self.last_seq, message))
+            self.accessed_at = time.monotonic()
+            self.condition.notify_all()
+
+    def covers(self, last_seq):
+        """O buffer tem todos os eventos depois de last_seq (a reconexão pode retomar dele)"""
+        with self.condition:
+            oldest = self.events[0][0] - 1 if self.events else self.last_seq
+            return oldest <= last_seq <= self.last_seq
+
+    def since(self, last_seq):
+        with self.condition:
+            if not self.events or self.events[-1][0] <= last_seq:
+                return []
+            return [event for event in self.events if event[0] > last_seq]
+
+    def wait(self, last_seq, timeout):
+        """Bloqueia até chegar um evento depois de last_seq (ou o timeout)"""
+        with self.condition:
+            if self.last_seq <= last_seq:
+                self.condition.wait(timeout)
+
+
+class Hub:
+    """Salas deste processo"""
+
+    def __init__(self):
+        self._rooms = {}
+        self._listeners = []  # (prefixo da sala, callback(sala, evento, dados)): avisos entre processos
+        self._lock = threading.Lock()
+
+    def add_listener(self, prefix, callback):
+        """Recebe todos os eventos das salas com o prefixo, com ou sem membros neste processo"""
+        with self._lock:
+            self._listeners.append((prefix, callback))
+
+    def join(self, name, current_seq=None):
+        """current_seq(sala): seq atual no backend, lido só quando a sala é criada neste processo"""
+        with self._lock:
+            self._purge_idle()
+            room = self._rooms.get(name)
+            if room is None:
+                room = self._rooms[name] = Room(name, current_seq(name) if current_seq else 0)
+            room.members += 1
+            room.accessed_at = time.monotonic()
+            return room
+
+    def leave(self, room):
+        with self._lock:
+            room.members -= 1
+            room.accessed_at = time.monotonic()
+
+    def deliver(self, name, event, data, seq=None):
+        """Entrega na sala local (sem membros neste processo, o evento é descartado) e aos listeners"""
+        with self._lock:
+            room = self._rooms.get(name)
+            listeners = [callback for prefix, callback in self._listeners if name.startswith(prefix)]
+        for callback in listeners:
+            try:
+                callback(name, event, data)
+            except Exception as e:
+                logger.error(f"[REALTIME] Falha no listener de {name}: {e}")
+        if room is not None:
+            room.push(event, data, seq)
+
+    def members(self, name):
+        with self._lock:
+            room = self._rooms.get(name)
+            return room.members if room else 0
+
+    def _purge_idle(self):
+        now = time.monotonic()
+        idle = [name for name, room in self._rooms.items()
+                if room.members <= 0 and now - room.accessed_at > ROOM_IDLE_SECONDS]
+        for name in idle:
+            del self._rooms[name]
+
+
+class MemoryPubSub:
+    """Entrega direto nas salas do próprio processo"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, room, event, data):
+        self.hub.deliver(room, event, data)
+
+    def current_seq(self, room):
+        """Sem seq compartilhado: a sala começa do 0 neste processo"""
+        return 0
+
+
+# Seq da sala + publicação em um único comando atômico: a ordem de entrega no canal é a ordem dos
+# seqs (com INCR e PUBLISH separados, dois workers podiam publicar 6 antes de 5 e a sala descartava o 5)
+PUBLISH_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('PUBLISH', ARGV[1], seq .. '\\n' .. ARGV[2])
+return seq
+"""
+
+
+class RedisPubSub:
+    """Publica no Redis; uma thread por processo recebe o canal e entrega nas salas locais"""
+
+    def __init__(self, hub, url, channel=REALTIME_REDIS_CHANNEL):
+        if redis is None:
+            raise RuntimeError('Pacote redis não instalado')
+        self.hub = hub
+        self.channel = channel
+        self.seq_ttl_seconds = ROOM_IDLE_SECONDS
+        self.client = redis.Redis.from_url(url)
+        self._publish = self.client.register_script(PUBLISH_SCRIPT)
+        self._listener = threading.Thread(target=self._listen, name='realtime-redis', daemon=True)
+        self._listener.start()
+
+    def publish(self, room, event, data):
+        message = json.dumps({'room': room, 'event': event, 'data': data}, default=str)
+        self._publish(keys=[self._seq_key(room)], args=[self.channel, message, self.seq_ttl_seconds])
+
+    def current_seq(self, room):
+        try:
+            return int(self.client.get(self._seq_key(room)) or 0)
+        except Exception as e:
+            logger.error(f"[REALTIME] Falha ao ler o seq de {room}: {e}")
+            return 0
+
+    def _seq_key(self, room):
+        return f'{self.channel}:seq:{room}'
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    # "<seq>\n<json>" (o json.dumps não tem quebras de linha literais)
+                    seq, _, body = message['data'].partition(b'\n')
+                    payload = json.loads(body)
+                    self.hub.deliver(payload['room'], payload['event'], payload['data'], int(seq))
+            except Exception as e:
+                logger.error(f"[REALTIME] Conexão com o Redis perdida: {e}")
+                time.sleep(1)
+
+
+_hub = Hub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_hub():
+    return _hub
+
+
+def get_backend():
+    """Backend configurado (criado no primeiro uso; sem Redis disponível, usa o de memória)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def _create_backend():
+    if REALTIME_BACKEND == 'redis':
+        try:
+            if not REALTIME_REDIS_URL:
+                raise RuntimeError('REALTIME_REDIS_URL não configurada')
+            return RedisPubSub(_hub, REALTIME_REDIS_URL)
+        except Exception as e:
+            logger.error(f"[REALTIME] Redis indisponível, usando entrega local: {e}")
+    return MemoryPubSub(_hub)
+
+
+def emit(room, event, data):
+    """Publica um evento na sala (falhas são registradas e nunca interrompem a requisição)"""
+    try:
+        get_backend().publish(room, event, data)
+    except Exception as e:
+        logger.error(f"[REALTIME] Falha ao emitir {event} para {room}: {e}")
+
+
+def stream_room(name, last_seq=None, timeout=STREAM_TIMEOUT_SECONDS):
+    """
+    Gerador de mensagens SSE da sala.
+    Sem last_seq, começa do próximo evento; com Last-Event-ID, reenvia o que ainda estiver no buffer
+    ou, se o buffer não cobrir o id, envia 'resync' e segue a partir de agora.
+    """
+    room = _hub.join(name, get_backend().current_seq)
+    try:
+        deadline = time.monotonic() + timeout
+        last_sent = time.monotonic()
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        if last_seq is None:
+            last_seq = room.last_seq
+        elif not room.covers(last_seq):
+            last_seq = room.last_seq
+            yield f"id: {last_seq}\nevent: {EVENT_RESYNC}\ndata: {{}}\n\n"
+
+        while time.monotonic() < deadline:
+            for seq, message in room.since(last_seq):
+                yield message
+                last_seq = seq
+                last_sent = time.monotonic()
+
+            if time.monotonic() - last_sent >= STREAM_HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+
+            room.wait(last_seq, STREAM_HEARTBEAT_SECONDS)
+    finally:
+        _hub.leave(room)
+
+
+def parse_room_event_id(value):
+    """Last-Event-ID do cabeçalho/parâmetro (None se ausente ou inválido)"""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,31 @@
+"""
+Cache dos relatórios calculados (JSON do relatório e exportação em PDF)
+Cada entrada guarda a versão com que foi calculada (ex: response_version da atividade +
+número de matriculados); se a versão atual for diferente, o relatório é recalculado.
+Como a versão fica no banco, envios gravados por outros processos também invalidam o cache.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', 256))
+
+_cache = OrderedDict()  # chave -> (versão, relatório)
+_lock = threading.Lock()
+
+
+def get_cached_report(cache_key, version, build):
+    """Relatório em cache para a versão informada; build() só é chamado em caso de falta"""
+    with _lock:
+        entry = _cache.get(cache_key)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(cache_key)
+            return entry[1]
+
+    report = build()
+    with _lock:
+        _cache[cache_key] = (version, report)
+        _cache.move_to_end(cache_key)
+        while len(_cache) > REPORT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return report
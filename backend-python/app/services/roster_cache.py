@@ -0,0 +1,80 @@
+"""
+Cache da lista de alunos matriculados por disciplina (usado pelo ranking ao vivo)
+Evita reler as matrículas a cada polling do professor. A entrada expira em ROSTER_TTL_SECONDS
+e é invalidada quando uma matrícula da disciplina é criada/removida neste processo.
+Matrículas feitas em outro processo: is_enrolled confere no banco quando o aluno não está na
+lista em cache (e recarrega a lista se ele estiver matriculado).
+"""
+import os
+import threading
+import time
+import zlib
+from sqlalchemy import event
+from app import db
+from app.models.enrollment import Enrollment
+from app.models.user import User
+
+ROSTER_TTL_SECONDS = int(os.getenv('ROSTER_TTL_SECONDS', 60))
+
+
+class Roster:
+    """Alunos da disciplina em ordem alfabética"""
+
+    def __init__(self, students):
+        self.students = students  # [(student_id, name)] ordenado por nome
+        self.names = dict(students)
+        self.fingerprint = zlib.crc32(repr(students).encode())  # Identifica a lista (ETag do ranking)
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.students)
+
+    def __contains__(self, student_id):
+        return student_id in self.names
+
+
+_rosters = {}
+_lock = threading.Lock()
+
+
+def get_roster(subject_id):
+    with _lock:
+        roster = _rosters.get(subject_id)
+    if roster is not None and time.monotonic() - roster.loaded_at < ROSTER_TTL_SECONDS:
+        return roster
+
+    rows = db.session.query(User.id, User.name).join(
+        Enrollment, Enrollment.student_id == User.id
+    ).filter(
+        Enrollment.subject_id == subject_id
+    ).distinct().order_by(User.name, User.id).all()
+
+    roster = Roster([(student_id, name) for student_id, name in rows])
+    with _lock:
+        _rosters[subject_id] = roster
+    return roster
+
+
+def is_enrolled(subject_id, student_id):
+    """Matrícula do aluno: lista em cache; se ele não estiver nela, confere no banco"""
+    if student_id in get_roster(subject_id):
+        return True
+    enrolled = db.session.query(Enrollment.id).filter(
+        Enrollment.subject_id == subject_id,
+        Enrollment.student_id == student_id
+    ).first() is not None
+    if enrolled:
+        # Matriculado por outro processo: a lista em cache está desatualizada
+        invalidate_roster(subject_id)
+    return enrolled
+
+
+def invalidate_roster(subject_id):
+    with _lock:
+        _rosters.pop(subject_id, None)
+
+
+@event.listens_for(Enrollment, 'after_insert')
+@event.listens_for(Enrollment, 'after_delete')
+def _enrollment_changed(mapper, connection, target):
+    invalidate_roster(target.subject_id)
@@ -0,0 +1,326 @@
+"""
+Serviço de busca textual nas transcrições
+Indexa janelas da transcrição inteira (transcript_search_windows), com SEARCH_WINDOW_OVERLAP
+caracteres repetidos entre janelas vizinhas: termos e frases divididos entre dois auto-saves
+continuam juntos em alguma janela. As bordas das janelas ficam sempre entre palavras.
+Snapshots congelados de checkpoints antigos (texto que não está mais na transcrição) também
+entram, como janelas com checkpoint_id.
+
+- SQLite (dev/testes): tabela virtual FTS5 sincronizada por triggers
+- PostgreSQL (produção): coluna tsvector gerada + índice GIN
+
+A cada trecho anexado só as janelas do final (as que ainda tocavam o fim do texto) são refeitas,
+sem reprocessar a transcrição inteira. A tabela é criada por migrate_transcript_search.py; antes
+disso a gravação continua funcionando e o índice só deixa de ser atualizado.
+"""
+import os
+import re
+import time
+import unicodedata
+from sqlalchemy import text, inspect
+from app import db
+from app.utils.compression import decompress_text
+
+SEARCH_LANGUAGE = 'portuguese'  # Configuração de texto do PostgreSQL
+SNIPPET_CHARS = 80  # Caracteres de contexto antes/depois do termo encontrado
+MAX_RESULTS = 50
+SEARCH_WINDOW_CHARS = int(os.getenv('SEARCH_WINDOW_CHARS', 1000))  # Tamanho nominal de uma janela
+SEARCH_WINDOW_OVERLAP = int(os.getenv('SEARCH_WINDOW_OVERLAP', 200))  # Frases até este tamanho nunca são cortadas
+WINDOW_STEP = max(SEARCH_WINDOW_CHARS - SEARCH_WINDOW_OVERLAP, 1)
+TABLE_CHECK_SECONDS = 60  # Sem a tabela (migração pendente), confere de novo depois deste tempo
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS transcript_search_fts USING fts5(
+        text, content='transcript_search_windows', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS transcript_search_fts_ai AFTER INSERT ON transcript_search_windows BEGIN
+        INSERT INTO transcript_search_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transcript_search_fts_ad AFTER DELETE ON transcript_search_windows BEGIN
+        INSERT INTO transcript_search_fts(transcript_search_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transcript_search_fts_au AFTER UPDATE OF text ON transcript_search_windows BEGIN
+        INSERT INTO transcript_search_fts(transcript_search_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO transcript_search_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    "INSERT INTO transcript_search_fts(transcript_search_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_DDL = [
+    f"""ALTER TABLE transcript_search_windows ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{SEARCH_LANGUAGE}', coalesce(text, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_transcript_search_windows_search ON transcript_search_windows USING GIN (search_vector)",
+]
+
+_table_checked = (0, False)  # (instante da verificação, tabela existe)
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _index_table_ready():
+    """Indica se a tabela de janelas existe (a existência fica em cache no processo)"""
+    global _table_checked
+    checked_at, ready = _table_checked
+    if not ready and time.monotonic() - checked_at > TABLE_CHECK_SECONDS:
+        ready = inspect(db.engine).has_table('transcript_search_windows')
+        _table_checked = (time.monotonic(), ready)
+    return ready
+
+
+def ensure_search_index():
+    """Cria o índice de busca do banco atual (idempotente). Retorna o nome do backend."""
+    from app.models.transcription_session import TranscriptSearchWindow
+
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        statements = SQLITE_DDL
+    elif dialect == 'postgresql':
+        statements = POSTGRES_DDL
+    else:
+        raise RuntimeError(f'Busca textual não suportada para o banco {dialect}')
+
+    TranscriptSearchWindow.__table__.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+        conn.commit()
+    return dialect
+
+
+def build_windows(value, base=0, first_seq=0):
+    """
+    Janelas [(seq, início, fim, texto)] a partir da janela first_seq.
+    value é o texto da transcrição a partir da posição base (base < first_seq * WINDOW_STEP,
+    para enxergar o caractere anterior ao início da janela, ou 0).
+    """
+    windows = []
+    end_of_text = base + len(value)
+    seq = first_seq
+    while seq * WINDOW_STEP < end_of_text:
+        nominal = seq * WINDOW_STEP
+        start = nominal - base
+        # Começa na próxima palavra inteira
+        while 0 < start < len(value) and not value[start - 1].isspace():
+            start += 1
+        while start < len(value) and value[start].isspace():
+            start += 1
+        # Termina no fim da palavra que atravessa o limite
+        end = min(nominal + SEARCH_WINDOW_CHARS - base, len(value))
+        while end < len(value) and not value[end].isspace():
+            end += 1
+        if start < end:
+            windows.append((seq, base + start, base + end, value[start:end]))
+        seq += 1
+    return windows
+
+
+def _insert_windows(session_id, checkpoint_id, windows):
+    if not windows:
+        return
+    db.session.execute(text(
+        "INSERT INTO transcript_search_windows (session_id, checkpoint_id, seq, start_offset, end_offset, text) "
+        "VALUES (:session_id, :checkpoint_id, :seq, :start, :end, :text)"
+    ), [
+        {'session_id': session_id, 'checkpoint_id': checkpoint_id, 'seq': seq, 'start': start, 'end': end, 'text': value}
+        for seq, start, end, value in windows
+    ])
+
+
+def index_session_text(session_id, value):
+    """Reindexa a transcrição inteira da sessão (reescrita ou backfill)"""
+    if not _index_table_ready():
+        return
+    db.session.execute(text(
+        "DELETE FROM transcript_search_windows WHERE session_id = :id AND checkpoint_id IS NULL"
+    ), {'id': session_id})
+    _insert_windows(session_id, None, build_windows(value or ''))
+
+
+def index_appended_text(session, previous_length, appended):
+    """
+    Atualiza o índice depois de anexar `appended` ao fim da transcrição (de tamanho previous_length).
+    Refaz só as janelas que alcançavam o fim anterior do texto e cria as novas.
+    """
+    if not _index_table_ready():
+        return
+    params = {'id': session.id, 'length': previous_length}
+    first_seq = db.session.execute(text(
+        "SELECT MIN(seq) FROM transcript_search_windows "
+        "WHERE session_id = :id AND checkpoint_id IS NULL AND end_offset >= :length"
+    ), params).scalar()
+    if first_seq is None:
+        first_seq = db.session.execute(text(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM transcript_search_windows "
+            "WHERE session_id = :id AND checkpoint_id IS NULL"
+        ), params).scalar()
+    params['seq'] = first_seq
+    db.session.execute(text(
+        "DELETE FROM transcript_search_windows WHERE session_id = :id AND checkpoint_id IS NULL AND seq >= :seq"
+    ), params)
+
+    base = min(max(first_seq * WINDOW_STEP - 1, 0), previous_length)
+    value = session.transcript_range(base, previous_length) + appended
+    _insert_windows(session.id, None, build_windows(value, base, first_seq))
+
+
+def index_checkpoint_snapshot(checkpoint):
+    """Indexa o snapshot congelado de um checkpoint (texto que pode sair da transcrição)"""
+    if not _index_table_ready():
+        return
+    db.session.execute(text(
+        "DELETE FROM transcript_search_windows WHERE checkpoint_id = :id"
+    ), {'id': checkpoint.id})
+    _insert_windows(checkpoint.session_id, checkpoint.id, build_windows(checkpoint._transcript_snapshot or ''))
+
+
+def rebuild_search_index(batch_size=100):
+    """
+    Indexa todas as sessões e snapshots congelados (migração). Usa SQL direto: o texto da sessão
+    é a coluna materializada mais os segmentos posteriores. Retorna (sessões, snapshots).
+    """
+    global _table_checked
+    _table_checked = (time.monotonic(), True)
+
+    sessions = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, full_transcript FROM transcription_sessions WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+        if not rows:
+            break
+        for session_id, value in rows:
+            last_id = session_id
+            materialized = decompress_text(value) or ''
+            tail = db.session.execute(text(
+                "SELECT text FROM transcript_segments WHERE session_id = :id AND start_offset >= :start ORDER BY seq"
+            ), {'id': session_id, 'start': len(materialized)}).scalars()
+            index_session_text(session_id, materialized + ''.join(tail))
+            sessions += 1
+        db.session.commit()
+
+    snapshots = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, session_id, transcript_at_checkpoint FROM transcription_checkpoints "
+            "WHERE transcript_offset IS NULL AND id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+        if not rows:
+            break
+        for checkpoint_id, session_id, value in rows:
+            last_id = checkpoint_id
+            db.session.execute(text(
+                "DELETE FROM transcript_search_windows WHERE checkpoint_id = :id"
+            ), {'id': checkpoint_id})
+            _insert_windows(session_id, checkpoint_id, build_windows(decompress_text(value) or ''))
+            snapshots += 1
+        db.session.commit()
+    return sessions, snapshots
+
+
+def _query_terms(query):
+    return [term for term in re.findall(r'\w+', query or '', re.UNICODE) if len(term) > 1]
+
+
+def _sqlite_search(session_ids, terms, limit):
+    # Cada termo entre aspas: evita que a sintaxe do FTS5 (AND, NEAR, *, ...) venha do usuário
+    match = ' '.join(f'"{term}"' for term in terms)
+    params = {'match': match, 'limit': limit}
+    placeholders = ', '.join(f':s{i}' for i in range(len(session_ids)))
+    params.update({f's{i}': session_id for i, session_id in enumerate(session_ids)})
+
+    sql = f"""
+        SELECT w.session_id, w.checkpoint_id, w.start_offset, w.text, bm25(transcript_search_fts) AS rank
+        FROM transcript_search_fts
+        JOIN transcript_search_windows w ON w.id = transcript_search_fts.rowid
+        WHERE transcript_search_fts MATCH :match AND w.session_id IN ({placeholders})
+        ORDER BY rank
+        LIMIT :limit
+    """
+    # bm25() do FTS5 é negativo (menor = melhor); invertido para manter "maior = melhor"
+    return [(row[0], row[1], row[2], row[3], -row[4]) for row in db.session.execute(text(sql), params)]
+
+
+def _postgres_search(session_ids, terms, limit):
+    sql = f"""
+        SELECT w.session_id, w.checkpoint_id, w.start_offset, w.text,
+               ts_rank(w.search_vector, plainto_tsquery('{SEARCH_LANGUAGE}', :query)) AS rank
+        FROM transcript_search_windows w
+        WHERE w.search_vector @@ plainto_tsquery('{SEARCH_LANGUAGE}', :query)
+          AND w.session_id = ANY(:session_ids)
+        ORDER BY rank DESC
+        LIMIT :limit
+    """
+    params = {'query': ' '.join(terms), 'session_ids': list(session_ids), 'limit': limit}
+    return [tuple(row) for row in db.session.execute(text(sql), params)]
+
+
+def _fold(value):
+    """Minúsculas sem acentos, caractere a caractere (preserva as posições)"""
+    return ''.join(unicodedata.normalize('NFD', ch)[0] for ch in value.lower())
+
+
+def _snippet(window_text, start_offset, terms):
+    """Recorta o trecho em volta da primeira ocorrência de um dos termos"""
+    folded = _fold(window_text)
+    positions = [folded.find(_fold(term)) for term in terms]
+    positions = [p for p in positions if p >= 0]
+    # Sem ocorrência literal (ex: stemming do PostgreSQL): usa o início da janela
+    pos = min(positions) if positions else 0
+
+    begin = max(0, pos - SNIPPET_CHARS)
+    end = min(len(window_text), pos + SNIPPET_CHARS)
+    snippet = window_text[begin:end]
+    if begin > 0:
+        snippet = '...' + snippet
+    if end < len(window_text):
+        snippet = snippet + '...'
+
+    return {
+        'snippet': snippet,
+        'offset': start_offset + pos,
+        'snippet_start': start_offset + begin,
+        'snippet_end': start_offset + end
+    }
+
+
+def search_transcripts(session_ids, query, limit=MAX_RESULTS):
+    """
+    Busca os termos nas transcrições das sessões informadas.
+
+    Returns:
+        list: resultados ordenados por relevância, com trecho e offset na transcrição completa da
+        sessão (ou no snapshot do checkpoint, quando checkpoint_id vem preenchido)
+    """
+    terms = _query_terms(query)
+    if not terms or not session_ids:
+        return []
+
+    limit = min(max(int(limit), 1), MAX_RESULTS)
+    # Janelas vizinhas se sobrepõem: a mesma ocorrência pode vir duas vezes
+    fetch = limit * 2
+    if _dialect() == 'postgresql':
+        rows = _postgres_search(session_ids, terms, fetch)
+    else:
+        rows = _sqlite_search(session_ids, terms, fetch)
+
+    results = []
+    seen = set()
+    for session_id, checkpoint_id, start_offset, window_text, rank in rows:
+        result = {
+            'session_id': session_id,
+            'checkpoint_id': checkpoint_id,
+            'rank': round(float(rank), 6)
+        }
+        result.update(_snippet(window_text or '', start_offset, terms))
+        key = (session_id, checkpoint_id, result['offset'])
+        if key in seen:
+            continue
+        seen.add(key)
+        results.append(result)
+        if len(results) >= limit:
+            break
+    return results
@@ -0,0 +1,160 @@
+"""
+Coalescência de chamadas idênticas simultâneas (single-flight)
+Quem chega com uma chave que já está em andamento espera o mesmo Future e recebe o mesmo
+resultado (ou a mesma exceção), em vez de repetir o trabalho (ex: duas abas gerando o resumo
+da mesma sessão ao mesmo tempo fazem uma única chamada à OpenAI).
+
+Entre processos (opcional, SINGLE_FLIGHT_LOCK_BACKEND=redis): worker_lock(chave) serializa a
+mesma chave em todos os workers; quem espera o lock relê o cache persistente ao entrar e só
+repete a chamada se o resultado não estiver lá. Sem o Redis, o lock é um no-op.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import redis
+except ImportError:  # redis é opcional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_LOCK_BACKEND = os.getenv('SINGLE_FLIGHT_LOCK_BACKEND', 'none').lower()  # none | redis
+SINGLE_FLIGHT_REDIS_URL = os.getenv('SINGLE_FLIGHT_REDIS_URL') or os.getenv('REDIS_URL')
+LOCK_TTL_SECONDS = int(os.getenv('SINGLE_FLIGHT_LOCK_TTL', 180))  # Expira sozinho se o worker cair
+LOCK_WAIT_SECONDS = int(os.getenv('SINGLE_FLIGHT_LOCK_WAIT', 120))  # Depois disso, segue sem o lock
+LOCK_POLL_SECONDS = 0.2
+
+
+class SingleFlight:
+    """Chamadas em andamento neste processo, por chave"""
+
+    def __init__(self):
+        self._calls = {}  # chave -> Future
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Executa fn() uma vez por chave em andamento; chamadas simultâneas esperam o mesmo resultado"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class RedisLockBackend:
+    """SET NX PX + liberação só pelo dono (script atômico)"""
+
+    RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, url, prefix='single_flight:'):
+        if redis is None:
+            raise RuntimeError('Pacote redis não instalado')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._release = self.client.register_script(self.RELEASE_SCRIPT)
+
+    def acquire(self, name, ttl):
+        """Tenta pegar o lock; retorna um token (ou None se outro worker tem o lock)"""
+        token = uuid.uuid4().hex
+        if self.client.set(self.prefix + name, token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def release(self, name, token):
+        self._release(keys=[self.prefix + name], args=[token])
+
+
+_flight = SingleFlight()
+_backend = None
+_backend_lock = threading.Lock()
+_backend_ready = False
+
+
+def get_single_flight():
+    return _flight
+
+
+def get_lock_backend():
+    """Backend configurado (criado no primeiro uso); None sem Redis"""
+    global _backend, _backend_ready
+    if not _backend_ready:
+        with _backend_lock:
+            if not _backend_ready:
+                _backend = _create_lock_backend()
+                _backend_ready = True
+    return _backend
+
+
+def set_lock_backend(backend):
+    global _backend, _backend_ready
+    _backend, _backend_ready = backend, True
+
+
+def _create_lock_backend():
+    if SINGLE_FLIGHT_LOCK_BACKEND == 'redis':
+        try:
+            if not SINGLE_FLIGHT_REDIS_URL:
+                raise RuntimeError('SINGLE_FLIGHT_REDIS_URL não configurada')
+            return RedisLockBackend(SINGLE_FLIGHT_REDIS_URL)
+        except Exception as e:
+            logger.error(f"[SINGLE FLIGHT] Redis indisponível, coalescendo só dentro do processo: {e}")
+    return None
+
+
+@contextmanager
+def worker_lock(name, ttl=LOCK_TTL_SECONDS, wait=LOCK_WAIT_SECONDS):
+    """
+    Lock da chave entre workers (no-op sem backend). Espera no máximo wait segundos;
+    se o backend falhar ou o tempo acabar, segue sem o lock (nunca bloqueia a geração).
+    """
+    backend = get_lock_backend()
+    token = None
+    if backend is not None:
+        deadline = time.monotonic() + wait
+        try:
+            while token is None and time.monotonic() < deadline:
+                token = backend.acquire(name, ttl)
+                if token is None:
+                    time.sleep(LOCK_POLL_SECONDS)
+        except Exception as e:
+            logger.error(f"[SINGLE FLIGHT] Falha no lock {name}: {e}")
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            try:
+                backend.release(name, token)
+            except Exception as e:
+                logger.error(f"[SINGLE FLIGHT] Falha ao liberar o lock {name}: {e}")
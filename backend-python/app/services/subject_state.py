@@ -0,0 +1,197 @@
+"""
+Estado "há atividade ao vivo?" por disciplina (dashboard do aluno)
+Cada disciplina tem uma versão em memória, incrementada quando uma sessão ou atividade da
+disciplina muda (criada, enviada, resumo compartilhado, encerrada...). O long-poll e o SSE de
+/subjects/<id>/active esperam nessa versão, sem consultar o banco; o estado em si é
+calculado uma vez por versão e compartilhado por todos os alunos do processo.
+
+Entre processos, cada mudança é publicada no pub/sub do realtime (REALTIME_BACKEND=redis):
+os outros processos avançam a versão da disciplina (max(local + 1, recebida)), descartam o
+estado em cache e acordam quem espera. Uma versão enviada pelo cliente maior que a local (vista
+em outro processo) é adotada antes de esperar. Sem pub/sub compartilhado (backend memory), o
+estado em cache expira em ACTIVE_STATE_TTL segundos e a espera nunca passa de ACTIVE_WAIT_SECONDS.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+import zlib
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+from app.models.transcription_session import TranscriptionSession, LiveActivity
+from app.services import realtime
+
+ACTIVE_WAIT_SECONDS = int(os.getenv('ACTIVE_WAIT_SECONDS', 25))  # Espera máxima do long-poll
+ACTIVE_STATE_TTL = float(os.getenv('ACTIVE_STATE_TTL', 10))  # Idade máxima do estado em cache
+STREAM_TIMEOUT_SECONDS = realtime.STREAM_TIMEOUT_SECONDS  # Duração máxima de uma conexão SSE (o cliente reconecta sozinho)
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_RETRY_MS = 3000
+
+EVENT_STATE = 'state'
+EVENT_CHANGED = 'subject_changed'
+SUBJECT_ROOM_PREFIX = 'subject_state_'
+PROCESS_ID = secrets.token_hex(8)  # Ignora os próprios avisos recebidos de volta pelo pub/sub
+
+# Campos que alteram o resultado de /subjects/<id>/active
+SESSION_FIELDS = ('status', 'started_at', 'subject_id')
+ACTIVITY_FIELDS = (
+    'status', 'activity_type', 'title', 'content', 'ai_generated_content', 'shared_with_students',
+    'time_limit', 'starts_at', 'ends_at', 'target_students'
+)
+
+_versions = {}  # subject_id -> versão
+_states = {}  # subject_id -> (versão, calculado_em, estado, assinatura)
+_condition = threading.Condition()
+
+
+def bump_subjects(subject_ids):
+    """Marca a mudança, acorda quem espera (mudanças são raras: um notify_all basta) e avisa os outros processos"""
+    with _condition:
+        versions = {}
+        for subject_id in subject_ids:
+            versions[subject_id] = _versions[subject_id] = _versions.get(subject_id, 0) + 1
+            _states.pop(subject_id, None)
+        _condition.notify_all()
+    for subject_id, version in versions.items():
+        realtime.emit(f'{SUBJECT_ROOM_PREFIX}{subject_id}', EVENT_CHANGED, {'version': version, 'origin': PROCESS_ID})
+
+
+def _remote_change(room, event, data):
+    """Mudança publicada por outro processo"""
+    if event != EVENT_CHANGED or data.get('origin') == PROCESS_ID:
+        return
+    subject_id = int(room[len(SUBJECT_ROOM_PREFIX):])
+    with _condition:
+        _versions[subject_id] = max(_versions.get(subject_id, 0) + 1, int(data.get('version') or 0))
+        _states.pop(subject_id, None)
+        _condition.notify_all()
+
+
+realtime.get_hub().add_listener(SUBJECT_ROOM_PREFIX, _remote_change)
+
+
+def wait_for_change(subject_id, version, timeout):
+    """Bloqueia até a versão da disciplina ser diferente de version (ou o timeout). Retorna a versão atual."""
+    realtime.get_backend()  # Inscreve o processo no pub/sub (avisos de outros processos)
+    deadline = time.monotonic() + timeout
+    with _condition:
+        if version is not None and version > _versions.get(subject_id, 0):
+            # Versão vista em outro processo, à frente desta: adota e espera a próxima mudança
+            _versions[subject_id] = version
+            _states.pop(subject_id, None)
+        while _versions.get(subject_id, 0) == version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _condition.wait(remaining)
+        return _versions.get(subject_id, 0)
+
+
+def get_active_state(subject_id, build):
+    """(versão, estado) da disciplina; build() só é chamado se não houver estado recente para a versão atual"""
+    version, state, _ = get_active_state_tagged(subject_id, build)
+    return version, state
+
+
+def get_active_state_tagged(subject_id, build):
+    """
+    (versão, estado, assinatura): a assinatura (crc32 do estado) é calculada uma vez por cálculo
+    do estado e identifica o conteúdo entre processos (a versão é local), para a ETag do /active.
+    """
+    with _condition:
+        version = _versions.get(subject_id, 0)
+        cached = _states.get(subject_id)
+    if cached and cached[0] == version and time.monotonic() - cached[1] < ACTIVE_STATE_TTL:
+        return version, cached[2], cached[3]
+
+    state = build()
+    tag = zlib.crc32(json.dumps(state, sort_keys=True, default=str).encode())
+    with _condition:
+        # Só guarda se nada mudou durante o cálculo
+        if _versions.get(subject_id, 0) == version:
+            _states[subject_id] = (version, time.monotonic(), state, tag)
+    return version, state, tag
+
+
+def stream_active_state(subject_id, load, render=None, timeout=STREAM_TIMEOUT_SECONDS):
+    """
+    Gerador SSE: envia o estado ao conectar e sempre que o que seria enviado mudar.
+    load() -> (versão, estado) (ex: get_active_state com o cálculo da rota);
+    render(estado) monta a mensagem de cada espectador (ex: resposta por aluno).
+    """
+    deadline = time.monotonic() + timeout
+    last_sent = time.monotonic()
+    last_data = None
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+
+    while time.monotonic() < deadline:
+        version, state = load()
+        data = render(state) if render else state
+        if data != last_data:
+            yield f"id: {version}\nevent: {EVENT_STATE}\ndata: {json.dumps(data)}\n\n"
+            last_data = data
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= STREAM_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+
+        # Acorda na mudança (deste ou de outro processo) ou quando o estado em cache expira
+        wait_for_change(subject_id, version, min(ACTIVE_STATE_TTL, STREAM_HEARTBEAT_SECONDS))
+
+
+# ========== INVALIDAÇÃO AUTOMÁTICA ==========
+# As mudanças são anotadas no flush e publicadas só depois do commit
+# (quem acordar já encontra o estado novo no banco).
+
+def _changed(target, fields):
+    state = inspect(target)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _mark(target, subject_id):
+    session = object_session(target)
+    if session is not None and subject_id is not None:
+        session.info.setdefault('changed_subjects', set()).add(subject_id)
+
+
+@event.listens_for(TranscriptionSession, 'after_insert')
+@event.listens_for(TranscriptionSession, 'after_delete')
+def _session_added(mapper, connection, target):
+    _mark(target, target.subject_id)
+
+
+@event.listens_for(TranscriptionSession, 'after_update')
+def _session_updated(mapper, connection, target):
+    if _changed(target, SESSION_FIELDS):
+        _mark(target, target.subject_id)
+
+
+def _activity_subject(connection, target):
+    return connection.execute(
+        select(TranscriptionSession.subject_id).where(TranscriptionSession.id == target.session_id)
+    ).scalar()
+
+
+@event.listens_for(LiveActivity, 'after_insert')
+@event.listens_for(LiveActivity, 'after_delete')
+def _activity_added(mapper, connection, target):
+    _mark(target, _activity_subject(connection, target))
+
+
+@event.listens_for(LiveActivity, 'after_update')
+def _activity_updated(mapper, connection, target):
+    if _changed(target, ACTIVITY_FIELDS):
+        _mark(target, _activity_subject(connection, target))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_changes(session):
+    subject_ids = session.info.pop('changed_subjects', None)
+    if subject_ids:
+        bump_subjects(subject_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('changed_subjects', None)
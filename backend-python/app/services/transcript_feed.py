@@ -0,0 +1,203 @@
+"""
+Feed da transcrição ao vivo (Server-Sent Events)
+Cada sessão observada tem um feed em memória com os segmentos recentes, compartilhado por
+todos os espectadores do processo. Os espectadores esperam no feed; o banco é consultado
+por feed (no máximo uma vez por intervalo), nunca por espectador.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy.orm import Session
+from app import db
+from app.models.transcription_session import TranscriptionSession, TranscriptSegment
+
+FEED_BUFFER_SIZE = int(os.getenv('TRANSCRIPT_FEED_BUFFER', 1000))  # Segmentos mantidos em memória por sessão
+FEED_REFRESH_SECONDS = float(os.getenv('TRANSCRIPT_FEED_REFRESH', 2))  # Intervalo mínimo entre leituras do banco
+FEED_IDLE_SECONDS = 3600  # Feeds sem espectadores há mais tempo são descartados
+STREAM_TIMEOUT_SECONDS = int(os.getenv('REALTIME_STREAM_TIMEOUT_SECONDS', 600))  # Duração máxima de uma conexão (o cliente reconecta sozinho)
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_RETRY_MS = 3000
+
+EVENT_SEGMENT = 'segment'
+EVENT_RESET = 'reset'  # Transcrição reescrita: o cliente descarta o texto e recomeça deste segmento
+EVENT_END = 'end'
+
+
+class SessionFeed:
+    """Segmentos recentes de uma sessão, indexados pelo seq (usado como id do evento SSE)"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.events = deque(maxlen=FEED_BUFFER_SIZE)  # (seq, event, data)
+        self.last_seq = 0
+        self.covered_from = None  # Seqs > covered_from estão todos no buffer (None = feed vazio)
+        self.ended = False
+        self.refreshed_at = 0
+        self.accessed_at = time.monotonic()
+        self.condition = threading.Condition()
+        self._refresh_lock = threading.Lock()
+
+    def since(self, last_seq):
+        """Eventos depois de last_seq; None se o buffer não cobre esse ponto"""
+        with self.condition:
+            self.accessed_at = time.monotonic()
+            if self.covered_from is None or last_seq < self.covered_from:
+                return None
+            return [event for event in self.events if event[0] > last_seq]
+
+    def wait(self, last_seq, timeout):
+        """Bloqueia até chegar um segmento depois de last_seq, a sessão terminar ou o timeout"""
+        with self.condition:
+            if self.last_seq <= last_seq and not self.ended:
+                self.condition.wait(timeout)
+
+    def refresh(self, force=False):
+        """Lê do banco os segmentos novos (um espectador por vez; os demais aguardam o resultado)"""
+        if not force and time.monotonic() - self.refreshed_at < FEED_REFRESH_SECONDS:
+            return
+        if not self._refresh_lock.acquire(blocking=force):
+            return
+        try:
+            self.refreshed_at = time.monotonic()
+            segments, status = read_segments(self.session_id, self.last_seq)
+
+            with self.condition:
+                if self.covered_from is None:
+                    self.covered_from = 0
+                for segment in segments:
+                    self._push(segment)
+                if status in (None, 'ended'):
+                    self.ended = True
+                self.condition.notify_all()
+        finally:
+            self._refresh_lock.release()
+
+    def _push(self, event):
+        if event[0] <= self.last_seq:
+            return
+        if len(self.events) == self.events.maxlen:
+            self.covered_from = self.events[0][0]
+        self.events.append(event)
+        self.last_seq = event[0]
+
+
+def read_segments(session_id, after_seq):
+    """
+    Lê do banco os eventos dos segmentos com seq > after_seq e o status da sessão.
+    Usa uma sessão própria e curta: streams longos não seguram conexões do pool.
+    """
+    with Session(db.engine) as session:
+        segments = session.query(TranscriptSegment).filter(
+            TranscriptSegment.session_id == session_id,
+            TranscriptSegment.seq > after_seq
+        ).order_by(TranscriptSegment.seq).all()
+        status, segment_count = session.query(
+            TranscriptionSession.status, TranscriptionSession.segment_count
+        ).filter(TranscriptionSession.id == session_id).first() or (None, 0)
+        events = [_segment_event(segment) for segment in segments]
+        
+        # Segmentos compactados no end(): o texto anterior só existe em full_transcript
+        compacted_seq = segments[0].seq - 1 if segments else (segment_count or 0)
+        if after_seq < compacted_seq and not (segments and segments[0].start_offset == 0):
+            events.insert(0, _compacted_event(session, session_id, compacted_seq))
+        return events, status
+
+
+def _compacted_event(session, session_id, seq):
+    """Reset com o texto materializado até o último segmento compactado"""
+    text = session.query(TranscriptionSession).filter(
+        TranscriptionSession.id == session_id
+    ).first()._full_transcript or ''
+    return (seq, EVENT_RESET, {
+        'seq': seq,
+        'start_offset': 0,
+        'end_offset': len(text),
+        'text': text
+    })
+
+
+def _segment_event(segment):
+    # Segmento no offset 0 depois do primeiro = reescrita (inclusive para texto vazio)
+    event = EVENT_RESET if segment.start_offset == 0 and segment.seq > 1 else EVENT_SEGMENT
+    return (segment.seq, event, {
+        'seq': segment.seq,
+        'start_offset': segment.start_offset,
+        'end_offset': segment.end_offset,
+        'text': segment.text
+    })
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_feed(session_id):
+    """Feed da sessão neste processo (criado e carregado do banco no primeiro acesso)"""
+    with _feeds_lock:
+        _purge_idle_feeds()
+        feed = _feeds.get(session_id)
+        created = feed is None
+        if created:
+            feed = _feeds[session_id] = SessionFeed(session_id)
+    if created:
+        feed.refresh(force=True)
+    return feed
+
+
+def notify_transcript_changed(session_id):
+    """Chamado após gravar a transcrição: atualiza o feed se houver espectadores neste processo"""
+    with _feeds_lock:
+        feed = _feeds.get(session_id)
+    if feed:
+        feed.refresh(force=True)
+
+
+def _purge_idle_feeds():
+    now = time.monotonic()
+    idle = [session_id for session_id, feed in _feeds.items() if now - feed.accessed_at > FEED_IDLE_SECONDS]
+    for session_id in idle:
+        del _feeds[session_id]
+
+
+def stream_events(session_id, last_seq=0, timeout=STREAM_TIMEOUT_SECONDS):
+    """
+    Gerador de mensagens SSE com os segmentos depois de last_seq.
+    O id de cada evento é o seq do segmento (reconexão com Last-Event-ID continua do ponto certo).
+    """
+    feed = get_feed(session_id)
+    deadline = time.monotonic() + timeout
+    last_sent = time.monotonic()
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+
+    while time.monotonic() < deadline:
+        events = feed.since(last_seq)
+        if events is None:
+            # Espectador atrás do buffer em memória: lê só o que falta direto do banco
+            events, _ = read_segments(session_id, last_seq)
+
+        for seq, event, data in events:
+            yield f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+            last_seq = seq
+            last_sent = time.monotonic()
+
+        if feed.ended and feed.last_seq <= last_seq:
+            yield f"event: {EVENT_END}\ndata: {json.dumps({'session_id': session_id})}\n\n"
+            return
+
+        if time.monotonic() - last_sent >= STREAM_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+
+        feed.wait(last_seq, FEED_REFRESH_SECONDS)
+        # Atualizações gravadas por outros processos chegam por aqui (limitado por FEED_REFRESH_SECONDS)
+        feed.refresh()
+
+
+def parse_last_event_id(value):
+    """Last-Event-ID do cabeçalho/parâmetro (seq do último segmento recebido)"""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
@@ -1,89 +1,72 @@
 """
-Serviço WebSocket para atualizações em tempo real de quiz
+Eventos em tempo real de quiz, atividade e apresentação
+Mantém a API emit_* usada pelas rotas; a entrega é feita pelo app.services.realtime
+(Server-Sent Events). Os clientes entram na sala abrindo o stream de eventos:
+- Quiz: GET /api/quiz/<quiz_id>/events
+- Atividade: GET /api/transcription/activities/<activity_id>/events
+- Apresentação: GET /api/presentation/<code>/events
 """
-from flask_socketio import emit, join_room, leave_room
-from app import socketio
+from app.services.realtime import emit, quiz_room, activity_room, presentation_room
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-@socketio.on('connect')
-def handle_connect():
-    """Cliente conectou ao WebSocket"""
-    logger.info(f"Cliente conectado")
-    emit('connected', {'message': 'Conectado ao servidor WebSocket'})
-
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    """Cliente desconectou do WebSocket"""
-    logger.info(f"Cliente desconectado")
-
-
-@socketio.on('join_quiz')
-def handle_join_quiz(data):
-    """
-    Professor/Aluno entra na room do quiz para receber atualizações
-    data: {'quiz_id': int}
-    """
-    quiz_id = data.get('quiz_id')
-    if quiz_id:
-        room = f"quiz_{quiz_id}"
-        join_room(room)
-        logger.info(f"Cliente entrou na room: {room}")
-        emit('joined_quiz', {'quiz_id': quiz_id, 'room': room})
-
-
-@socketio.on('leave_quiz')
-def handle_leave_quiz(data):
-    """
-    Cliente sai da room do quiz
-    data: {'quiz_id': int}
-    """
-    quiz_id = data.get('quiz_id')
-    if quiz_id:
-        room = f"quiz_{quiz_id}"
-        leave_room(room)
-        logger.info(f"Cliente saiu da room: {room}")
-
+# ========== QUIZ EVENTS ==========
 
 def emit_ranking_update(quiz_id, ranking_data):
     """
     Emite atualização de ranking para todos na room do quiz
-    
+
     Args:
         quiz_id: ID do quiz
         ranking_data: Dados do ranking (dict com ranking, enrolled_count, etc)
     """
-    room = f"quiz_{quiz_id}"
+    room = quiz_room(quiz_id)
     logger.info(f"Emitindo atualização de ranking para room: {room}")
-    socketio.emit('ranking_update', ranking_data, room=room)
+    emit(room, 'ranking_update', ranking_data)
 
 
 def emit_quiz_ended(quiz_id):
     """
     Emite evento de quiz encerrado para todos na room
-    
+
     Args:
         quiz_id: ID do quiz
     """
-    room = f"quiz_{quiz_id}"
+    room = quiz_room(quiz_id)
     logger.info(f"Emitindo quiz encerrado para room: {room}")
-    socketio.emit('quiz_ended', {'quiz_id': quiz_id}, room=room)
+    emit(room, 'quiz_ended', {'quiz_id': quiz_id})
 
 
 def emit_new_response(quiz_id, student_data):
     """
     Emite evento quando um aluno submete resposta
-    
+
     Args:
         quiz_id: ID do quiz
         student_data: Dados do aluno que respondeu
     """
-    room = f"quiz_{quiz_id}"
+    room = quiz_room(quiz_id)
     logger.info(f"Emitindo nova resposta para room: {room}")
-    socketio.emit('new_response', student_data, room=room)
+    emit(room, 'new_response', student_data)
+
+
+# ========== ACTIVITY EVENTS ==========
+
+def emit_activity_started(activity_id, activity_data):
+    """Atividade enviada para os alunos"""
+    emit(activity_room(activity_id), 'activity_started', activity_data)
+
+
+def emit_activity_response(activity_id, student_data):
+    """Aluno enviou a resposta final da atividade"""
+    emit(activity_room(activity_id), 'new_response', student_data)
+
+
+def emit_activity_ended(activity_id):
+    """Atividade encerrada pelo professor"""
+    emit(activity_room(activity_id), 'activity_ended', {'activity_id': activity_id})
 
 
 # ========== PRESENTATION EVENTS ==========
@@ -93,8 +76,8 @@ def emit_presentation_content(code, content):
     Emite novo conteúdo para todas as telas conectadas à apresentação
     Similar a: emit_ranking_update
     """
-    room = f'presentation_{code}'
-    socketio.emit('presentation_content', content, room=room)
+    room = presentation_room(code)
+    emit(room, 'presentation_content', content)
     logger.info(f'Conteúdo emitido para sala {room}')
 
 
@@ -102,8 +85,8 @@ def emit_presentation_clear(code):
     """
     Emite evento para limpar tela de apresentação
     """
-    room = f'presentation_{code}'
-    socketio.emit('presentation_clear', {}, room=room)
+    room = presentation_room(code)
+    emit(room, 'presentation_clear', {})
     logger.info(f'Tela limpa na sala {room}')
 
 
@@ -111,33 +94,6 @@ def emit_presentation_ended(code):
     """
     Emite evento indicando que apresentação foi encerrada
     """
-    room = f'presentation_{code}'
-    socketio.emit('presentation_ended', {}, room=room)
+    room = presentation_room(code)
+    emit(room, 'presentation_ended', {})
     logger.info(f'Apresentação encerrada na sala {room}')
-
-
-@socketio.on('join_presentation')
-def handle_join_presentation(data):
-    """
-    Cliente entra em sala de apresentação
-    Similar a eventos de quiz
-    """
-    code = data.get('code')
-    if code:
-        room = f'presentation_{code}'
-        join_room(room)
-        emit('joined_presentation', {'code': code})
-        logger.info(f'Cliente entrou na sala {room}')
-
-
-@socketio.on('leave_presentation')
-def handle_leave_presentation(data):
-    """
-    Cliente sai da sala de apresentação
-    """
-    code = data.get('code')
-    if code:
-        room = f'presentation_{code}'
-        leave_room(room)
-        logger.info(f'Cliente saiu da sala {room}')
-
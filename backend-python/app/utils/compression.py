@@ -0,0 +1,72 @@
+"""
+Compressão de textos grandes armazenados no banco (transcrições encerradas e snapshots)
+O valor comprimido continua em uma coluna Text: prefixo do algoritmo + base64.
+Valores sem prefixo (linhas antigas) são lidos normalmente.
+"""
+import base64
+import os
+import zlib
+from sqlalchemy.types import TypeDecorator, Text
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional
+    zstandard = None
+
+# zlib (padrão), zstd (se instalado) ou none
+TEXT_COMPRESSION = os.getenv('TEXT_COMPRESSION', 'zlib').lower()
+COMPRESSION_MIN_CHARS = int(os.getenv('TEXT_COMPRESSION_MIN_CHARS', 512))  # Textos menores ficam em texto puro
+
+ZLIB_PREFIX = '\x01zlib:'
+ZSTD_PREFIX = '\x01zstd:'
+
+
+def is_compressed(value):
+    return isinstance(value, str) and value.startswith((ZLIB_PREFIX, ZSTD_PREFIX))
+
+
+def compress_text(value, method=None):
+    """Comprime o texto; retorna o original se for curto ou se não houver ganho"""
+    method = (method or TEXT_COMPRESSION).lower()
+    if not value or method == 'none' or is_compressed(value) or len(value) < COMPRESSION_MIN_CHARS:
+        return value
+
+    raw = value.encode('utf-8')
+    if method == 'zstd' and zstandard is not None:
+        prefix, data = ZSTD_PREFIX, zstandard.ZstdCompressor(level=10).compress(raw)
+    else:
+        prefix, data = ZLIB_PREFIX, zlib.compress(raw, 9)
+
+    packed = prefix + base64.b64encode(data).decode('ascii')
+    return packed if len(packed) < len(raw) else value
+
+
+def decompress_text(value):
+    """Devolve o texto original (valores não comprimidos passam direto)"""
+    if not is_compressed(value):
+        return value
+
+    if value.startswith(ZSTD_PREFIX):
+        if zstandard is None:
+            raise RuntimeError('Texto comprimido com zstd, mas o pacote zstandard não está instalado')
+        data = base64.b64decode(value[len(ZSTD_PREFIX):])
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+
+    data = base64.b64decode(value[len(ZLIB_PREFIX):])
+    return zlib.decompress(data).decode('utf-8')
+
+
+class CompressedText(TypeDecorator):
+    """
+    Coluna Text comprimida ao gravar e descomprimida ao ler (transparente para o modelo).
+    Toda gravação comprime, inclusive as de sessões em andamento: nelas a coluna só é escrita
+    numa reescrita manual da transcrição (o auto-save vai para os segmentos, em texto puro).
+    """
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
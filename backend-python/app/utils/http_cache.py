@@ -0,0 +1,33 @@
+"""
+Requisições condicionais (ETag / 304) para os endpoints consultados por polling
+A ETag é montada pela rota a partir de contadores baratos (versões gravadas no banco, versão do
+ranking em memória...), não do corpo serializado: o If-None-Match é comparado antes das
+consultas pesadas e, se bater, a resposta é 304 sem corpo.
+
+As ETags são fracas (W/): campos derivados do relógio (ex: time_remaining, calculado a partir
+de ends_at) não entram na versão; o cliente faz a contagem regressiva localmente.
+"""
+from flask import request, Response
+
+# O cliente pode guardar a resposta, mas deve revalidar a cada uso
+CACHE_CONTROL = 'no-cache'
+
+
+def make_etag(*parts):
+    """ETag a partir das partes que identificam a versão da resposta"""
+    return '-'.join('' if part is None else str(part) for part in parts).replace('"', '').replace(' ', '_')
+
+
+def not_modified(etag):
+    """Resposta 304 se o cliente já tem essa versão (If-None-Match); senão None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag):
+    """Anexa a ETag à resposta (ex: with_etag(jsonify(...), etag))"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
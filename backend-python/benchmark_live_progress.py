@@ -0,0 +1,97 @@
+"""
+Simulação: quiz ao vivo com 200 alunos
+Compara a quantidade de commits no banco entre o fluxo antigo de /progress
+(SELECT + merge + calculate_quiz_score com commit + commit) e o estado ao vivo com write-behind.
+
+Uso: python benchmark_live_progress.py
+(usa o banco da configuração 'test' e apaga as tabelas ao final)
+"""
+from app import create_app, db
+from app.models.transcription_session import LiveActivity, LiveActivityResponse
+from app.services import live_state
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import flag_modified
+from datetime import datetime, timedelta
+
+STUDENTS = 200
+QUESTIONS = 10
+
+app = create_app('test')
+
+# As rodadas da simulação fazem o papel do intervalo de flush
+live_state.LIVE_FLUSH_SECONDS = 3600
+
+
+def create_quiz():
+    activity = LiveActivity(
+        session_id=1,
+        activity_type='quiz',
+        title='Quiz simulado',
+        content={'questions': [
+            {'question': f'Pergunta {i + 1}', 'options': ['A', 'B', 'C', 'D'], 'correct': i % 4}
+            for i in range(QUESTIONS)
+        ]},
+        status='active',
+        starts_at=datetime.utcnow(),
+        ends_at=datetime.utcnow() + timedelta(minutes=30)
+    )
+    db.session.add(activity)
+    db.session.commit()
+    return activity.id
+
+
+def legacy_progress(activity_id, student_id, answers):
+    """Fluxo anterior de update_activity_progress"""
+    response = LiveActivityResponse.query.filter_by(activity_id=activity_id, student_id=student_id).first()
+    if not response:
+        response = LiveActivityResponse(activity_id=activity_id, student_id=student_id,
+                                        response_data={'answers': answers}, score=0, submitted_at=None)
+        db.session.add(response)
+    else:
+        current_data = response.response_data or {}
+        current_answers = current_data.get('answers', {})
+        current_answers.update(answers)
+        current_data['answers'] = current_answers
+        response.response_data = current_data
+        flag_modified(response, 'response_data')
+    response.calculate_quiz_score()
+    db.session.commit()  # calculate_quiz_score fazia este commit
+    db.session.commit()
+
+
+def run(label, activity_id, click, after_round=None):
+    commits = {'count': 0}
+
+    def on_commit(conn):
+        commits['count'] += 1
+
+    event.listen(db.engine, 'commit', on_commit)
+    try:
+        # Cada rodada: todos os alunos respondem a próxima questão (~ um intervalo de flush)
+        for question in range(QUESTIONS):
+            for student_id in range(1, STUDENTS + 1):
+                click(activity_id, student_id, {str(question): student_id % 4})
+            if after_round:
+                after_round()
+    finally:
+        event.remove(db.engine, 'commit', on_commit)
+
+    saved = LiveActivityResponse.query.filter_by(activity_id=activity_id).count()
+    print(f"{label}: {STUDENTS * QUESTIONS} cliques, {commits['count']} commits, {saved} respostas gravadas")
+    return commits['count']
+
+
+def live_progress(activity_id, student_id, answers):
+    state = live_state.get_activity_state(activity_id)
+    live_state.record_progress(state, student_id, answers)
+
+
+with app.app_context():
+    db.create_all()
+    try:
+        legacy = run('Fluxo antigo', create_quiz(), legacy_progress)
+        live = run('Write-behind', create_quiz(), live_progress, after_round=live_state.flush_all)
+        print(f"Redução de commits: {legacy} -> {live} ({legacy / max(live, 1):.0f}x menos)")
+    finally:
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,68 @@
+"""
+Benchmark: fan-out do push em tempo real (1 emit -> 500 membros da sala)
+Cada membro é uma thread consumindo o stream SSE da sala (como uma conexão /events).
+Mede o custo do emit e o tempo até cada membro receber o evento.
+
+Uso: python benchmark_realtime_fanout.py
+(usa o backend de REALTIME_BACKEND; padrão: memory)
+"""
+import threading
+import time
+from app.services import realtime
+
+MEMBERS = 500
+EMITS = 20
+ROOM = realtime.quiz_room('benchmark')
+
+received = [[] for _ in range(EMITS)]
+received_lock = threading.Lock()
+sent_at = [0.0] * EMITS
+done = threading.Barrier(MEMBERS + 1)
+
+
+def member():
+    stream = realtime.stream_room(ROOM, timeout=60)
+    next(stream)  # retry: (já entrou na sala)
+    count = 0
+    for message in stream:
+        if not message.startswith('id:'):
+            continue  # keep-alive
+        index = int(message.split('data: ')[1].strip())
+        with received_lock:
+            received[index].append(time.perf_counter())
+        count += 1
+        if count == EMITS:
+            break
+    stream.close()
+    done.wait()
+
+
+threads = [threading.Thread(target=member, daemon=True) for _ in range(MEMBERS)]
+for thread in threads:
+    thread.start()
+while realtime.get_hub().members(ROOM) < MEMBERS:
+    time.sleep(0.01)
+
+emit_times = []
+for i in range(EMITS):
+    start = time.perf_counter()
+    sent_at[i] = start
+    realtime.emit(ROOM, 'benchmark', i)
+    emit_times.append(time.perf_counter() - start)
+    # Espera todos receberem antes do próximo emit (mede cada fan-out isoladamente)
+    while True:
+        with received_lock:
+            if len(received[i]) == MEMBERS:
+                break
+        time.sleep(0.0005)
+
+done.wait()
+
+latencies = sorted((t - sent_at[i]) * 1000 for i in range(EMITS) for t in received[i])
+fanout = sorted((max(received[i]) - sent_at[i]) * 1000 for i in range(EMITS))
+print(f"Backend: {type(realtime.get_backend()).__name__}")
+print(f"{EMITS} emits x {MEMBERS} membros = {len(latencies)} entregas")
+print(f"Custo do emit: {sum(emit_times) / EMITS * 1000:.3f} ms (médio)")
+print(f"Latência por membro: p50 {latencies[len(latencies) // 2]:.2f} ms, "
+      f"p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms")
+print(f"Último membro a receber: {fanout[len(fanout) // 2]:.2f} ms (mediana por emit)")
@@ -0,0 +1,178 @@
+"""
+Benchmark: estatísticas do relatório de atividade (1000 alunos x 50 questões)
+Compara os laços do relatório antigo (uma passada por questão sobre todas as respostas)
+com a matriz alunos x questões do analytics_service, e confere se os resultados são iguais.
+
+Uso: python benchmark_report_analytics.py
+(não usa banco: as respostas são geradas em memória)
+"""
+import math
+import random
+import time
+from collections import Counter
+from types import SimpleNamespace
+from app.services.analytics_service import ReportAnalytics
+from app.services.answer_keys import compile_activity_key
+
+STUDENTS = 1000
+QUESTIONS = 50
+OPTIONS = 4
+ROUNDS = 5
+
+random.seed(42)
+
+
+def build_data():
+    questions = [
+        {'question': f'Pergunta {i + 1}', 'options': ['A', 'B', 'C', 'D'], 'correct': random.randrange(OPTIONS)}
+        for i in range(QUESTIONS)
+    ]
+    responses = []
+    for student_id in range(1, STUDENTS + 1):
+        skill = random.random()
+        answers = {}
+        correct_count = 0
+        for i, question in enumerate(questions):
+            if random.random() < 0.05:
+                continue  # Questão em branco
+            answer = question['correct'] if random.random() < skill else random.randrange(OPTIONS)
+            answers[str(i)] = answer
+            correct_count += answer == question['correct']
+        responses.append(SimpleNamespace(
+            student_id=student_id,
+            response_data={'answers': answers},
+            percentage=correct_count / QUESTIONS * 100
+        ))
+    return questions, responses
+
+
+def legacy_report(questions, responses, enrolled_count):
+    """Cálculos do get_activity_report antes do analytics_service"""
+    total_responses = len(responses)
+    performance_distribution = {'excellent': 0, 'good': 0, 'average': 0, 'below_average': 0}
+    for response in responses:
+        if response.percentage >= 90:
+            performance_distribution['excellent'] += 1
+        elif response.percentage >= 70:
+            performance_distribution['good'] += 1
+        elif response.percentage >= 50:
+            performance_distribution['average'] += 1
+        else:
+            performance_distribution['below_average'] += 1
+
+    question_analytics = []
+    for i, question in enumerate(questions):
+        correct_count = 0
+        incorrect_count = 0
+        wrong_answers = {}
+        for response in responses:
+            answers = response.response_data.get('answers', {})
+            q_id = str(question.get('id', i))
+            student_answer = answers.get(q_id)
+            if student_answer is None and q_id != str(i):
+                student_answer = answers.get(str(i))
+            if student_answer is not None:
+                try:
+                    ans_int = int(student_answer)
+                    correct_int = int(question.get('correct'))
+                    if ans_int == correct_int:
+                        correct_count += 1
+                    else:
+                        incorrect_count += 1
+                        wrong_answers[ans_int] = wrong_answers.get(ans_int, 0) + 1
+                except (ValueError, TypeError):
+                    pass
+        total_answers = correct_count + incorrect_count
+        correct_rate = (correct_count / total_answers * 100) if total_answers > 0 else 0
+        question_analytics.append({
+            'correct_count': correct_count,
+            'incorrect_count': incorrect_count,
+            'correct_rate': round(correct_rate, 1),
+            'difficulty_level': 'easy' if correct_rate >= 70 else ('medium' if correct_rate >= 40 else 'hard'),
+            # Empates: o relatório antigo dependia da ordem de inserção; o novo usa a menor opção
+            'wrong_answers': wrong_answers
+        })
+
+    score_ranges = [{'min': m, 'max': m + 20, 'count': 0} for m in range(0, 100, 20)]
+    for response in responses:
+        for range_item in score_ranges:
+            if range_item['min'] <= response.percentage < range_item['max'] or \
+               (range_item['max'] == 100 and response.percentage == 100):
+                range_item['count'] += 1
+                break
+    for range_item in score_ranges:
+        range_item['percentage'] = round((range_item['count'] / total_responses * 100), 1) if total_responses > 0 else 0
+
+    percentages = [r.percentage for r in responses]
+    sorted_percentages = sorted(percentages)
+    mid = len(sorted_percentages) // 2
+    if len(sorted_percentages) % 2 == 0:
+        class_median = (sorted_percentages[mid - 1] + sorted_percentages[mid]) / 2
+    else:
+        class_median = sorted_percentages[mid]
+    class_mode = Counter(round(p) for p in percentages).most_common(1)[0][0]
+    mean = sum(percentages) / len(percentages)
+    standard_deviation = math.sqrt(sum((x - mean) ** 2 for x in percentages) / len(percentages))
+
+    return {
+        'performance_distribution': performance_distribution,
+        'question_analytics': question_analytics,
+        'score_ranges': score_ranges,
+        'comparative_stats': {
+            'class_median': round(class_median, 1),
+            'class_mode': class_mode,
+            'standard_deviation': round(standard_deviation, 1),
+            'participation_rate': round((total_responses / enrolled_count * 100), 1) if enrolled_count > 0 else 0
+        }
+    }
+
+
+def matrix_report(questions, responses, enrolled_count):
+    analytics = ReportAnalytics(
+        [r.percentage for r in responses],
+        None,
+        compile_activity_key({'questions': questions}),
+        [r.response_data.get('answers', {}) for r in responses]
+    )
+    return {
+        'performance_distribution': analytics.performance_distribution(),
+        'question_analytics': analytics.question_stats(),
+        'score_ranges': analytics.score_ranges(),
+        'comparative_stats': analytics.comparative_stats(enrolled_count)
+    }
+
+
+def check(legacy, new):
+    for key in ('performance_distribution', 'score_ranges', 'comparative_stats'):
+        assert legacy[key] == new[key], f'{key}: {legacy[key]} != {new[key]}'
+    for old_q, new_q in zip(legacy['question_analytics'], new['question_analytics']):
+        wrong_answers = old_q.pop('wrong_answers')
+        most_common = new_q.pop('most_common_wrong_answer')
+        assert old_q == new_q, f'{old_q} != {new_q}'
+        if wrong_answers:
+            assert wrong_answers[most_common] == max(wrong_answers.values())
+        else:
+            assert most_common is None
+
+
+def best_time(fn, *args):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+questions, responses = build_data()
+enrolled_count = STUDENTS + 50
+
+check(legacy_report(questions, responses, enrolled_count), matrix_report(questions, responses, enrolled_count))
+
+legacy = best_time(legacy_report, questions, responses, enrolled_count)
+matrix = best_time(matrix_report, questions, responses, enrolled_count)
+print(f"{STUDENTS} alunos x {QUESTIONS} questões (melhor de {ROUNDS})")
+print(f"Laços antigos: {legacy * 1000:.1f} ms")
+print(f"Matriz (numpy): {matrix * 1000:.1f} ms")
+print(f"Ganho: {legacy / matrix:.1f}x (resultados conferidos)")
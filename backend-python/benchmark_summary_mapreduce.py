@@ -0,0 +1,136 @@
+"""
+Simulação: resumo de aulas longas (map-reduce) contra um servidor OpenAI falso local
+Compara o tempo total de generate_summary com os blocos resumidos em sequência
+(AI_MAX_WORKERS=1) e em paralelo (AI_MAX_WORKERS padrão), para várias quantidades de blocos.
+Cada chamada ao servidor falso leva LATENCY_SECONDS, como uma chamada real à OpenAI.
+
+No fim, confere a camada persistente do cache: os resumos parciais (gerados nas threads do
+pool) precisam ser gravados e lidos na tabela ai_response_cache, com o LRU em memória vazio.
+
+Uso: python benchmark_summary_mapreduce.py
+(não usa chave da OpenAI; a comparação roda sem cache e a verificação usa um SQLite temporário,
+nunca o DATABASE_URL configurado)
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Antes de importar o app (a configuração lê o DATABASE_URL no import)
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark_summary.sqlite')
+
+import openai
+from app import create_app, db
+from app.models.ai_response_cache import AIResponseCache
+from app.services import ai_service
+from app.services.ai_cache import AICache, DatabaseAICacheStore, get_ai_cache, set_ai_cache
+
+LATENCY_SECONDS = 0.3
+CHUNK_COUNTS = [1, 2, 4, 8, 16]
+MODEL = 'gpt-4o-mini'
+
+requests_served = {'count': 0}
+counter_lock = threading.Lock()
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    """POST /v1/chat/completions: responde depois de LATENCY_SECONDS"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with counter_lock:
+            requests_served['count'] += 1
+        time.sleep(LATENCY_SECONDS)
+
+        body = json.dumps({
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': MODEL,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': 'Pontos principais do trecho.'},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def lecture(chunks):
+    """Transcrição com exatamente `chunks` blocos de SUMMARY_CHUNK_WORDS palavras"""
+    sentence = 'O professor explica mais um conceito importante da aula de hoje.'
+    words_per_sentence = len(sentence.split())
+    sentences_per_chunk = ai_service.SUMMARY_CHUNK_WORDS // words_per_sentence
+    return ' '.join([sentence] * (chunks * sentences_per_chunk))
+
+
+def run(workers, text):
+    ai_service.AI_MAX_WORKERS = workers
+    requests_served['count'] = 0
+    start = time.perf_counter()
+    summary = ai_service.generate_summary(text, 'Cálculo', use_cache=False)
+    elapsed = time.perf_counter() - start
+    assert not summary.startswith('Erro'), summary
+    return elapsed, requests_served['count']
+
+
+def check_database_tier(workers, chunks=4):
+    """Gera o resumo com o cache no banco, depois de novo com o LRU vazio: tudo deve vir da tabela"""
+    app = create_app()
+    with app.app_context():
+        AIResponseCache.__table__.create(db.engine, checkfirst=True)
+        store = DatabaseAICacheStore()
+        ai_service.AI_MAX_WORKERS = workers
+        text = lecture(chunks)
+
+        set_ai_cache(AICache(store))
+        requests_served['count'] = 0
+        first = ai_service.generate_summary(text, 'Cálculo')
+        first_calls = requests_served['count']
+        stored = db.session.query(AIResponseCache.function).filter_by(function='summarize_chunk').count()
+
+        set_ai_cache(AICache(store))  # Outro processo: só a camada persistente
+        requests_served['count'] = 0
+        second = ai_service.generate_summary(text, 'Cálculo')
+        stats = get_ai_cache().stats()
+
+    print(f"Cache no banco: {first_calls} chamadas na 1ª geração, {stored} resumos parciais gravados, "
+          f"{requests_served['count']} chamadas e {stats['store_hits']} acertos no banco na 2ª")
+    assert stored == chunks, f'resumos parciais gravados: {stored} de {chunks}'
+    assert second == first and requests_served['count'] == 0, 'a 2ª geração deveria vir toda do banco'
+    assert stats['store_hits'] == chunks + 1 and stats['errors'] == 0, stats
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAI)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# Configuração e client apontando para o servidor falso (sem banco)
+api_key = 'sk-fake'
+ai_service._config_cache = (float('inf'), (api_key, MODEL))
+ai_service._clients[(api_key, MODEL)] = openai.OpenAI(
+    api_key=api_key, base_url=f'http://127.0.0.1:{server.server_port}/v1', max_retries=0
+)
+set_ai_cache(AICache(None))
+parallel_workers = ai_service.AI_MAX_WORKERS
+
+try:
+    print(f"Latência por chamada: {LATENCY_SECONDS:.2f}s | workers em paralelo: {parallel_workers}")
+    print(f"{'blocos':>6} {'chamadas':>8} {'sequencial':>11} {'paralelo':>9} {'ganho':>6}")
+    for chunks in CHUNK_COUNTS:
+        text = lecture(chunks)
+        sequential, calls = run(1, text)
+        parallel, _ = run(parallel_workers, text)
+        print(f"{chunks:>6} {calls:>8} {sequential:>10.2f}s {parallel:>8.2f}s {sequential / parallel:>5.1f}x")
+    check_database_tier(parallel_workers)
+finally:
+    server.shutdown()
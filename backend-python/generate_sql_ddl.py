@@ -45,6 +45,7 @@ def generate_ddl():
             'teachings',
             'enrollments',
             'transcription_sessions',
+            'transcript_segments',
             'transcription_checkpoints',
             'live_activities',
             'live_activity_responses',
@@ -0,0 +1,13 @@
+"""
+Migração: cache persistente de respostas da IA
+
+- Cria a tabela ai_response_cache
+"""
+from app import create_app, db
+from app.models.ai_response_cache import AIResponseCache
+
+app = create_app()
+
+with app.app_context():
+    AIResponseCache.__table__.create(db.engine, checkfirst=True)
+    print("Tabela 'ai_response_cache' verificada/criada.")
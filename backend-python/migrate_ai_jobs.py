@@ -0,0 +1,13 @@
+"""
+Migração: jobs assíncronos de IA compartilhados entre processos
+
+- Cria a tabela ai_jobs (AI_JOB_STORE=database, padrão)
+"""
+from app import create_app, db
+from app.models.ai_job import AIJob
+
+app = create_app()
+
+with app.app_context():
+    AIJob.__table__.create(db.engine, checkfirst=True)
+    print("Tabela 'ai_jobs' verificada/criada.")
@@ -0,0 +1,18 @@
+"""
+Migração: digest cacheado nos checkpoints (quiz incremental)
+
+- Adiciona context_digest em transcription_checkpoints
+"""
+from app import create_app, db
+from sqlalchemy import text
+
+app = create_app()
+
+with app.app_context():
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE transcription_checkpoints ADD COLUMN context_digest TEXT"))
+            conn.commit()
+            print("Coluna 'context_digest' adicionada com sucesso!")
+    except Exception as e:
+        print(f"Erro (pode já existir): {e}")
@@ -0,0 +1,70 @@
+"""
+Migração: checkpoints por offset
+
+- Adiciona transcript_offset e segment_seq em transcription_checkpoints
+- Converte snapshots antigos em offsets quando o snapshot é prefixo da transcrição da sessão
+  (liberando o texto duplicado)
+Rodar depois de migrate_transcript_segments.py. Usa SQL direto: não depende das colunas
+adicionadas por migrações posteriores.
+"""
+from app import create_app, db
+from app.utils.compression import decompress_text
+from sqlalchemy import text
+
+BATCH_SIZE = 200
+
+app = create_app()
+
+
+def session_transcript(session_id):
+    """Texto da sessão: coluna materializada + segmentos posteriores (como TranscriptionSession.full_transcript)"""
+    materialized = decompress_text(db.session.execute(
+        text("SELECT full_transcript FROM transcription_sessions WHERE id = :id"), {'id': session_id}
+    ).scalar()) or ''
+    tail = db.session.execute(text(
+        "SELECT text FROM transcript_segments WHERE session_id = :id AND start_offset >= :start ORDER BY seq"
+    ), {'id': session_id, 'start': len(materialized)}).scalars()
+    return materialized + ''.join(tail)
+
+
+with app.app_context():
+    for column in ('transcript_offset', 'segment_seq'):
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE transcription_checkpoints ADD COLUMN {column} INTEGER"))
+                conn.commit()
+                print(f"Coluna '{column}' adicionada com sucesso!")
+        except Exception as e:
+            print(f"Erro (pode já existir): {e}")
+
+    converted = 0
+    freed_chars = 0
+    last_id = 0
+    transcripts = {}  # session_id -> texto (checkpoints da mesma sessão vêm em sequência)
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, session_id, transcript_at_checkpoint FROM transcription_checkpoints "
+            "WHERE transcript_offset IS NULL AND id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+
+        if not rows:
+            break
+
+        for checkpoint_id, session_id, value in rows:
+            last_id = checkpoint_id
+            snapshot = decompress_text(value) or ''
+            if session_id not in transcripts:
+                transcripts = {session_id: session_transcript(session_id)}
+            if not transcripts[session_id].startswith(snapshot):
+                continue
+
+            db.session.execute(text(
+                "UPDATE transcription_checkpoints SET transcript_offset = :offset, transcript_at_checkpoint = '' "
+                "WHERE id = :id"
+            ), {'offset': len(snapshot), 'id': checkpoint_id})
+            converted += 1
+            freed_chars += len(snapshot)
+
+        db.session.commit()
+
+    print(f"{converted} checkpoints convertidos para offset ({freed_chars} caracteres liberados).")
@@ -0,0 +1,113 @@
+"""
+Migração: compressão das transcrições encerradas
+
+- Materializa e comprime full_transcript das sessões encerradas (status 'ended') e apaga os
+  segmentos (transcript_segments) dessas sessões, como TranscriptionSession.end() faz hoje
+- Comprime os snapshots (transcript_at_checkpoint) dos checkpoints dessas sessões
+- Processa em lotes e informa quantos bytes foram economizados (coluna + segmentos)
+Linhas já comprimidas ou curtas demais são mantidas como estão.
+Rodar depois de migrate_transcript_segments.py. Usa SQL direto.
+"""
+from app import create_app, db
+from app.utils.compression import compress_text, decompress_text, is_compressed
+from sqlalchemy import text
+
+BATCH_SIZE = 200
+
+app = create_app()
+
+
+def compact_sessions():
+    """Sessões encerradas: texto completo comprimido na coluna, segmentos apagados"""
+    compressed = 0
+    compacted = 0
+    before = 0
+    after = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, full_transcript FROM transcription_sessions "
+            "WHERE status = 'ended' AND id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+
+        for session_id, value in rows:
+            last_id = session_id
+            materialized = decompress_text(value) or ''
+            segments = db.session.execute(text(
+                "SELECT start_offset, text FROM transcript_segments WHERE session_id = :id ORDER BY seq"
+            ), {'id': session_id}).fetchall()
+            tail = ''.join(segment_text for start_offset, segment_text in segments if start_offset >= len(materialized))
+            full_text = materialized + tail
+
+            packed = compress_text(full_text)
+            if not segments and (not value or is_compressed(value) or packed == value):
+                continue
+
+            row_before = len((value or '').encode('utf-8')) + sum(len(t.encode('utf-8')) for _, t in segments)
+            db.session.execute(
+                text("UPDATE transcription_sessions SET full_transcript = :value WHERE id = :id"),
+                {'value': packed, 'id': session_id}
+            )
+            if segments:
+                db.session.execute(text("DELETE FROM transcript_segments WHERE session_id = :id"), {'id': session_id})
+                compacted += 1
+            if is_compressed(packed):
+                compressed += 1
+            before += row_before
+            after += len((packed or '').encode('utf-8'))
+
+        db.session.commit()
+
+    print(f"transcription_sessions.full_transcript + transcript_segments: {compressed} linhas comprimidas, "
+          f"{compacted} sessões sem segmentos, {before} -> {after} bytes ({before - after} economizados)")
+    return before, after
+
+
+def compress_snapshots():
+    compressed = 0
+    before = 0
+    after = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT c.id, c.transcript_at_checkpoint FROM transcription_checkpoints c "
+            "JOIN transcription_sessions s ON s.id = c.session_id "
+            "WHERE s.status = 'ended' AND c.id > :last_id ORDER BY c.id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+
+        for row_id, value in rows:
+            last_id = row_id
+            if not value or is_compressed(value):
+                continue
+            packed = compress_text(value)
+            if packed == value:
+                continue
+
+            db.session.execute(
+                text("UPDATE transcription_checkpoints SET transcript_at_checkpoint = :value WHERE id = :id"),
+                {'value': packed, 'id': row_id}
+            )
+            compressed += 1
+            before += len(value.encode('utf-8'))
+            after += len(packed.encode('utf-8'))
+
+        db.session.commit()
+
+    print(f"transcription_checkpoints.transcript_at_checkpoint: {compressed} linhas comprimidas, "
+          f"{before} -> {after} bytes ({before - after} economizados)")
+    return before, after
+
+
+with app.app_context():
+    total_before = 0
+    total_after = 0
+    for step in (compact_sessions, compress_snapshots):
+        before, after = step()
+        total_before += before
+        total_after += after
+
+    print(f"Total economizado: {total_before - total_after} bytes")
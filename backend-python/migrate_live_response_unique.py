@@ -0,0 +1,43 @@
+"""
+Migração: uma resposta por aluno e atividade
+
+- Remove linhas duplicadas de live_activity_responses (mantém a resposta final; sem ela, a mais recente)
+- Cria o índice único (activity_id, student_id) usado pelo upsert do progresso ao vivo
+Usa SQL direto.
+"""
+from app import create_app, db
+from sqlalchemy import text
+
+app = create_app()
+
+with app.app_context():
+    duplicates = db.session.execute(text(
+        "SELECT activity_id, student_id FROM live_activity_responses "
+        "GROUP BY activity_id, student_id HAVING COUNT(*) > 1"
+    )).fetchall()
+
+    removed = 0
+    for activity_id, student_id in duplicates:
+        rows = db.session.execute(text(
+            "SELECT id, submitted_at FROM live_activity_responses "
+            "WHERE activity_id = :activity_id AND student_id = :student_id ORDER BY id"
+        ), {'activity_id': activity_id, 'student_id': student_id}).fetchall()
+        submitted = [row_id for row_id, submitted_at in rows if submitted_at is not None]
+        keep = submitted[0] if submitted else rows[-1][0]
+        for row_id, _ in rows:
+            if row_id != keep:
+                db.session.execute(text("DELETE FROM live_activity_responses WHERE id = :id"), {'id': row_id})
+                removed += 1
+    db.session.commit()
+    print(f"{removed} respostas duplicadas removidas.")
+
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_live_activity_responses_activity_student "
+                "ON live_activity_responses (activity_id, student_id)"
+            ))
+            conn.commit()
+            print("Índice único (activity_id, student_id) criado com sucesso!")
+    except Exception as e:
+        print(f"Erro (pode já existir): {e}")
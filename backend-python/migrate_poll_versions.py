@@ -0,0 +1,25 @@
+"""
+Migração: contadores de versão usados nas ETags do polling
+
+- Adiciona version em presentation_sessions
+- Adiciona response_version em quizzes
+"""
+from app import create_app, db
+from sqlalchemy import text
+
+COLUMNS = [
+    ('presentation_sessions', 'version'),
+    ('quizzes', 'response_version'),
+]
+
+app = create_app()
+
+with app.app_context():
+    for table, column in COLUMNS:
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER DEFAULT 0"))
+                conn.commit()
+                print(f"Coluna '{column}' adicionada em {table} com sucesso!")
+        except Exception as e:
+            print(f"Erro (pode já existir): {e}")
@@ -0,0 +1,18 @@
+"""
+Migração: versão das respostas das atividades (chave do relatório em cache)
+
+- Adiciona response_version em live_activities
+"""
+from app import create_app, db
+from sqlalchemy import text
+
+app = create_app()
+
+with app.app_context():
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE live_activities ADD COLUMN response_version INTEGER DEFAULT 0"))
+            conn.commit()
+            print("Coluna 'response_version' adicionada com sucesso!")
+    except Exception as e:
+        print(f"Erro (pode já existir): {e}")
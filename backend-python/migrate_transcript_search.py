@@ -0,0 +1,23 @@
+"""
+Migração: índice de busca textual nas transcrições
+
+- Cria a tabela transcript_search_windows (janelas sobrepostas da transcrição inteira)
+- SQLite: cria a tabela virtual FTS5 transcript_search_fts e os triggers de sincronização
+- PostgreSQL: cria a coluna tsvector gerada search_vector e o índice GIN
+Sessões e snapshots congelados de checkpoints já existentes são indexados; os novos trechos
+entram no índice a cada auto-save. Pode ser executada de novo para reconstruir o índice.
+"""
+from app import create_app, db
+from app.services.search_service import ensure_search_index, rebuild_search_index
+
+app = create_app()
+
+with app.app_context():
+    try:
+        backend = ensure_search_index()
+        print(f"Índice de busca criado/atualizado ({backend}).")
+        sessions, snapshots = rebuild_search_index()
+        print(f"Indexadas {sessions} sessões e {snapshots} snapshots de checkpoints.")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Erro ao criar índice de busca: {e}")
@@ -0,0 +1,84 @@
+"""
+Migração: transcrição em segmentos (append-only)
+
+- Cria a tabela transcript_segments
+- Adiciona transcript_length, segment_count e transcript_crc em transcription_sessions
+- Converte o texto das sessões existentes no primeiro segmento de cada sessão
+Usa SQL direto só com as colunas criadas aqui (roda em um banco com o schema original,
+antes das demais migrações de transcrição).
+"""
+import zlib
+from datetime import datetime
+from app import create_app, db
+from app.utils.compression import decompress_text
+from sqlalchemy import text
+
+BATCH_SIZE = 200
+
+SEGMENTS_DDL = """
+CREATE TABLE IF NOT EXISTS transcript_segments (
+    id {id_type},
+    session_id INTEGER NOT NULL REFERENCES transcription_sessions(id),
+    seq INTEGER NOT NULL,
+    start_offset INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created_at TIMESTAMP,
+    CONSTRAINT uq_transcript_segments_session_seq UNIQUE (session_id, seq)
+)
+"""
+
+app = create_app()
+
+with app.app_context():
+    id_type = 'SERIAL PRIMARY KEY' if db.engine.dialect.name == 'postgresql' else 'INTEGER PRIMARY KEY'
+    with db.engine.connect() as conn:
+        conn.execute(text(SEGMENTS_DDL.format(id_type=id_type)))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_transcript_segments_session_id ON transcript_segments (session_id)"
+        ))
+        conn.commit()
+    print("Tabela 'transcript_segments' verificada/criada.")
+
+    for column, ddl in (
+        ('transcript_length', 'INTEGER DEFAULT 0'),
+        ('segment_count', 'INTEGER DEFAULT 0'),
+        # Sem default: sessões existentes ficam NULL e o crc é calculado no primeiro auto-save
+        ('transcript_crc', 'BIGINT'),
+    ):
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE transcription_sessions ADD COLUMN {column} {ddl}"))
+                conn.commit()
+                print(f"Coluna '{column}' adicionada com sucesso!")
+        except Exception as e:
+            print(f"Erro (pode já existir): {e}")
+
+    seeded = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, full_transcript FROM transcription_sessions "
+            "WHERE COALESCE(segment_count, 0) = 0 AND id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+
+        if not rows:
+            break
+
+        for session_id, value in rows:
+            last_id = session_id
+            transcript = decompress_text(value) or ''
+            if not transcript:
+                continue
+            db.session.execute(text(
+                "INSERT INTO transcript_segments (session_id, seq, start_offset, text, created_at) "
+                "VALUES (:session_id, 1, 0, :text, :now)"
+            ), {'session_id': session_id, 'text': transcript, 'now': datetime.utcnow()})
+            db.session.execute(text(
+                "UPDATE transcription_sessions SET segment_count = 1, transcript_length = :length, "
+                "transcript_crc = :crc WHERE id = :id"
+            ), {'length': len(transcript), 'crc': zlib.crc32(transcript.encode('utf-8')), 'id': session_id})
+            seeded += 1
+
+        db.session.commit()
+
+    print(f"{seeded} sessões convertidas para segmentos.")
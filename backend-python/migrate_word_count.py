@@ -0,0 +1,59 @@
+"""
+Migração: contador persistido de palavras
+
+- Adiciona word_count em transcription_sessions
+- Preenche o contador das sessões existentes (uma única vez)
+Rodar depois de migrate_transcript_segments.py. Usa SQL direto: não depende das colunas
+adicionadas por migrações posteriores.
+"""
+from app import create_app, db
+from app.utils.compression import decompress_text
+from sqlalchemy import text
+
+BATCH_SIZE = 200
+
+app = create_app()
+
+
+def session_transcript(session_id, value):
+    """Texto da sessão: coluna materializada + segmentos posteriores (como TranscriptionSession.full_transcript)"""
+    materialized = decompress_text(value) or ''
+    tail = db.session.execute(text(
+        "SELECT text FROM transcript_segments WHERE session_id = :id AND start_offset >= :start ORDER BY seq"
+    ), {'id': session_id, 'start': len(materialized)}).scalars()
+    return materialized + ''.join(tail)
+
+
+with app.app_context():
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE transcription_sessions ADD COLUMN word_count INTEGER DEFAULT 0"))
+            conn.commit()
+            print("Coluna 'word_count' adicionada com sucesso!")
+    except Exception as e:
+        print(f"Erro (pode já existir): {e}")
+
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            "SELECT id, full_transcript FROM transcription_sessions "
+            "WHERE COALESCE(word_count, 0) = 0 AND id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+
+        if not rows:
+            break
+
+        for session_id, value in rows:
+            last_id = session_id
+            count = len(session_transcript(session_id, value).split())
+            if count:
+                db.session.execute(
+                    text("UPDATE transcription_sessions SET word_count = :count WHERE id = :id"),
+                    {'count': count, 'id': session_id}
+                )
+                updated += 1
+
+        db.session.commit()
+
+    print(f"{updated} sessões com contador de palavras preenchido.")
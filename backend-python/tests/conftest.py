@@ -0,0 +1,55 @@
+"""
+Fixtures dos testes: app com banco SQLite temporário (um por teste), professor e sessão de transcrição
+"""
+import os
+import tempfile
+
+# Antes de importar o app (a configuração lê o TEST_DATABASE_URL no import)
+_db_dir = tempfile.mkdtemp()
+os.environ['TEST_DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.sqlite')
+
+import pytest
+from app import create_app, db
+from app.models import User, Subject, TranscriptionSession
+from app.services import expiry_scheduler
+from app.utils.jwt_utils import generate_token
+
+
+@pytest.fixture
+def app():
+    expiry_scheduler._worker = object()  # Sem a thread do agendador de prazos nos testes
+    app = create_app('test')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def teacher(app):
+    user = User(name='Professor', email='professor@example.com', password='hash', role='teacher')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def auth_headers(teacher):
+    return {'Authorization': f'Bearer {generate_token(teacher)}'}
+
+
+@pytest.fixture
+def transcription(app, teacher):
+    subject = Subject(name='Cálculo', code='CALC1')
+    db.session.add(subject)
+    db.session.commit()
+    session = TranscriptionSession(subject_id=subject.id, teacher_id=teacher.id)
+    db.session.add(session)
+    db.session.commit()
+    return session
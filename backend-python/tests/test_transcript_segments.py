@@ -0,0 +1,142 @@
+"""
+Auto-save incremental da transcrição: /append com offset (duplicata e 409), PUT com prefixo
+conferido pelo crc32 (sufixo vira segmento; edição cai no replace_transcript), conflito de seq
+e leitura por intervalo/ETag de uma sessão compactada no end() e retomada.
+"""
+from app import db
+from app.models import TranscriptionSession, TranscriptSegment
+
+
+def _session(session_id):
+    db.session.expire_all()
+    return db.session.get(TranscriptionSession, session_id)
+
+
+def _segments(session_id):
+    return TranscriptSegment.query.filter_by(session_id=session_id).order_by(TranscriptSegment.seq).all()
+
+
+def _append(client, headers, session_id, text, offset=None):
+    body = {'text': text}
+    if offset is not None:
+        body['offset'] = offset
+    return client.post(f'/api/transcription/sessions/{session_id}/append', json=body, headers=headers)
+
+
+def _put(client, headers, session_id, text):
+    return client.put(f'/api/transcription/sessions/{session_id}', json={'full_transcript': text}, headers=headers)
+
+
+def test_append_with_offset_adds_segments(client, auth_headers, transcription):
+    first = _append(client, auth_headers, transcription.id, 'Bom dia turma. ', offset=0)
+    second = _append(client, auth_headers, transcription.id, 'Hoje: limites.', offset=15)
+
+    assert first.status_code == 200 and first.json['seq'] == 1
+    assert second.json['seq'] == 2 and second.json['start_offset'] == 15
+    session = _session(transcription.id)
+    assert session.full_transcript == 'Bom dia turma. Hoje: limites.'
+    assert session.transcript_length == 29
+    assert session.word_count == 5
+
+
+def test_append_retry_is_reported_as_duplicate(client, auth_headers, transcription):
+    _append(client, auth_headers, transcription.id, 'Bom dia turma. ', offset=0)
+    retry = _append(client, auth_headers, transcription.id, 'Bom dia turma. ', offset=0)
+
+    assert retry.status_code == 200
+    assert retry.json['duplicate'] is True
+    assert len(_segments(transcription.id)) == 1
+
+
+def test_append_with_divergent_offset_returns_409(client, auth_headers, transcription):
+    _append(client, auth_headers, transcription.id, 'Bom dia turma. ', offset=0)
+    response = _append(client, auth_headers, transcription.id, 'trecho perdido', offset=40)
+
+    assert response.status_code == 409
+    assert response.json['transcript_length'] == 15
+    assert len(_segments(transcription.id)) == 1
+
+
+def test_append_seq_conflict_returns_409(client, auth_headers, transcription):
+    _append(client, auth_headers, transcription.id, 'Bom dia. ', offset=0)
+    # Outro auto-save gravou o próximo seq depois que este leu a sessão
+    db.session.add(TranscriptSegment(session_id=transcription.id, seq=2, start_offset=9, text='x'))
+    db.session.commit()
+
+    response = _append(client, auth_headers, transcription.id, 'Hoje: limites.', offset=9)
+
+    assert response.status_code == 409
+    assert _session(transcription.id).segment_count == 1
+
+
+def test_put_with_grown_text_appends_only_the_suffix(client, auth_headers, transcription):
+    _put(client, auth_headers, transcription.id, 'Bom dia turma. ')
+    response = _put(client, auth_headers, transcription.id, 'Bom dia turma. Hoje: limites.')
+
+    assert response.status_code == 200
+    segments = _segments(transcription.id)
+    assert [(s.seq, s.start_offset, s.text) for s in segments] == [
+        (1, 0, 'Bom dia turma. '),
+        (2, 15, 'Hoje: limites.'),
+    ]
+
+
+def test_put_with_edited_prefix_falls_back_to_replace(client, auth_headers, transcription):
+    _put(client, auth_headers, transcription.id, 'Bom dia turma. ')
+    _put(client, auth_headers, transcription.id, 'Bom dia turma. Hoje: limites.')
+    response = _put(client, auth_headers, transcription.id, 'Boa tarde turma. Hoje: limites.')
+
+    assert response.status_code == 200
+    segments = _segments(transcription.id)
+    # Reescrita: um único segmento no offset 0, com o seq seguinte (os espectadores recebem reset)
+    assert [(s.seq, s.start_offset) for s in segments] == [(3, 0)]
+    session = _session(transcription.id)
+    assert session.full_transcript == 'Boa tarde turma. Hoje: limites.'
+    assert session.transcript_length == 31
+
+
+def test_put_seq_conflict_returns_409(client, auth_headers, transcription):
+    _put(client, auth_headers, transcription.id, 'Bom dia. ')
+    db.session.add(TranscriptSegment(session_id=transcription.id, seq=2, start_offset=9, text='x'))
+    db.session.commit()
+
+    response = _put(client, auth_headers, transcription.id, 'Bom dia. Hoje: limites.')
+
+    assert response.status_code == 409
+    assert _session(transcription.id).segment_count == 1
+
+
+def test_transcript_range_across_compacted_and_resumed_session(client, auth_headers, transcription):
+    session_id = transcription.id
+    _append(client, auth_headers, session_id, 'Primeira parte da aula. ', offset=0)
+    _append(client, auth_headers, session_id, 'Ainda a primeira. ', offset=24)
+    client.put(f'/api/transcription/sessions/{session_id}/end', headers=auth_headers)
+    assert _segments(session_id) == []  # Compactada: o texto ficou só em full_transcript
+
+    client.put(f'/api/transcription/sessions/{session_id}/resume', headers=auth_headers)
+    _append(client, auth_headers, session_id, 'Segunda parte. ', offset=42)
+    _append(client, auth_headers, session_id, 'Fim.', offset=57)
+
+    expected = 'Primeira parte da aula. Ainda a primeira. Segunda parte. Fim.'
+    session = _session(session_id)
+    assert session.full_transcript == expected
+    for start, end in ((0, 10), (30, 50), (42, 61), (40, 44), (0, None)):
+        assert _session(session_id).transcript_range(start, end) == expected[start:end]
+
+    response = client.get(f'/api/transcription/sessions/{session_id}/transcript?start=30&end=50', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['text'] == expected[30:50]
+    assert response.json['range'] == {'start': 30, 'end': 50}
+
+    etag = response.headers['ETag']
+    cached = client.get(
+        f'/api/transcription/sessions/{session_id}/transcript', headers={**auth_headers, 'If-None-Match': etag}
+    )
+    assert cached.status_code == 304
+
+    _append(client, auth_headers, session_id, ' Extra.', offset=61)
+    changed = client.get(
+        f'/api/transcription/sessions/{session_id}/transcript', headers={**auth_headers, 'If-None-Match': etag}
+    )
+    assert changed.status_code == 200
+    assert changed.json['text'] == expected + ' Extra.'
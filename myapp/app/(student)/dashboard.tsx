@@ -58,31 +58,45 @@ export default function StudentDashboardScreen() {
         };
     }, []);
 
-    // Polling para atividades ativas (atualiza ao focar)
+    // Long-poll por disciplina: o servidor só responde quando o estado da disciplina muda
     useFocusEffect(
         useCallback(() => {
             if (subjects.length === 0) return;
 
-            const checkActivities = async () => {
-                for (const subject of subjects) {
+            const controller = new AbortController();
+            const activities: Record<string, LiveActivity | null> = {};
+            const wait = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
+            const updateLiveActivity = () => {
+                // Primeira disciplina (na ordem da lista) com atividade ativa
+                const found = subjects.map(subject => activities[subject.id]).find(activity => activity);
+                setLiveActivity(found || null);
+            };
+
+            const watchSubject = async (subjectId: string) => {
+                let version: number | undefined;
+                while (!controller.signal.aborted) {
                     try {
-                        const result = await getActiveActivity(parseInt(subject.id));
-                        if (result.success && result.active && result.activity) {
-                            setLiveActivity(result.activity);
-                            return; // Encontrou uma atividade ativa
+                        const result = await getActiveActivity(parseInt(subjectId), version, controller.signal);
+                        if (controller.signal.aborted) return;
+                        activities[subjectId] = result.success && result.active && result.activity ? result.activity : null;
+                        updateLiveActivity();
+                        if (result.version === undefined) {
+                            await wait(5000); // Servidor sem long-poll: volta ao polling
                         }
+                        version = result.version;
                     } catch (error) {
+                        if (controller.signal.aborted) return;
                         console.error('Erro ao verificar atividade:', error);
+                        await wait(5000);
                     }
                 }
-                setLiveActivity(null);
             };
 
-            checkActivities(); // Check imediato ao focar
-            const interval = setInterval(checkActivities, 5000); // Continua polling
+            subjects.forEach(subject => watchSubject(subject.id));
 
             return () => {
-                clearInterval(interval);
+                controller.abort();
             };
         }, [subjects])
     );
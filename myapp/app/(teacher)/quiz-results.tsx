@@ -27,7 +27,7 @@ import TimeAnalysisDashboard from '@/components/quiz/TimeAnalysisDashboard';
 import QuestionDifficultyChart from '@/components/quiz/QuestionDifficultyChart';
 import ComparativeStatsPanel from '@/components/quiz/ComparativeStatsPanel';
 
-// import { useWebSocket } from '@/hooks/useWebSocket';
+import { useServerEvents } from '@/hooks/useServerEvents';
 import ConfirmationModal from '@/components/modals/ConfirmationModal';
 import { sendToPresentation, getActivePresentation } from '@/services/presentation';
 
@@ -59,24 +59,28 @@ export default function QuizResultsScreen() {
     const [presentationCode, setPresentationCode] = useState<string | null>(null);
 
 
-    // WebSocket deprecated in favor of polling
-    const isConnected = true;
-    const wsRanking = null; // Removed socket ranking logic
+    // Eventos da atividade (Server-Sent Events): cada resposta final dispara a atualização na hora
+    const [eventTick, setEventTick] = useState(0);
+    const { isConnected } = useServerEvents({
+        path: activityId > 0 ? `/transcription/activities/${activityId}/events` : null,
+        onEvent: ({ event }) => {
+            if (event === 'new_response' || event === 'activity_ended' || event === 'resync') {
+                setEventTick((tick) => tick + 1);
+            }
+        }
+    });
 
     // Log connection status
     useEffect(() => {
         console.log('[QUIZ-RESULTS] ========================================');
-        console.log('[QUIZ-RESULTS] WebSocket Status:', isConnected ? 'CONECTADO ✅' : 'DESCONECTADO ❌');
+        console.log('[QUIZ-RESULTS] Stream de eventos:', isConnected ? 'CONECTADO ✅' : 'DESCONECTADO ❌');
         console.log('[QUIZ-RESULTS] Quiz ID:', activityId > 0 ? activityId : quizId);
         console.log('[QUIZ-RESULTS] ========================================');
     }, [isConnected]);
 
-    // WebSocket ranking logic removed
-    // useEffect(() => { ... }, [wsRanking]);
-
-    // Fallback: Polling a cada 5s caso WebSocket não esteja funcionando
+    // Polling de reserva: a cada 3s sem o stream, a cada 15s com ele (os eventos atualizam na hora)
     useEffect(() => {
-        const pollingRef = setInterval(async () => {
+        const refresh = async () => {
             if (!showPodium) {
                 console.log('[FALLBACK POLLING] Buscando ranking...');
                 try {
@@ -109,10 +113,13 @@ export default function QuizResultsScreen() {
                     console.log('[FALLBACK POLLING] Erro:', error);
                 }
             }
-        }, 3000);
+        };
+
+        if (eventTick > 0) refresh();
+        const pollingRef = setInterval(refresh, isConnected ? 15000 : 3000);
 
         return () => clearInterval(pollingRef);
-    }, [quizId, activityId, showPodium]);
+    }, [quizId, activityId, showPodium, eventTick, isConnected]);
 
     // Buscar relatório inicial
     useEffect(() => {
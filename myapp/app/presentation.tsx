@@ -4,7 +4,6 @@ import { useLocalSearchParams } from 'expo-router';
 import { LinearGradient } from 'expo-linear-gradient';
 import { MaterialIcons } from '@expo/vector-icons';
 import { getPresentation, PresentationContent } from '@/services/presentation';
-// import { useWebSocket } from '@/hooks/useWebSocket';
 import { usePresentationPolling } from '@/hooks/usePresentationPolling';
 import { colors } from '@/constants/colors';
 import { typography } from '@/constants/typography';
@@ -63,7 +62,7 @@ export default function PresentationScreen() {
     // Estado de controle de vídeo
     const [videoControl, setVideoControl] = useState<{ command: 'play' | 'pause' | 'seek', value?: number, timestamp: number } | undefined>(undefined);
 
-    // WebSocket - Entrar na sala
+    // Stream de eventos + polling de reserva (usePresentationPolling)
     // Sincronizar estado com o polling
     useEffect(() => {
         if (polledContent) {
@@ -2,6 +2,8 @@ import { useState, useEffect, useRef } from 'react';
 import { getPresentation } from '@/services/presentation';
 import { PresentationContent } from '@/services/presentation';
 import { API_URL } from '@/services/api';
+import { useServerEvents } from '@/hooks/useServerEvents';
+import { RESYNC_EVENT, ServerEvent } from '@/services/events';
 
 interface UsePresentationPollingOptions {
     code: string | null;
@@ -9,6 +11,13 @@ interface UsePresentationPollingOptions {
     pollingInterval?: number;
 }
 
+// Com o stream de eventos conectado, o polling só confere de tempos em tempos
+const STREAM_POLLING_INTERVAL = 15000;
+
+/**
+ * Conteúdo da tela de apresentação: stream de eventos (/presentation/<code>/events) com polling
+ * de reserva (mais espaçado enquanto o stream estiver conectado)
+ */
 export function usePresentationPolling({ code, enabled = true, pollingInterval = 2000 }: UsePresentationPollingOptions) {
     const [content, setContent] = useState<PresentationContent | null>(null);
     const [isConnected, setIsConnected] = useState(false);
@@ -17,6 +26,37 @@ export function usePresentationPolling({ code, enabled = true, pollingInterval =
 
     // Armazenar último timestamp para evitar re-renders desnecessários
     const lastTimestampRef = useRef<string | null>(null);
+    const pollRef = useRef<() => void>(() => {});
+
+    const applyContent = (next: PresentationContent) => {
+        setContent(next);
+        lastTimestampRef.current = next.timestamp;
+
+        // Extract video control from content if present
+        if (next.video_control) {
+            setVideoControl({
+                ...next.video_control,
+                timestamp: Date.now() // Force effect trigger
+            });
+        }
+    };
+
+    const handleEvent = ({ event, data }: ServerEvent) => {
+        if (event === 'presentation_content' && data) {
+            if (data.timestamp !== lastTimestampRef.current) applyContent(data);
+        } else if (event === 'presentation_ended') {
+            setSessionActive(false);
+        } else if (event === 'presentation_clear' || event === RESYNC_EVENT) {
+            // Sem o conteúdo no evento: relê pela API
+            pollRef.current();
+        }
+    };
+
+    const { isConnected: streamConnected } = useServerEvents({
+        path: enabled && code && sessionActive ? `/presentation/${code}/events` : null,
+        onEvent: handleEvent,
+        auth: false
+    });
 
     useEffect(() => {
         if (!enabled || !code) {
@@ -43,16 +83,7 @@ export function usePresentationPolling({ code, enabled = true, pollingInterval =
                     const response = await getPresentation(code);
 
                     if (response.success && response.current_content) {
-                        setContent(response.current_content);
-                        lastTimestampRef.current = response.current_content.timestamp;
-
-                        // Extract video control from content if present
-                        if (response.current_content.video_control) {
-                            setVideoControl({
-                                ...response.current_content.video_control,
-                                timestamp: Date.now() // Force effect trigger
-                            });
-                        }
+                        applyContent(response.current_content);
                     }
                 }
             } catch (error) {
@@ -60,17 +91,19 @@ export function usePresentationPolling({ code, enabled = true, pollingInterval =
             }
         };
 
+        pollRef.current = poll;
+
         // Initial fetch
         poll();
 
         // Interval
-        const intervalId = setInterval(poll, pollingInterval);
+        const intervalId = setInterval(poll, streamConnected ? STREAM_POLLING_INTERVAL : pollingInterval);
 
         return () => {
             clearInterval(intervalId);
             setIsConnected(false);
         };
-    }, [code, enabled, pollingInterval]);
+    }, [code, enabled, pollingInterval, streamConnected]);
 
     return {
         content,
@@ -0,0 +1,44 @@
+import { useEffect, useRef, useState } from 'react';
+import { openEventStream, ServerEvent } from '@/services/events';
+
+interface UseServerEventsOptions {
+    path: string | null; // Ex: /transcription/activities/12/events (null = desligado)
+    onEvent: (event: ServerEvent) => void;
+    auth?: boolean;
+}
+
+/**
+ * Mantém um stream de Server-Sent Events aberto enquanto a tela estiver montada
+ * isConnected fica false enquanto o stream está caído: use o polling como reserva nesse tempo.
+ */
+export function useServerEvents({ path, onEvent, auth = true }: UseServerEventsOptions) {
+    const [isConnected, setIsConnected] = useState(false);
+
+    // O callback mais recente, sem reabrir o stream a cada render
+    const onEventRef = useRef(onEvent);
+    onEventRef.current = onEvent;
+
+    useEffect(() => {
+        if (!path) {
+            setIsConnected(false);
+            return;
+        }
+
+        const close = openEventStream(path, {
+            auth,
+            onOpen: () => setIsConnected(true),
+            onError: (status) => {
+                console.log('[Events] Stream caiu:', path, status);
+                setIsConnected(false);
+            },
+            onEvent: (event) => onEventRef.current(event),
+        });
+
+        return () => {
+            close();
+            setIsConnected(false);
+        };
+    }, [path, auth]);
+
+    return { isConnected };
+}
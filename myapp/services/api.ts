@@ -688,7 +688,11 @@ export const createTranscriptionSession = async (subjectId: number, title?: stri
         body: JSON.stringify({ subject_id: subjectId, title }),
     });
 
-    return response.json();
+    const data = await response.json();
+    if (data.success && data.session) {
+        rememberSyncedTranscript(data.session.id, data.session.full_transcript || '', data.session.word_count || 0);
+    }
+    return data;
 };
 
 // Obter sessão de transcrição
@@ -701,12 +705,55 @@ export const getTranscriptionSession = async (sessionId: number): Promise<{ succ
         },
     });
 
-    return response.json();
+    const data = await response.json();
+    if (data.success && data.session) {
+        rememberSyncedTranscript(data.session.id, data.session.full_transcript || '', data.session.word_count || 0);
+    }
+    return data;
+};
+
+// Último texto confirmado pelo servidor em cada sessão (auto-save incremental)
+const syncedTranscripts = new Map<number, { text: string; length: number; wordCount: number }>();
+
+// O backend conta caracteres Unicode (code points), não unidades UTF-16
+const codePointLength = (text: string) => {
+    let length = 0;
+    for (const _ of text) length++;
+    return length;
+};
+
+const rememberSyncedTranscript = (sessionId: number, text: string, wordCount: number, length?: number) => {
+    syncedTranscripts.set(sessionId, { text, length: length ?? codePointLength(text), wordCount });
 };
 
 // Atualizar transcrição (auto-save)
+// Se o texto só cresceu desde o último save confirmado, envia apenas o trecho novo (/append);
+// edições no meio do texto (ou offset divergente) regravam a transcrição inteira (PUT).
 export const updateTranscription = async (sessionId: number, fullTranscript: string): Promise<{ success: boolean; word_count: number }> => {
     const token = await AsyncStorage.getItem('authToken');
+    const synced = syncedTranscripts.get(sessionId);
+
+    if (synced && fullTranscript.startsWith(synced.text)) {
+        const suffix = fullTranscript.slice(synced.text.length);
+        if (!suffix) {
+            return { success: true, word_count: synced.wordCount };
+        }
+
+        const response = await fetch(`${API_URL}/transcription/sessions/${sessionId}/append`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${token}`,
+            },
+            body: JSON.stringify({ text: suffix, offset: synced.length }),
+        });
+        const data = await response.json();
+        if (data.success) {
+            rememberSyncedTranscript(sessionId, fullTranscript, data.word_count || 0, data.transcript_length);
+            return { success: true, word_count: data.word_count || 0 };
+        }
+        // 409 (outro save chegou antes) ou erro: cai para a regravação completa
+    }
 
     const response = await fetch(`${API_URL}/transcription/sessions/${sessionId}`, {
         method: 'PUT',
@@ -717,7 +764,13 @@ export const updateTranscription = async (sessionId: number, fullTranscript: str
         body: JSON.stringify({ full_transcript: fullTranscript }),
     });
 
-    return response.json();
+    const data = await response.json();
+    if (data.success) {
+        rememberSyncedTranscript(sessionId, fullTranscript, data.word_count || 0);
+    } else {
+        syncedTranscripts.delete(sessionId);
+    }
+    return data;
 };
 
 // Criar checkpoint
@@ -766,23 +819,50 @@ export const endTranscriptionSession = async (sessionId: number): Promise<{ succ
     return response.json();
 };
 
-// Gerar Quiz via IA
-export const generateQuiz = async (sessionId: number, numQuestions: number = 5, timeLimit?: number): Promise<{ success: boolean; activity?: LiveActivity; checkpoint?: TranscriptionCheckpoint; error?: string }> => {
+// Jobs de IA: pede o modo assíncrono e acompanha o job até terminar.
+// Se o servidor responder direto (modo síncrono), devolve a resposta como está.
+const JOB_POLL_INTERVAL_MS = 1500;
+const JOB_TIMEOUT_MS = 5 * 60 * 1000;
+
+const runJob = async (url: string, body: Record<string, any> = {}): Promise<any> => {
     const token = await AsyncStorage.getItem('authToken');
+    const headers = {
+        'Content-Type': 'application/json',
+        'Authorization': `Bearer ${token}`,
+    };
 
-    const response = await fetch(`${API_URL}/transcription/sessions/${sessionId}/generate-quiz`, {
+    const response = await fetch(url, {
         method: 'POST',
-        headers: {
-            'Content-Type': 'application/json',
-            'Authorization': `Bearer ${token}`,
-        },
-        body: JSON.stringify({
-            num_questions: numQuestions,
-            time_limit: timeLimit || numQuestions * 60  // Default: 1 minute per question
-        }),
+        headers,
+        body: JSON.stringify({ ...body, async: true }),
     });
+    const data = await response.json();
+    if (response.status !== 202 || !data.job_id) {
+        return data;
+    }
 
-    return response.json();
+    const deadline = Date.now() + JOB_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        const statusResponse = await fetch(`${API_URL}/transcription/jobs/${data.job_id}`, { headers });
+        const statusData = await statusResponse.json();
+        if (!statusData.success) {
+            return statusData;
+        }
+        const job = statusData.job;
+        if (job.status === 'done' || job.status === 'error') {
+            return job.result || { success: false, error: job.error || 'Erro ao executar job' };
+        }
+    }
+    return { success: false, error: 'Tempo esgotado aguardando a IA' };
+};
+
+// Gerar Quiz via IA
+export const generateQuiz = async (sessionId: number, numQuestions: number = 5, timeLimit?: number): Promise<{ success: boolean; activity?: LiveActivity; checkpoint?: TranscriptionCheckpoint; error?: string }> => {
+    return runJob(`${API_URL}/transcription/sessions/${sessionId}/generate-quiz`, {
+        num_questions: numQuestions,
+        time_limit: timeLimit || numQuestions * 60  // Default: 1 minute per question
+    });
 };
 
 // Salvar atividade gerada externamente
@@ -803,16 +883,7 @@ export const saveGeneratedActivity = async (sessionId: number, data: any): Promi
 
 // Gerar Resumo via IA
 export const generateSummary = async (sessionId: number): Promise<{ success: boolean; activity: LiveActivity; checkpoint: TranscriptionCheckpoint; error?: string }> => {
-    const token = await AsyncStorage.getItem('authToken');
-
-    const response = await fetch(`${API_URL}/transcription/sessions/${sessionId}/generate-summary`, {
-        method: 'POST',
-        headers: {
-            'Authorization': `Bearer ${token}`,
-        },
-    });
-
-    return response.json();
+    return runJob(`${API_URL}/transcription/sessions/${sessionId}/generate-summary`);
 };
 
 // Criar Pergunta Aberta
@@ -936,13 +1007,16 @@ export const submitQuizProgress = async (quizId: number, data: any): Promise<{ s
 
 
 // Aluno: verificar atividade ativa
-export const getActiveActivity = async (subjectId: number): Promise<{ success: boolean; active: boolean; activity?: LiveActivity; has_summary?: boolean; summary?: LiveActivity }> => {
+// Com `version` (da resposta anterior), o servidor segura a requisição até a disciplina mudar (long-poll)
+export const getActiveActivity = async (subjectId: number, version?: number, signal?: AbortSignal): Promise<{ success: boolean; active: boolean; activity?: LiveActivity; has_summary?: boolean; summary?: LiveActivity; version?: number }> => {
     const token = await AsyncStorage.getItem('authToken');
+    const query = version !== undefined ? `?version=${version}` : '';
 
-    const response = await fetch(`${API_URL}/transcription/subjects/${subjectId}/active`, {
+    const response = await fetch(`${API_URL}/transcription/subjects/${subjectId}/active${query}`, {
         headers: {
             'Authorization': `Bearer ${token}`,
         },
+        signal,
     });
 
     return response.json();
@@ -1132,17 +1206,7 @@ export const distributeActivityMaterial = async (activityId: number, file: any,
 
 // Gerar resumo de IA para reforço
 export const generateActivitySummary = async (activityId: number): Promise<{ success: boolean; summary?: string; error?: string }> => {
-    const token = await AsyncStorage.getItem('authToken');
-
-    const response = await fetch(`${API_URL}/transcription/activities/${activityId}/ai_summary`, {
-        method: 'POST',
-        headers: {
-            'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json',
-        },
-    });
-
-    return response.json();
+    return runJob(`${API_URL}/transcription/activities/${activityId}/ai_summary`);
 };
 
 // Obter materiais do aluno (Aluno)
@@ -0,0 +1,126 @@
+import AsyncStorage from '@react-native-async-storage/async-storage';
+import { API_URL } from './api';
+
+/**
+ * Cliente de Server-Sent Events (GET .../events do backend)
+ *
+ * O React Native não tem EventSource: o stream é lido por XMLHttpRequest, que entrega o texto
+ * parcial a cada onreadystatechange (readyState 3) no app e na web. Assim também dá para mandar
+ * o token no Authorization, o que o EventSource do navegador não permite.
+ *
+ * Quando a conexão cai (ou o servidor fecha o stream no timeout), reconecta depois de `retry` ms
+ * com o Last-Event-ID do último evento. Se o servidor não conseguir retomar desse id (outro
+ * worker, reinício, buffer esgotado), ele envia o evento 'resync': recarregue o estado pela API.
+ */
+
+export interface ServerEvent {
+    event: string;
+    data: any;
+    id: string | null;
+}
+
+export interface EventStreamOptions {
+    onEvent: (event: ServerEvent) => void;
+    onOpen?: () => void;
+    onError?: (status: number) => void; // status 0 = falha de rede
+    auth?: boolean; // Envia o token salvo (padrão: true)
+}
+
+export const RESYNC_EVENT = 'resync';
+const DEFAULT_RETRY_MS = 3000;
+const FATAL_STATUSES = [401, 403, 404]; // Não adianta reconectar
+
+/**
+ * Abre o stream de eventos em `path` (relativo ao API_URL) e retorna a função que o fecha
+ */
+export function openEventStream(path: string, { onEvent, onOpen, onError, auth = true }: EventStreamOptions): () => void {
+    let request: XMLHttpRequest | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
+    let lastEventId: string | null = null;
+    let retryMs = DEFAULT_RETRY_MS;
+
+    const dispatch = (block: string) => {
+        let event = 'message';
+        let id: string | null = null;
+        const data: string[] = [];
+
+        for (const line of block.split(/\r?\n/)) {
+            if (!line || line.startsWith(':')) continue; // Comentário (keep-alive)
+            const colon = line.indexOf(':');
+            const field = colon < 0 ? line : line.slice(0, colon);
+            let value = colon < 0 ? '' : line.slice(colon + 1);
+            if (value.startsWith(' ')) value = value.slice(1);
+
+            if (field === 'event') event = value;
+            else if (field === 'data') data.push(value);
+            else if (field === 'id') id = value;
+            else if (field === 'retry' && /^\d+$/.test(value)) retryMs = parseInt(value, 10);
+        }
+
+        if (id !== null) lastEventId = id;
+        if (!data.length) return;
+
+        const raw = data.join('\n');
+        let parsed: any = raw;
+        try {
+            parsed = JSON.parse(raw);
+        } catch {
+            // Evento com texto puro
+        }
+        onEvent({ event, data: parsed, id });
+    };
+
+    const connect = async () => {
+        const token = auth ? await AsyncStorage.getItem('authToken') : null;
+        if (closed) return;
+
+        const xhr = new XMLHttpRequest();
+        request = xhr;
+        let offset = 0;
+        let buffer = '';
+        let opened = false;
+
+        xhr.open('GET', `${API_URL}${path}`);
+        xhr.setRequestHeader('Accept', 'text/event-stream');
+        xhr.setRequestHeader('Cache-Control', 'no-cache');
+        if (token) xhr.setRequestHeader('Authorization', `Bearer ${token}`);
+        if (lastEventId !== null) xhr.setRequestHeader('Last-Event-ID', lastEventId);
+
+        xhr.onreadystatechange = () => {
+            if (closed || xhr.readyState < 2) return;
+
+            if (xhr.status === 200) {
+                if (!opened) {
+                    opened = true;
+                    onOpen?.();
+                }
+                // responseText acumula o stream inteiro: processa só o trecho novo
+                const text = xhr.responseText || '';
+                buffer += text.slice(offset);
+                offset = text.length;
+                const blocks = buffer.split(/\r?\n\r?\n/);
+                buffer = blocks.pop() || '';
+                blocks.forEach(dispatch);
+            }
+
+            if (xhr.readyState === 4) {
+                request = null;
+                if (xhr.status !== 200) onError?.(xhr.status);
+                if (FATAL_STATUSES.includes(xhr.status)) return;
+                retryTimer = setTimeout(connect, retryMs);
+            }
+        };
+
+        xhr.send();
+    };
+
+    connect();
+
+    return () => {
+        closed = true;
+        if (retryTimer) clearTimeout(retryTimer);
+        request?.abort();
+        request = null;
+    };
+}
@@ -220,36 +220,83 @@ export const listQuizzes = async (subjectId: number): Promise<{ success: boolean
     return response.json();
 };
 
-/**
- * Buscar ranking em tempo real do quiz (para gamificação)
- */
-export const getQuizLiveRanking = async (quizId: number): Promise<{
+export interface QuizRankingRow {
+    position: number;
+    student_id: number;
+    student_name: string;
+    points: number;
+    score: number;
+    total: number;
+    percentage: number;
+    time_taken: number;
+    submitted_at: string;
+}
+
+export interface QuizLiveRanking {
     success: boolean;
     quiz_id: number;
     quiz_status: string;
     enrolled_count: number;
     response_count: number;
-    ranking: Array<{
-        position: number;
-        student_id: number;
-        student_name: string;
-        points: number;
-        score: number;
-        total: number;
-        percentage: number;
-        time_taken: number;
-        submitted_at: string;
-    }>;
-}> => {
+    version?: number;
+    ranking: QuizRankingRow[];
+}
+
+// Último ranking recebido por quiz: as próximas chamadas pedem só as mudanças (?since=version)
+const liveRankingCache = new Map<number, { version: number; ranking: QuizRankingRow[] }>();
+
+/**
+ * Buscar ranking em tempo real do quiz (para gamificação)
+ * O servidor envia o ranking completo na primeira chamada e depois só as linhas que mudaram;
+ * o resultado é sempre o ranking completo, já mesclado.
+ */
+export const getQuizLiveRanking = async (quizId: number): Promise<QuizLiveRanking> => {
     const token = await AsyncStorage.getItem('authToken');
+    const cached = liveRankingCache.get(quizId);
+    const query = cached ? `?since=${cached.version}` : '';
 
-    const response = await fetch(`${API_URL}/quiz/${quizId}/live-ranking`, {
+    const response = await fetch(`${API_URL}/quiz/${quizId}/live-ranking${query}`, {
         headers: {
             'Authorization': `Bearer ${token}`,
         },
     });
 
-    return response.json();
+    const data = await response.json();
+    if (!data.success) {
+        return data;
+    }
+
+    let ranking: QuizRankingRow[];
+    if (data.full || !cached) {
+        ranking = data.ranking || [];
+    } else {
+        const rows = new Map(cached.ranking.map((row) => [row.student_id, row]));
+        for (const row of data.changes || []) {
+            rows.set(row.student_id, row);
+        }
+        for (const [studentId, position] of data.moved || []) {
+            const row = rows.get(studentId);
+            if (row) rows.set(studentId, { ...row, position });
+        }
+        for (const studentId of data.removed || []) {
+            rows.delete(studentId);
+        }
+        ranking = Array.from(rows.values()).sort((a, b) => a.position - b.position);
+    }
+
+    if (data.version !== undefined) {
+        liveRankingCache.set(quizId, { version: data.version, ranking });
+    }
+
+    return {
+        success: true,
+        quiz_id: data.quiz_id,
+        quiz_status: data.quiz_status,
+        enrolled_count: data.enrolled_count,
+        response_count: data.response_count,
+        version: data.version,
+        ranking,
+    };
 };
 
 /**